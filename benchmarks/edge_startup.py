@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Cold start of the headless edge collector (collector/edge.py): each run is
+# a fresh interpreter that imports edge.py, builds the daemon and adds a
+# client, and reports
+#
+#   import_ms  importing edge.py and everything it pulls in
+#   ready_ms   from interpreter start to a daemon with its client added
+#   rss_mb     peak resident set size
+#
+# and whether any module the edge profile must not load was imported.
+# Exits with 1 when the median misses a budget or such a module shows up, so
+# it can gate CI:
+#
+#   PYTHONPATH=collector/src/core/src:collector/src/builtins/src:collector/src/daemon/src \
+#   python benchmarks/edge_startup.py --runs 5
+#
+# The default budgets leave headroom over the medians measured on one core
+# (ready_ms 566, rss_mb 66.7) for slower CI machines
+
+FORBIDDEN = ["pandas", "streamlit", "sqlalchemy", "fastapi", "uvicorn"]
+
+parser = argparse.ArgumentParser(description="Edge collector cold start benchmark")
+parser.add_argument("--runs", type=int, default=10)
+parser.add_argument("--budget-ms", type=float, default=1200, help="ready_ms budget")
+parser.add_argument("--budget-mb", type=float, default=100, help="rss_mb budget")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = f"""
+import asyncio, json, resource, sys, time
+
+started = time.perf_counter()
+import edge
+imported = time.perf_counter()
+
+from collector_daemon import CollectorDaemon
+
+async def ready():
+    daemon = CollectorDaemon(compression=edge.compression_from_env())
+    definition = edge._definitions_adapter.validate_python(
+        [{{"dev_id": 1, "sensors": [{{"name": "t", "kind": "gauss"}}]}}]
+    )[0]
+    await daemon.add_client(definition.to_client())
+
+asyncio.run(ready())
+done = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1e3,
+    "ready_ms": (done - started) * 1e3,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "forbidden": [name for name in {FORBIDDEN!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_once(cwd: str) -> dict:
+    env = dict(os.environ)
+    # The child runs elsewhere, relative entries would no longer resolve
+    paths = [ROOT / "collector", *env.get("PYTHONPATH", "").split(os.pathsep)]
+    env["PYTHONPATH"] = os.pathsep.join(
+        os.path.abspath(path) for path in paths if str(path)
+    )
+    # Cached machine details, as on every start after the first
+    env["COLLECTOR_MACHINE_FILE"] = os.path.join(cwd, "machine.json")
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1e3
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cwd:
+        # Warm up the page cache and write the fingerprint
+        run_once(cwd)
+        runs = [run_once(cwd) for _ in range(args.runs)]
+
+    result = {
+        key: float(np.median([run[key] for run in runs]))
+        for key in ("import_ms", "ready_ms", "process_ms", "rss_mb")
+    }
+    forbidden = sorted({name for run in runs for name in run["forbidden"]})
+    failures = []
+    if result["ready_ms"] > args.budget_ms:
+        failures.append(f"ready_ms {result['ready_ms']:.0f} > {args.budget_ms:.0f}")
+    if result["rss_mb"] > args.budget_mb:
+        failures.append(f"rss_mb {result['rss_mb']:.1f} > {args.budget_mb:.1f}")
+    if forbidden:
+        failures.append(f"imported {', '.join(forbidden)}")
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "result": result,
+        "forbidden": forbidden,
+        "failures": failures,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from collector_builtins.client.STM32 import STM32_RealClient
+from collector_core.client import BulkReading
+from collector_core.mcu import MCU
+
+# STM32_RealClient against the pty emulator (a separate process), one mode
+# at a time:
+#
+#   per-sensor  one READ per sensor, one request on the wire
+#   pipelined   one READ per sensor, all of a cycle's requests in flight
+#   bulk        one READ frame for all sensors
+#   stream      the MCU pushes a frame with all sensors every --stream-interval
+#
+#   PYTHONPATH=collector/src/core/src:collector/src/builtins/src \
+#   python benchmarks/serial_protocol.py --sensors 16
+#
+# Latency is the sample's age when the client hands it over, i.e. now minus
+# its (clock-mapped) device timestamp.
+
+MODES = ["per-sensor", "pipelined", "bulk", "stream"]
+
+parser = argparse.ArgumentParser(description="Serial protocol benchmark")
+parser.add_argument("--sensors", type=int, default=16)
+parser.add_argument("--duration", type=float, default=5)
+parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+parser.add_argument("--stream-interval", type=float, default=0.001)
+parser.add_argument("--conversion-time", type=float, default=0.00002)
+parser.add_argument("--usb-frame", type=float, default=0.001)
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def start_emulator() -> tuple[subprocess.Popen, str]:
+    emulator = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "collector_builtins.client.STM32.emulator",
+            "--sensors",
+            str(args.sensors),
+            "--conversion-time",
+            str(args.conversion_time),
+            "--usb-frame",
+            str(args.usb_frame),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return emulator, emulator.stdout.readline().strip()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = 0
+        self.ages: list[float] = []
+
+    def add(self, reading: BulkReading):
+        self.samples += len(reading.values)
+        self.ages.append(time.time() - reading.timestamp)
+
+    def result(self, elapsed: float) -> dict:
+        ages = np.array(self.ages) * 1e3
+        return {
+            "samples_per_second": self.samples / elapsed,
+            "frames_per_second": len(ages) / elapsed,
+            "latency_ms": {
+                "p50": float(np.percentile(ages, 50)),
+                "p99": float(np.percentile(ages, 99)),
+                "max": float(ages.max()),
+            },
+        }
+
+
+async def measure(client: STM32_RealClient, mode: str, names: list[str]) -> dict:
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    if mode == "stream":
+        async for reading in client.stream(names, args.stream_interval):
+            recorder.add(reading)
+            if time.perf_counter() >= deadline:
+                break
+    while mode != "stream" and time.perf_counter() < deadline:
+        if mode == "per-sensor":
+            for name in names:
+                recorder.add(await client.get_sensors_data([name]))
+        elif mode == "pipelined":
+            readings = await asyncio.gather(
+                *(client.get_sensors_data([name]) for name in names)
+            )
+            for reading in readings:
+                recorder.add(reading)
+        else:
+            recorder.add(await client.get_sensors_data(names))
+    result = recorder.result(time.perf_counter() - started)
+    if mode == "stream":
+        result["dropped"] = client.sample_drops
+    return result
+
+
+async def run(port: str) -> dict:
+    client = STM32_RealClient(
+        mcu=MCU(name="bench", description="", type=MCU.MCU_Type.REAL, dev_id=1),
+        port=port,
+        max_in_flight=min(max(args.sensors, 1), 255),
+    )
+    try:
+        names = await client.get_list_of_sensors_names()
+        # Settle the device clock mapping before measuring
+        for _ in range(20):
+            await client.get_sensors_data(names)
+        return {mode: await measure(client, mode, names) for mode in args.modes}
+    finally:
+        await client.close()
+
+
+def main():
+    emulator, port = start_emulator()
+    try:
+        result = asyncio.run(run(port))
+    finally:
+        emulator.terminate()
+        emulator.wait()
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "result": result,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
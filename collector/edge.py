@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+
+from collector_builtins.definitions import ClientDefinition
+from collector_daemon import CollectorDaemon, ShardedCollector, compression_from_env
+from collector_daemon.daemon import run
+from collector_daemon.logger import log_info
+from pydantic import TypeAdapter
+
+# Headless collector for small edge boxes: the daemon on its own, without the
+# HTTP API of main.py or the dashboard, so neither extra has to be installed.
+#
+#   python edge.py --clients clients.json
+#
+# clients.json is a list of the client definitions POST /clients takes.
+# REPLAY_DATASET, COLLECTOR_WORKERS and COMPRESSION_* work as in main.py.
+
+REPLAY_DATASET = os.getenv("REPLAY_DATASET")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", 1.0))
+
+_definitions_adapter = TypeAdapter(list[ClientDefinition])
+
+
+def load_definitions(path: str) -> list[ClientDefinition]:
+    with open(path) as f:
+        return _definitions_adapter.validate_python(json.load(f))
+
+
+async def serve(definitions: list[ClientDefinition], workers: int):
+    compression = compression_from_env()
+    if workers > 1:
+        daemon = ShardedCollector(workers=workers, compression=compression)
+    else:
+        daemon = CollectorDaemon(compression=compression)
+    for definition in definitions:
+        for sensor in definition.sensors:
+            if sensor.interval is not None:
+                daemon.set_interval(definition.dev_id, sensor.name, sensor.interval)
+        await daemon.add_client(definition.to_client())
+    if REPLAY_DATASET:
+        # Only loaded when asked for, it is a good part of the import time
+        from collector_builtins.client.replay import load_replay_clients
+
+        for client in load_replay_clients(REPLAY_DATASET, speed=REPLAY_SPEED):
+            await daemon.add_client(client)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    daemon.start()
+    log_info(f"Edge collector running with {len(daemon.clients)} client(s)")
+    try:
+        await stopping.wait()
+    finally:
+        await daemon.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless edge collector")
+    parser.add_argument(
+        "--clients",
+        default=os.getenv("COLLECTOR_CLIENTS"),
+        help="JSON file with client definitions (default: $COLLECTOR_CLIENTS)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("COLLECTOR_WORKERS", 1))
+    )
+    args = parser.parse_args()
+    if not args.clients and not REPLAY_DATASET:
+        parser.error("nothing to collect: pass --clients or set REPLAY_DATASET")
+    definitions = load_definitions(args.clients) if args.clients else []
+    run(serve(definitions, args.workers))
+
+
+if __name__ == "__main__":
+    main()
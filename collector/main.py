@@ -1,20 +1,50 @@
-import threading
+import os
 from contextlib import asynccontextmanager
+from typing import Optional
 
+from collector_builtins.client.replay import load_replay_clients
 from collector_builtins.client.STM32 import STM32_FakeClient
+from collector_builtins.definitions import ClientDefinition, SensorDefinition
 from collector_builtins.sensor import GaussDistributedSensor, SeasonalSensor
+from collector_core.db import init_db
 from collector_core.mcu import MCU
-from collector_daemon import CollectorDaemon
-from fastapi import FastAPI
+from collector_daemon import (
+    CollectorDaemon,
+    CompressionMode,
+    CompressionPolicy,
+    ShardedCollector,
+    compression_from_env,
+)
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from sensors.metrics import REGISTRY
 
-daemon = CollectorDaemon()
+# Directory produced by collector_builtins.client.replay.convert
+REPLAY_DATASET = os.getenv("REPLAY_DATASET")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", 1.0))
+# More than one worker runs the sharded collector, one poller process each
+COLLECTOR_WORKERS = int(os.getenv("COLLECTOR_WORKERS", 1))
+# Default edge compression from COMPRESSION_* (see compression_from_env), per
+# sensor policies are set through the API
+compression = compression_from_env()
+if COLLECTOR_WORKERS > 1:
+    daemon = ShardedCollector(workers=COLLECTOR_WORKERS, compression=compression)
+else:
+    daemon = CollectorDaemon(compression=compression)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    daemon.clients.append(
+    init_db()
+    # The daemon runs on the app's own loop (uvloop when uvicorn runs with
+    # --loop uvloop or auto and it is installed)
+    await daemon.add_client(
         STM32_FakeClient(
             mcu=MCU(
+                name="302",
+                description="",
+                type=MCU.MCU_Type.FAKE,
                 connection_type=MCU.MCU_ConnectionType.USB,
                 is_connected=True,
                 dev_id=302,
@@ -25,25 +55,152 @@ async def lifespan(app: FastAPI):
             ],
         )
     )
-    thread = threading.Thread(target=daemon.main_thread, daemon=True)
-    thread.start()
-    print("Daemon thread started")
-
+    if REPLAY_DATASET:
+        for client in load_replay_clients(REPLAY_DATASET, speed=REPLAY_SPEED):
+            await daemon.add_client(client)
+    daemon.start()
     try:
-        yield  # app runs here
+        yield
     finally:
-        # Thread is daemon=True, it will stop automatically when app exits
-        print("Shutting down...")
+        await daemon.stop()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+class IntervalUpdate(BaseModel):
+    interval: float = Field(gt=0)
+
+
+class CompressionUpdate(BaseModel):
+    # No mode sends every reading
+    mode: Optional[CompressionMode] = None
+    deviation: float = Field(default=0.0, ge=0)
+    max_interval: float = Field(default=60.0, gt=0)
+    exception_deviation: Optional[float] = Field(default=None, ge=0)
+
+
+def _describe(dev_id: int) -> dict:
+    client = daemon.get_client(dev_id)
+    return {
+        "dev_id": dev_id,
+        "name": client.mcu.name,
+        "type": client.mcu.type.value,
+        "client": type(client).__name__,
+        "sensors": sorted(daemon.sensor_names(dev_id)),
+    }
+
+
+def _check_sensor(dev_id: int, sensor_name: str):
+    try:
+        daemon.get_client(dev_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such client")
+    if sensor_name not in daemon.sensor_names(dev_id):
+        raise HTTPException(status_code=404, detail="No such sensor")
+
+
 @app.get("/ping")
 def read_root():
     return {"message": "pong"}
 
 
-@app.post("/add_mcu")
-def add_mcu():
-    daemon.add_mcu()
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/clients")
+def list_clients():
+    return [_describe(client.mcu.dev_id) for client in daemon.clients]
+
+
+@app.post("/clients", status_code=201)
+async def add_client(definition: ClientDefinition):
+    if any(client.mcu.dev_id == definition.dev_id for client in daemon.clients):
+        raise HTTPException(status_code=409, detail="Client is already collected")
+    try:
+        client = definition.to_client()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    for sensor in definition.sensors:
+        if sensor.interval is not None:
+            daemon.set_interval(definition.dev_id, sensor.name, sensor.interval)
+    try:
+        await daemon.add_client(client)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _describe(definition.dev_id)
+
+
+@app.delete("/clients/{dev_id}")
+async def remove_client(dev_id: int):
+    try:
+        await daemon.remove_client(dev_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such client")
+    return {"dev_id": dev_id}
+
+
+@app.post("/clients/{dev_id}/sensors", status_code=201)
+async def add_sensor(dev_id: int, definition: SensorDefinition):
+    try:
+        sensor = definition.to_sensor()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        await daemon.add_sensor(
+            dev_id, definition.name, sensor=sensor, interval=definition.interval
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such client")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _describe(dev_id)
+
+
+@app.put("/clients/{dev_id}/sensors/{sensor_name}")
+def set_interval(dev_id: int, sensor_name: str, update: IntervalUpdate):
+    _check_sensor(dev_id, sensor_name)
+    daemon.set_interval(dev_id, sensor_name, update.interval)
+    return {"dev_id": dev_id, "sensor": sensor_name, "interval": update.interval}
+
+
+@app.delete("/clients/{dev_id}/sensors/{sensor_name}")
+async def remove_sensor(dev_id: int, sensor_name: str):
+    _check_sensor(dev_id, sensor_name)
+    await daemon.remove_sensor(dev_id, sensor_name)
+    return _describe(dev_id)
+
+
+@app.put("/clients/{dev_id}/sensors/{sensor_name}/compression")
+async def set_compression(dev_id: int, sensor_name: str, update: CompressionUpdate):
+    policy = None
+    if update.mode is not None:
+        policy = CompressionPolicy(
+            mode=update.mode,
+            deviation=update.deviation,
+            max_interval=update.max_interval,
+            exception_deviation=update.exception_deviation,
+        )
+    try:
+        await daemon.set_compression(dev_id, sensor_name, policy)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such client")
+    return {"dev_id": dev_id, "sensor": sensor_name, **update.model_dump(mode="json")}
+
+
+@app.get("/compression")
+def compression_stats():
+    return [
+        {
+            "dev_id": dev_id,
+            "sensor": sensor_name,
+            "received": stats.received,
+            "sent": stats.sent,
+            "ratio": stats.ratio,
+            "max_error": stats.max_error,
+            "mean_error": stats.mean_error,
+        }
+        for (dev_id, sensor_name), stats in sorted(daemon.compression_stats().items())
+    ]
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import tty
+from dataclasses import dataclass, field
+from typing import Optional
+
+from collector_core.sensor import SensorBase
+
+from collector_builtins.client.STM32.protocol import (
+    ErrorCode,
+    Frame,
+    FrameDecoder,
+    FrameType,
+    ProtocolError,
+    decode_ids,
+    decode_stream_start,
+    encode_error,
+    encode_frame,
+    encode_reading,
+    encode_sensor_list,
+)
+from collector_builtins.sensor import (
+    ConstantSensor,
+    CosineSensor,
+    GaussDistributedSensor,
+    SeasonalSensor,
+)
+
+# Emulates an STM32 speaking the framed protocol on a pseudo-terminal, so
+# STM32_RealClient can be exercised without hardware:
+#
+#   python -m collector_builtins.client.STM32.emulator --sensors 16
+#
+# Timing is modelled rather than slept: the MCU handles one request at a
+# time and spends conversion_time per sensor, and USB full-speed CDC only
+# moves data at 1 ms frame boundaries.
+
+
+@dataclass
+class MCUEmulator:
+    sensors: list[SensorBase]
+    info: str = "STM32 emulator"
+    conversion_time: float = 0.00002
+    usb_frame: float = 0.001
+
+    path: str = field(default="", init=False)
+    frames_in: int = field(default=0, init=False)
+    frames_out: int = field(default=0, init=False)
+
+    _master: int = field(default=-1, init=False, repr=False)
+    _slave: int = field(default=-1, init=False, repr=False)
+    _started: float = field(default_factory=time.monotonic, init=False, repr=False)
+    _busy_until: float = field(default=0.0, init=False, repr=False)
+    _outgoing: list = field(default_factory=list, init=False, repr=False)
+    _counter: itertools.count = field(
+        default_factory=itertools.count, init=False, repr=False
+    )
+    _unsent: bytearray = field(default_factory=bytearray, init=False, repr=False)
+    _stream: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    def open(self) -> str:
+        self._master, self._slave = os.openpty()
+        # The slave end stays open here as well, so the master does not see
+        # EIO between client connections
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.path = os.ttyname(self._slave)
+        return self.path
+
+    def close(self):
+        for fd in (self._master, self._slave):
+            if fd >= 0:
+                os.close(fd)
+        self._master = self._slave = -1
+
+    def _device_time_us(self, moment: float) -> int:
+        return int((moment - self._started) * 1e6)
+
+    async def serve(self):
+        if self._master < 0:
+            self.open()
+        loop = asyncio.get_running_loop()
+        master = self._master
+        decoder = FrameDecoder()
+        ready = asyncio.Event()
+        loop.add_reader(master, ready.set)
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                try:
+                    data = os.read(master, 65536)
+                except BlockingIOError:
+                    continue
+                for frame in decoder.feed(data):
+                    self.frames_in += 1
+                    self._handle(frame)
+        finally:
+            loop.remove_reader(master)
+            flusher.cancel()
+            if self._stream is not None:
+                self._stream.cancel()
+
+    def _handle(self, frame: Frame):
+        now = time.monotonic()
+        try:
+            reply_type, payload, work = self._dispatch(frame, now)
+        except (ProtocolError, IndexError, ValueError) as e:
+            reply_type, payload, work = (
+                FrameType.ERROR,
+                encode_error(ErrorCode.BAD_FRAME, str(e)),
+                0.0,
+            )
+        # One request at a time: a pipelined request waits for the previous
+        self._busy_until = max(self._busy_until, now) + work
+        self._emit(self._busy_until, encode_frame(reply_type, frame.seq, payload))
+
+    def _dispatch(self, frame: Frame, now: float) -> tuple[int, bytes, float]:
+        kind = frame.type
+        if kind == FrameType.PING:
+            return FrameType.PONG, b"", 0.0
+        if kind == FrameType.INFO:
+            return FrameType.INFO_REPLY, self.info.encode(), 0.0
+        if kind == FrameType.LIST:
+            names = [sensor.name for sensor in self.sensors]
+            return FrameType.LIST_REPLY, encode_sensor_list(names), 0.0
+        if kind == FrameType.READ:
+            ids = decode_ids(frame.payload)
+            if any(i >= len(self.sensors) for i in ids):
+                return (
+                    FrameType.ERROR,
+                    encode_error(ErrorCode.UNKNOWN_SENSOR),
+                    0.0,
+                )
+            work = self.conversion_time * len(ids)
+            moment = max(self._busy_until, now) + work
+            return FrameType.READING, self._reading(ids, moment), work
+        if kind == FrameType.STREAM_START:
+            period_us, ids = decode_stream_start(frame.payload)
+            if any(i >= len(self.sensors) for i in ids) or period_us <= 0:
+                return FrameType.ERROR, encode_error(ErrorCode.UNKNOWN_SENSOR), 0.0
+            if self._stream is not None:
+                self._stream.cancel()
+            self._stream = asyncio.create_task(self._run_stream(period_us / 1e6, ids))
+            return FrameType.ACK, b"", 0.0
+        if kind == FrameType.STREAM_STOP:
+            if self._stream is not None:
+                self._stream.cancel()
+                self._stream = None
+            return FrameType.ACK, b"", 0.0
+        return FrameType.ERROR, encode_error(ErrorCode.UNKNOWN_TYPE), 0.0
+
+    def _reading(self, ids: list[int], moment: float) -> bytes:
+        values = [self.sensors[i].read() for i in ids]
+        return encode_reading(self._device_time_us(moment), ids, values)
+
+    async def _run_stream(self, period: float, ids: list[int]):
+        # Samples are taken on the device clock and pushed without a request
+        deadline = time.monotonic()
+        while True:
+            now = time.monotonic()
+            while deadline <= now:
+                self._busy_until = max(self._busy_until, deadline)
+                self._busy_until += self.conversion_time * len(ids)
+                payload = self._reading(ids, deadline)
+                self._emit(self._busy_until, encode_frame(FrameType.SAMPLE, 0, payload))
+                deadline += period
+            await asyncio.sleep(deadline - now)
+
+    def _emit(self, due: float, data: bytes):
+        heapq.heappush(self._outgoing, (due, next(self._counter), data))
+        if self.usb_frame <= 0:
+            self._flush(time.monotonic())
+
+    def _flush(self, now: float):
+        outgoing = self._outgoing
+        while outgoing and outgoing[0][0] <= now:
+            self._unsent += heapq.heappop(outgoing)[2]
+            self.frames_out += 1
+        if self._unsent:
+            try:
+                written = os.write(self._master, self._unsent)
+            except BlockingIOError:
+                written = 0
+            del self._unsent[:written]
+
+    async def _flush_loop(self):
+        frame = self.usb_frame if self.usb_frame > 0 else 0.001
+        while True:
+            # Replies leave on USB frame boundaries
+            now = time.monotonic()
+            await asyncio.sleep(frame - (now - self._started) % frame)
+            self._flush(time.monotonic())
+
+
+SENSOR_KINDS = {
+    "constant": ConstantSensor,
+    "cosine": CosineSensor,
+    "gauss": GaussDistributedSensor,
+    "seasonal": SeasonalSensor,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STM32 emulator on a pty")
+    parser.add_argument("--sensors", type=int, default=8)
+    parser.add_argument("--kind", choices=sorted(SENSOR_KINDS), default="seasonal")
+    parser.add_argument("--conversion-time", type=float, default=0.00002)
+    parser.add_argument("--usb-frame", type=float, default=0.001)
+    args = parser.parse_args()
+
+    sensor = SENSOR_KINDS[args.kind]
+    emulator = MCUEmulator(
+        sensors=[sensor(name=f"{args.kind}{i}") for i in range(args.sensors)],
+        conversion_time=args.conversion_time,
+        usb_frame=args.usb_frame,
+    )
+    print(emulator.open(), flush=True)
+    try:
+        asyncio.run(emulator.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+
+
+if __name__ == "__main__":
+    main()
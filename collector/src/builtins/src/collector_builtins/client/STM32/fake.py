@@ -1,7 +1,8 @@
+import time
 from dataclasses import dataclass, field
 from typing import Optional
 
-from collector_core.client import AsyncClientBase
+from collector_core.client import AsyncClientBase, BulkReading
 from collector_core.sensor import SensorBase
 
 
@@ -9,6 +10,11 @@ from collector_core.sensor import SensorBase
 class STM32_FakeClient(AsyncClientBase):
     sensors: list = field(default_factory=list)
 
+    _index: dict[str, SensorBase] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self._index = {sensor.name: sensor for sensor in self.sensors}
+
     async def get_heartbeat(self) -> bool:
         return True
 
@@ -19,13 +25,29 @@ class STM32_FakeClient(AsyncClientBase):
         return [sensor.name for sensor in self.sensors]
 
     async def get_sensor_data(self, sensor_name: str) -> float:
-        for sensor in self.sensors:
-            if sensor.name == sensor_name:
-                return sensor.read()
-        return 0.0
+        sensor = self._index.get(sensor_name)
+        if sensor is None:
+            return 0.0
+        return sensor.read()
+
+    async def get_sensors_data(self, sensor_names: list[str]) -> BulkReading:
+        index = self._index
+        values = {
+            name: index[name].read() if name in index else 0.0 for name in sensor_names
+        }
+        return BulkReading(values=values, timestamp=time.time())
 
     # Fake specific settings
     def add_sensor(self, sensor: SensorBase) -> Optional[str]:
-        if all(sensor.name not in self.sensors for sensor in self.sensors):
-            self.sensors.append(sensor)
-        return f"There is a sensor with the same name: {sensor.name}"
+        if sensor.name in self._index:
+            return f"There is a sensor with the same name: {sensor.name}"
+        self.sensors.append(sensor)
+        self._index[sensor.name] = sensor
+        return None
+
+    def remove_sensor(self, sensor_name: str) -> Optional[str]:
+        sensor = self._index.pop(sensor_name, None)
+        if sensor is None:
+            return f"There is no sensor named {sensor_name}"
+        self.sensors.remove(sensor)
+        return None
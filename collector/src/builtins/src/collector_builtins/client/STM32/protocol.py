@@ -0,0 +1,226 @@
+import struct
+from binascii import crc_hqx
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Optional
+
+import numpy as np
+
+# Binary framing shared by STM32_RealClient and the MCU emulator, see
+# mcu/PROTOCOL.md. All integers are little endian.
+#
+#   0xA5 | type u8 | seq u8 | length u16 | payload | crc u16
+#
+# The CRC is CRC-16/CCITT-FALSE over type..payload. The host numbers its
+# requests with seq and the MCU echoes it, so requests can be pipelined and
+# matched out of order. Pushed samples carry seq 0.
+
+SYNC = 0xA5
+# Largest payload either side sends. The length field could say 64 KiB, but
+# a header claiming more than this is taken for garbage, so a stray sync byte
+# cannot make the decoder wait for a frame that never comes.
+MAX_PAYLOAD = 4096
+
+_HEADER = struct.Struct("<BBBH")
+_BODY_HEADER = struct.Struct("<BBH")
+_CRC = struct.Struct("<H")
+_TIME_COUNT = struct.Struct("<IB")
+_STREAM_START = struct.Struct("<IB")
+
+# One reading entry: sensor id and float32 value
+READING_DTYPE = np.dtype([("id", "u1"), ("value", "<f4")])
+
+
+class FrameType(IntEnum):
+    PING = 0x01
+    INFO = 0x02
+    LIST = 0x03
+    READ = 0x04
+    STREAM_START = 0x05
+    STREAM_STOP = 0x06
+
+    PONG = 0x81
+    INFO_REPLY = 0x82
+    LIST_REPLY = 0x83
+    READING = 0x84
+    ACK = 0x85
+    SAMPLE = 0x86
+    ERROR = 0xFF
+
+
+class ErrorCode(IntEnum):
+    BAD_FRAME = 1
+    UNKNOWN_TYPE = 2
+    UNKNOWN_SENSOR = 3
+    BUSY = 4
+
+
+class ProtocolError(Exception):
+    pass
+
+
+@dataclass
+class Frame:
+    type: int
+    seq: int
+    payload: bytes
+
+
+def encode_frame(frame_type: int, seq: int, payload: bytes = b"") -> bytes:
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {len(payload)} bytes does not fit a frame")
+    body = _BODY_HEADER.pack(frame_type, seq, len(payload)) + payload
+    return bytes((SYNC,)) + body + _CRC.pack(crc_hqx(body, 0xFFFF))
+
+
+class FrameDecoder:
+    # Incremental decoder: feed it whatever the port returned. Garbage and
+    # frames with a bad CRC are skipped by hunting for the next sync byte.
+    def __init__(self):
+        self._buffer = bytearray()
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> list[Frame]:
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        while True:
+            found = buffer.find(SYNC, start)
+            if found < 0:
+                self.dropped += len(buffer) - start
+                buffer.clear()
+                break
+            self.dropped += found - start
+            start = found
+            end = _frame_end(buffer, start)
+            if end is None:
+                # Incomplete so far. A header that came from garbage can
+                # announce any length, so a complete frame further on means
+                # this was not a frame after all.
+                later = _next_frame(buffer, start + 1)
+                if later is None:
+                    break
+                self.dropped += later - start
+                start = later
+                continue
+            if end < 0:
+                self.dropped += 1
+                start += 1
+                continue
+            frames.append(
+                Frame(
+                    buffer[start + 1],
+                    buffer[start + 2],
+                    bytes(buffer[start + 5 : end - _CRC.size]),
+                )
+            )
+            start = end
+        if start > 0:
+            del buffer[:start]
+        return frames
+
+
+def _frame_end(buffer: bytearray, start: int) -> Optional[int]:
+    # End of the frame starting at start, None while it is incomplete, -1 if
+    # it is not a frame
+    if len(buffer) - start < _HEADER.size:
+        return None
+    _, _, _, length = _HEADER.unpack_from(buffer, start)
+    if length > MAX_PAYLOAD:
+        return -1
+    end = start + _HEADER.size + length
+    if len(buffer) < end + _CRC.size:
+        return None
+    (crc,) = _CRC.unpack_from(buffer, end)
+    if crc != crc_hqx(buffer[start + 1 : end], 0xFFFF):
+        return -1
+    return end + _CRC.size
+
+
+def _next_frame(buffer: bytearray, start: int) -> Optional[int]:
+    while (start := buffer.find(SYNC, start)) >= 0:
+        end = _frame_end(buffer, start)
+        if end is not None and end > 0:
+            return start
+        start += 1
+    return None
+
+
+def encode_ids(ids: list[int]) -> bytes:
+    return bytes((len(ids), *ids))
+
+
+def decode_ids(payload: bytes) -> list[int]:
+    if not payload or len(payload) != payload[0] + 1:
+        raise ProtocolError("Malformed sensor id list")
+    return list(payload[1:])
+
+
+def encode_sensor_list(names: list[str]) -> bytes:
+    # Sensor ids are positions in this list
+    parts = [bytes((len(names),))]
+    for name in names:
+        raw = name.encode()
+        parts.append(bytes((len(raw),)) + raw)
+    return b"".join(parts)
+
+
+def decode_sensor_list(payload: bytes) -> list[str]:
+    names = []
+    try:
+        count, offset = payload[0], 1
+        for _ in range(count):
+            size = payload[offset]
+            names.append(payload[offset + 1 : offset + 1 + size].decode())
+            offset += 1 + size
+    except (IndexError, UnicodeDecodeError):
+        raise ProtocolError("Malformed sensor list") from None
+    if offset != len(payload):
+        raise ProtocolError("Malformed sensor list")
+    return names
+
+
+def encode_reading(device_time_us: int, ids: list[int], values) -> bytes:
+    entries = np.empty(len(ids), READING_DTYPE)
+    entries["id"] = ids
+    entries["value"] = values
+    return _TIME_COUNT.pack(device_time_us & 0xFFFFFFFF, len(ids)) + entries.tobytes()
+
+
+def decode_reading(payload: bytes) -> tuple[int, np.ndarray]:
+    # Returns the device clock in microseconds (wrapping u32) and the
+    # (id, value) entries
+    if len(payload) < _TIME_COUNT.size:
+        raise ProtocolError("Malformed reading")
+    device_time_us, count = _TIME_COUNT.unpack_from(payload)
+    if len(payload) != _TIME_COUNT.size + count * READING_DTYPE.itemsize:
+        raise ProtocolError("Malformed reading")
+    return device_time_us, np.frombuffer(
+        payload, READING_DTYPE, count, _TIME_COUNT.size
+    )
+
+
+def encode_stream_start(period_us: int, ids: list[int]) -> bytes:
+    return _STREAM_START.pack(period_us, len(ids)) + bytes(ids)
+
+
+def decode_stream_start(payload: bytes) -> tuple[int, list[int]]:
+    if len(payload) < _STREAM_START.size:
+        raise ProtocolError("Malformed stream request")
+    period_us, count = _STREAM_START.unpack_from(payload)
+    ids = list(payload[_STREAM_START.size :])
+    if len(ids) != count:
+        raise ProtocolError("Malformed stream request")
+    return period_us, ids
+
+
+def encode_error(code: ErrorCode, message: str = "") -> bytes:
+    return bytes((code,)) + message.encode()
+
+
+def decode_error(payload: bytes) -> str:
+    code = payload[0] if payload else ErrorCode.BAD_FRAME
+    name = ErrorCode(code).name if code in ErrorCode else f"error {code}"
+    message = payload[1:].decode(errors="replace")
+    return f"{name}: {message}" if message else name
@@ -1,15 +1,278 @@
-from collector_core.client import AsyncClientBase
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Optional
 
+import serial_asyncio
+from collector_core.client import AsyncClientBase, BulkReading
 
+from collector_builtins.client.STM32.protocol import (
+    Frame,
+    FrameDecoder,
+    FrameType,
+    ProtocolError,
+    decode_error,
+    decode_reading,
+    decode_sensor_list,
+    encode_frame,
+    encode_ids,
+    encode_stream_start,
+)
+
+_RUNTIME = (
+    "_writer",
+    "_receiver",
+    "_pending",
+    "_slots",
+    "_lock",
+    "_samples",
+    "_clock",
+    "_seq",
+)
+
+
+class DeviceClock:
+    # Maps the MCU's wrapping microsecond counter onto the wall clock. The
+    # offset (arrival - device time) follows its lower envelope: transport
+    # delay only ever adds to it, so the smallest value seen is the best
+    # estimate. A slow upward decay tracks a device clock running late.
+    def __init__(self, decay: float = 0.001):
+        self.decay = decay
+        self._offset: Optional[float] = None
+        self._last = -1
+        self._epoch = 0
+
+    def to_host(self, device_time_us: int, received: float) -> float:
+        if device_time_us < self._last and self._last - device_time_us > 1 << 31:
+            self._epoch += 1 << 32
+        self._last = device_time_us
+        device = (self._epoch + device_time_us) / 1e6
+        offset = received - device
+        if self._offset is None or offset < self._offset:
+            self._offset = offset
+        else:
+            self._offset += self.decay * (offset - self._offset)
+        return device + self._offset
+
+
+@dataclass
 class STM32_RealClient(AsyncClientBase):
+    # Talks the framed protocol of collector_builtins.client.STM32.protocol
+    # over a USB CDC serial port. Requests are pipelined: up to max_in_flight
+    # frames are on the wire and replies are matched by their seq.
+    port: str = ""
+    baudrate: int = 115200
+    timeout: float = 1.0
+    max_in_flight: int = 32
+    # Let the MCU push samples at the sampling interval instead of polling
+    streaming: bool = False
+    # Stream samples buffered for a slow consumer, older ones are dropped
+    max_queued_samples: int = 1024
+
+    sample_drops: int = field(default=0, init=False)
+
+    _names: list[str] = field(default_factory=list, init=False, repr=False)
+    _ids: dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _writer: Optional[asyncio.StreamWriter] = field(
+        default=None, init=False, repr=False
+    )
+    _receiver: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+    _pending: dict[int, tuple[int, asyncio.Future]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _slots: Optional[asyncio.Semaphore] = field(default=None, init=False, repr=False)
+    _lock: Optional[asyncio.Lock] = field(default=None, init=False, repr=False)
+    _samples: Optional[asyncio.Queue] = field(default=None, init=False, repr=False)
+    _clock: DeviceClock = field(default_factory=DeviceClock, init=False, repr=False)
+    _seq: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        if not 0 < self.max_in_flight < 256:
+            raise ValueError("max_in_flight must be within 1..255")
+
+    def __getstate__(self) -> dict:
+        # A client handed to a collector shard reconnects on first use
+        state = self.__dict__.copy()
+        for name in _RUNTIME:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._writer = self._receiver = self._slots = self._lock = None
+        self._samples = None
+        self._pending = {}
+        self._clock = DeviceClock()
+        self._seq = 0
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        if self._writer is not None:
+            return self._writer
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is None:
+                reader, writer = await serial_asyncio.open_serial_connection(
+                    url=self.port, baudrate=self.baudrate
+                )
+                self._slots = asyncio.Semaphore(self.max_in_flight)
+                self._clock = DeviceClock()
+                self._writer = writer
+                self._receiver = asyncio.create_task(self._receive(reader))
+        return self._writer
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            await asyncio.gather(self._receiver, return_exceptions=True)
+
+    def _disconnected(self, error: Exception):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = self._receiver = None
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        if self._samples is not None:
+            self._samples.put_nowait(error)
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        decoder = FrameDecoder()
+        error: Exception = ConnectionError(f"{self.port} closed")
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                received = time.time()
+                for frame in decoder.feed(data):
+                    if frame.type == FrameType.SAMPLE:
+                        self._on_sample(frame, received)
+                        continue
+                    expected, future = self._pending.pop(frame.seq, (None, None))
+                    if future is None or future.done():
+                        # Reply to a request that already timed out
+                        continue
+                    if frame.type in (expected, FrameType.ERROR):
+                        future.set_result((frame, received))
+                    else:
+                        future.set_exception(
+                            ProtocolError(f"Unexpected reply type {frame.type:#x}")
+                        )
+        except asyncio.CancelledError:
+            error = ConnectionError(f"{self.port} closed")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._disconnected(error)
+
+    def _on_sample(self, frame: Frame, received: float):
+        samples = self._samples
+        if samples is None:
+            return
+        if samples.full():
+            samples.get_nowait()
+            self.sample_drops += 1
+        samples.put_nowait((frame.payload, received))
+
+    def _next_seq(self) -> int:
+        # seq 0 is reserved for pushed samples
+        while True:
+            self._seq = self._seq % 255 + 1
+            if self._seq not in self._pending:
+                return self._seq
+
+    async def _request(
+        self, frame_type: FrameType, payload: bytes = b""
+    ) -> tuple[Frame, float]:
+        writer = await self._connect()
+        async with self._slots:
+            seq = self._next_seq()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[seq] = (frame_type | 0x80, future)
+            try:
+                writer.write(encode_frame(frame_type, seq, payload))
+                await writer.drain()
+                frame, received = await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending.pop(seq, None)
+        if frame.type == FrameType.ERROR:
+            raise ProtocolError(decode_error(frame.payload))
+        return frame, received
+
+    async def _sensor_ids(self, sensor_names: list[str]) -> list[int]:
+        if not self._ids:
+            await self.get_list_of_sensors_names()
+        try:
+            return [self._ids[name] for name in sensor_names]
+        except KeyError as e:
+            raise ProtocolError(f"MCU has no sensor {e}") from None
+
+    def _bulk_reading(self, payload: bytes, received: float) -> BulkReading:
+        device_time_us, entries = decode_reading(payload)
+        names = self._names
+        return BulkReading(
+            values={
+                names[i]: value
+                for i, value in zip(entries["id"].tolist(), entries["value"].tolist())
+            },
+            timestamp=self._clock.to_host(device_time_us, received),
+        )
+
     async def get_heartbeat(self) -> bool:
-        raise NotImplementedError
+        try:
+            await self._request(FrameType.PING)
+        except (OSError, TimeoutError, ProtocolError):
+            return False
+        return True
 
     async def get_mcu_info(self) -> str:
-        raise NotImplementedError
+        frame, _ = await self._request(FrameType.INFO)
+        return frame.payload.decode(errors="replace")
 
-    async def get_list_of_sensors(self) -> list[str]:
-        raise NotImplementedError
+    async def get_list_of_sensors_names(self) -> list[str]:
+        frame, _ = await self._request(FrameType.LIST)
+        self._names = decode_sensor_list(frame.payload)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        return list(self._names)
 
     async def get_sensor_data(self, sensor_name: str) -> float:
-        raise NotImplementedError
+        reading = await self.get_sensors_data([sensor_name])
+        return reading.values[sensor_name]
+
+    async def get_sensors_data(self, sensor_names: list[str]) -> BulkReading:
+        # One READ frame for all sensors, the MCU samples them back to back
+        ids = await self._sensor_ids(sensor_names)
+        frame, received = await self._request(FrameType.READ, encode_ids(ids))
+        return self._bulk_reading(frame.payload, received)
+
+    def streams(self) -> bool:
+        return self.streaming
+
+    async def stream(
+        self, sensor_names: list[str], interval: float
+    ) -> AsyncIterator[BulkReading]:
+        ids = await self._sensor_ids(sensor_names)
+        samples = asyncio.Queue(self.max_queued_samples)
+        self._samples = samples
+        try:
+            period_us = max(int(interval * 1e6), 1)
+            await self._request(
+                FrameType.STREAM_START, encode_stream_start(period_us, ids)
+            )
+            while True:
+                item = await samples.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield self._bulk_reading(*item)
+        finally:
+            if self._samples is samples:
+                self._samples = None
+            if self._writer is not None:
+                try:
+                    await self._request(FrameType.STREAM_STOP)
+                except (OSError, TimeoutError, ProtocolError):
+                    pass
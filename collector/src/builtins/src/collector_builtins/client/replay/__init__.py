@@ -0,0 +1,6 @@
+from collector_builtins.client.replay.client import ReplayClient, load_replay_clients
+
+__all__ = [
+    "ReplayClient",
+    "load_replay_clients",
+]
@@ -0,0 +1,119 @@
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from collector_core.client import AsyncClientBase, BulkReading
+from collector_core.mcu import MCU
+
+
+@dataclass
+class ReplayClient(AsyncClientBase):
+    # Streams a dataset produced by collector_builtins.client.replay.convert.
+    # Columns are memory-mapped, a read only touches the pages it needs.
+    path: str = ""
+    speed: float = 1.0
+    loop: bool = True
+    # Send the dataset's own timestamps instead of the wall clock
+    original_timestamps: bool = False
+
+    _timestamps: np.ndarray = field(init=False, repr=False)
+    _columns: dict[str, np.ndarray] = field(init=False, repr=False)
+    _source: str = field(init=False, repr=False)
+    _started: float = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._open()
+        self._started = time.time()
+
+    def __getstate__(self) -> dict:
+        # Pickling a memmap copies the whole column, a client handed to a
+        # collector shard reopens the files instead
+        state = self.__dict__.copy()
+        for name in ("_timestamps", "_columns", "_source"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._open()
+
+    def _open(self):
+        directory = Path(self.path)
+        with open(directory / "meta.json") as f:
+            meta = json.load(f)
+        self._source = meta["source"]
+        self._timestamps = np.load(directory / "timestamps.npy", mmap_mode="r")
+        self._columns = {
+            column: np.load(directory / filename, mmap_mode="r")
+            for column, filename in meta["files"].items()
+        }
+        if len(self._timestamps) == 0:
+            raise ValueError(f"Dataset {directory} is empty")
+
+    def _position(self, now: float) -> tuple[int, float]:
+        first, last = float(self._timestamps[0]), float(self._timestamps[-1])
+        offset = (now - self._started) * self.speed
+        span = last - first
+        if self.loop and span > 0:
+            offset %= span
+        moment = min(first + offset, last)
+        index = int(np.searchsorted(self._timestamps, moment, side="right")) - 1
+        return max(index, 0), moment
+
+    async def get_heartbeat(self) -> bool:
+        return True
+
+    async def get_mcu_info(self) -> str:
+        return f"Replay of {self._source} at {self.speed:g}x"
+
+    async def get_list_of_sensors_names(self) -> list[str]:
+        return list(self._columns)
+
+    async def get_sensor_data(self, sensor_name: str) -> float:
+        column = self._columns.get(sensor_name)
+        if column is None:
+            return 0.0
+        index, _ = self._position(time.time())
+        return float(column[index])
+
+    async def get_sensors_data(self, sensor_names: list[str]) -> BulkReading:
+        now = time.time()
+        index, moment = self._position(now)
+        columns = self._columns
+        values = {
+            name: float(columns[name][index]) if name in columns else 0.0
+            for name in sensor_names
+        }
+        return BulkReading(
+            values=values, timestamp=moment if self.original_timestamps else now
+        )
+
+
+def load_replay_clients(
+    path: str,
+    speed: float = 1.0,
+    first_dev_id: int = 1000,
+    loop: bool = True,
+    limit: Optional[int] = None,
+) -> list[ReplayClient]:
+    # Every converted directory under path becomes one client (one MCU)
+    directories = sorted(meta.parent for meta in Path(path).rglob("meta.json"))
+    if limit is not None:
+        directories = directories[:limit]
+    return [
+        ReplayClient(
+            mcu=MCU(
+                name=directory.name,
+                description=f"Replay of {directory}",
+                type=MCU.MCU_Type.FAKE,
+                dev_id=first_dev_id + i,
+            ),
+            path=str(directory),
+            speed=speed,
+            loop=loop,
+        )
+        for i, directory in enumerate(directories)
+    ]
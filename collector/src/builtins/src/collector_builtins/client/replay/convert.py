@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# Converts a CSV dataset into a directory of memory-mapped columns:
+#   timestamps.npy  float64 epoch seconds, sorted
+#   <column>.npy    float64 values aligned with timestamps
+#   meta.json       column list, row count and source
+# Long-format datasets (one row per device and reading) are split into one
+# directory per device with --group-by.
+
+
+@dataclass
+class Preset:
+    delimiter: str = ","
+    names: Optional[list[str]] = None  # for files without a header row
+    time_columns: list[str] = field(default_factory=list)
+    time_format: Optional[str] = None
+    group_by: Optional[str] = None
+    skip: list[str] = field(default_factory=list)
+
+
+PRESETS = {
+    # energydata_complete.csv
+    "uci": Preset(time_columns=["date"], time_format="%Y-%m-%d %H:%M:%S"),
+    # data.txt of the Intel Berkeley lab deployment, whitespace separated
+    "labdata": Preset(
+        delimiter=" ",
+        names=[
+            "date",
+            "time",
+            "epoch",
+            "moteid",
+            "temperature",
+            "humidity",
+            "light",
+            "voltage",
+        ],
+        time_columns=["date", "time"],
+        group_by="moteid",
+        skip=["epoch"],
+    ),
+    "sht": Preset(time_columns=["Date", "Time"]),
+    "swat": Preset(time_columns=["Timestamp"], time_format="%d/%m/%Y %I:%M:%S %p"),
+}
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def column_file(name: str) -> str:
+    return _UNSAFE.sub("_", name.strip()) + ".npy"
+
+
+def _rows(path: Path, preset: Preset) -> Iterator[dict[str, str]]:
+    with open(path, newline="") as f:
+        if preset.delimiter == " ":
+            # Whitespace separated files may use runs of spaces
+            lines = (" ".join(line.split()) for line in f)
+            reader = csv.DictReader(lines, fieldnames=preset.names, delimiter=" ")
+        else:
+            reader = csv.DictReader(
+                f, fieldnames=preset.names, delimiter=preset.delimiter
+            )
+        for row in reader:
+            yield {key.strip(): value for key, value in row.items() if key is not None}
+
+
+def _parse_time(row: dict[str, str], preset: Preset) -> Optional[float]:
+    raw = " ".join((row.get(column) or "").strip() for column in preset.time_columns)
+    if not raw.strip():
+        return None
+    try:
+        if preset.time_format:
+            moment = datetime.strptime(raw, preset.time_format)
+        else:
+            try:
+                return float(raw)
+            except ValueError:
+                moment = datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return moment.timestamp()
+
+
+def _parse_value(raw: Optional[str]) -> Optional[float]:
+    if raw is None or not raw.strip():
+        return np.nan
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+@dataclass
+class _Scan:
+    rows: dict[str, int] = field(default_factory=dict)
+    columns: list[str] = field(default_factory=list)
+    non_numeric: set[str] = field(default_factory=set)
+    skipped: int = 0
+
+
+def _scan(path: Path, preset: Preset) -> _Scan:
+    # First pass: count rows per group and find the numeric columns
+    scan = _Scan()
+    ignored = set(preset.time_columns) | set(preset.skip) | {preset.group_by}
+    for row in _rows(path, preset):
+        if not scan.columns:
+            scan.columns = [c for c in row if c not in ignored]
+        if _parse_time(row, preset) is None:
+            scan.skipped += 1
+            continue
+        group = row.get(preset.group_by, "") if preset.group_by else ""
+        scan.rows[group] = scan.rows.get(group, 0) + 1
+        for column in scan.columns:
+            if column not in scan.non_numeric and _parse_value(row.get(column)) is None:
+                scan.non_numeric.add(column)
+    return scan
+
+
+def _fill_gaps(values: np.ndarray):
+    # Forward fill missing readings, leading gaps take the first valid value
+    missing = np.isnan(values)
+    if not missing.any():
+        return
+    valid = np.flatnonzero(~missing)
+    if len(valid) == 0:
+        values[:] = 0.0
+        return
+    index = np.where(missing, 0, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    index[: valid[0]] = valid[0]
+    values[:] = values[index]
+
+
+def _finish(directory: Path, columns: list[str]):
+    # Sort by time and fill gaps, one column in memory at a time
+    timestamps = np.load(directory / "timestamps.npy", mmap_mode="r+")
+    order = None
+    if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps[:] = timestamps[order]
+        timestamps.flush()
+    for column in columns:
+        values = np.load(directory / column_file(column), mmap_mode="r+")
+        if order is not None:
+            values[:] = values[order]
+        _fill_gaps(values)
+        values.flush()
+
+
+def convert(
+    source: Path, destination: Path, preset: Preset, limit: Optional[int] = None
+) -> list[Path]:
+    scan = _scan(source, preset)
+    columns = [c for c in scan.columns if c not in scan.non_numeric]
+    if not columns:
+        raise ValueError(f"No numeric columns found in {source}")
+
+    outputs: dict[str, tuple[Path, np.ndarray, dict[str, np.ndarray]]] = {}
+    for group, count in scan.rows.items():
+        count = min(count, limit) if limit else count
+        directory = destination / f"{preset.group_by}_{group}" if group else destination
+        directory.mkdir(parents=True, exist_ok=True)
+        timestamps = np.lib.format.open_memmap(
+            directory / "timestamps.npy", mode="w+", dtype=np.float64, shape=(count,)
+        )
+        values = {
+            column: np.lib.format.open_memmap(
+                directory / column_file(column),
+                mode="w+",
+                dtype=np.float64,
+                shape=(count,),
+            )
+            for column in columns
+        }
+        outputs[group] = (directory, timestamps, values)
+
+    # Second pass: stream the rows into the memory-mapped columns
+    written = dict.fromkeys(outputs, 0)
+    for row in _rows(source, preset):
+        timestamp = _parse_time(row, preset)
+        if timestamp is None:
+            continue
+        group = row.get(preset.group_by, "") if preset.group_by else ""
+        i = written[group]
+        directory, timestamps, values = outputs[group]
+        if i >= len(timestamps):
+            continue
+        timestamps[i] = timestamp
+        for column, array in values.items():
+            array[i] = _parse_value(row.get(column))
+        written[group] = i + 1
+
+    result = []
+    for group, (directory, timestamps, values) in outputs.items():
+        timestamps.flush()
+        for array in values.values():
+            array.flush()
+        del timestamps, values
+        _finish(directory, columns)
+        with open(directory / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "source": source.name,
+                    "group": group or None,
+                    "rows": written[group],
+                    "columns": columns,
+                    "files": {column: column_file(column) for column in columns},
+                },
+                f,
+                indent=2,
+            )
+        result.append(directory)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a CSV dataset into memory-mapped .npy columns"
+    )
+    parser.add_argument("source", type=Path)
+    parser.add_argument("destination", type=Path)
+    parser.add_argument("--preset", choices=sorted(PRESETS))
+    parser.add_argument("--delimiter")
+    parser.add_argument("--time-columns", nargs="+")
+    parser.add_argument("--time-format")
+    parser.add_argument("--group-by")
+    parser.add_argument("--skip", nargs="+", default=[])
+    parser.add_argument("--limit", type=int, help="Keep at most N rows per group")
+    args = parser.parse_args()
+
+    preset = replace(PRESETS[args.preset]) if args.preset else Preset()
+    if args.delimiter:
+        preset.delimiter = args.delimiter
+    if args.time_columns:
+        preset.time_columns = args.time_columns
+    if args.time_format:
+        preset.time_format = args.time_format
+    if args.group_by:
+        preset.group_by = args.group_by
+    preset.skip = [*preset.skip, *args.skip]
+    if not preset.time_columns:
+        parser.error("--time-columns is required without a preset")
+
+    for directory in convert(args.source, args.destination, preset, args.limit):
+        size = sum(f.stat().st_size for f in directory.iterdir())
+        print(f"{directory}: {size / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from typing import Literal, Optional
+
+from collector_core.client import AsyncClientBase
+from collector_core.mcu import MCU
+from collector_core.sensor import SensorBase
+from pydantic import BaseModel, Field, model_validator
+
+from collector_builtins.client.STM32 import STM32_FakeClient, STM32_RealClient
+from collector_builtins.sensor import (
+    ConstantSensor,
+    CosineSensor,
+    GaussDistributedSensor,
+    SeasonalSensor,
+)
+
+# Request bodies of the collector's /clients endpoints
+
+SENSORS: dict[str, type[SensorBase]] = {
+    "constant": ConstantSensor,
+    "cosine": CosineSensor,
+    "gauss": GaussDistributedSensor,
+    "seasonal": SeasonalSensor,
+}
+
+
+class SensorDefinition(BaseModel):
+    name: str
+    # Simulated sensor to attach to a fake client. Without it the name is
+    # polled as is, e.g. a sensor the MCU already exposes.
+    kind: Optional[Literal["constant", "cosine", "gauss", "seasonal"]] = None
+    params: dict[str, Optional[float]] = Field(default_factory=dict)
+    interval: Optional[float] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_params(self):
+        if self.params and self.kind is None:
+            raise ValueError("params need a sensor kind")
+        private = [key for key in self.params if key.startswith("_")]
+        if private:
+            raise ValueError(f"Unknown sensor parameters {private}")
+        return self
+
+    def to_sensor(self) -> Optional[SensorBase]:
+        if self.kind is None:
+            return None
+        try:
+            return SENSORS[self.kind](name=self.name, **self.params)
+        except TypeError as e:
+            raise ValueError(f"Bad parameters for a {self.kind} sensor: {e}") from e
+
+
+class ClientDefinition(BaseModel):
+    dev_id: int
+    name: str = ""
+    description: str = ""
+    kind: Literal["fake", "replay", "stm32"] = "fake"
+    sensors: list[SensorDefinition] = Field(default_factory=list)
+    # Replay clients
+    path: Optional[str] = None
+    speed: float = Field(default=1.0, gt=0)
+    # STM32 clients
+    port: Optional[str] = None
+    baudrate: int = 115200
+    streaming: bool = False
+
+    @model_validator(mode="after")
+    def check_kind(self):
+        if self.kind == "replay":
+            if self.path is None:
+                raise ValueError("A replay client needs a path")
+            if any(sensor.kind is not None for sensor in self.sensors):
+                raise ValueError("A replay client only streams its own columns")
+        elif self.kind == "stm32":
+            if self.port is None:
+                raise ValueError("An STM32 client needs a port")
+            if any(sensor.kind is not None for sensor in self.sensors):
+                raise ValueError("An STM32 client only reads its own sensors")
+        elif any(sensor.kind is None for sensor in self.sensors):
+            raise ValueError("Every sensor of a fake client needs a kind")
+        return self
+
+    def to_client(self) -> AsyncClientBase:
+        mcu = MCU(
+            name=self.name or str(self.dev_id),
+            description=self.description,
+            type=MCU.MCU_Type.REAL if self.kind == "stm32" else MCU.MCU_Type.FAKE,
+            dev_id=self.dev_id,
+        )
+        if self.kind == "replay":
+            # Imported on use, a collector without replay clients never loads it
+            from collector_builtins.client.replay import ReplayClient
+
+            try:
+                return ReplayClient(mcu=mcu, path=self.path, speed=self.speed)
+            except OSError as e:
+                raise ValueError(f"Cannot open dataset {self.path}: {e}") from e
+        if self.kind == "stm32":
+            return STM32_RealClient(
+                mcu=mcu,
+                port=self.port,
+                baudrate=self.baudrate,
+                streaming=self.streaming,
+            )
+        return STM32_FakeClient(
+            mcu=mcu, sensors=[sensor.to_sensor() for sensor in self.sensors]
+        )
@@ -1,7 +1,9 @@
-from dataclasses import dataclass
+import math
+from dataclasses import dataclass, field
+from typing import Optional
 
 import numpy as np
-from collector_core.sensor import SensorBase
+from collector_core.sensor import SensorBase, spawn_generators
 
 
 @dataclass
@@ -10,14 +12,38 @@ class CosineSensor(SensorBase):
     period: float = 100
     noise: float = 0.05
     drift_scale: float = 0.0002
+    seed: Optional[int] = None
 
     _t: int = 0
     _drift: float = 0.0
 
+    _rngs: list = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._rngs = spawn_generators(self.seed, 2)
+
     def read(self) -> float:
-        base = self.amplitude * np.cos(2 * np.pi * self.t / self.period)
-        noise = np.random.normal(scale=self.noise)
-        self.drift += np.random.normal(scale=self.drift_scale)
-        value = base + noise + self.drift
-        self.t += 1
-        return float(value)
+        # Scalar form of read_block, same streams in the same order
+        noise_rng, drift_rng = self._rngs
+        t = float(self._t)
+
+        base = self.amplitude * math.cos(2 * math.pi * t / self.period)
+        noise = noise_rng.standard_normal() * self.noise
+        self._drift = self._drift + drift_rng.standard_normal() * self.drift_scale
+
+        self._t += 1
+        return base + noise + self._drift
+
+    def read_block(self, n: int) -> np.ndarray:
+        noise_rng, drift_rng = self._rngs
+        t = np.arange(self._t, self._t + n, dtype=np.float64)
+
+        base = self.amplitude * np.cos(2 * np.pi * t / self.period)
+        noise = noise_rng.standard_normal(n) * self.noise
+        steps = drift_rng.standard_normal(n) * self.drift_scale
+        drift = np.cumsum(np.concatenate(([self._drift], steps)))[1:]
+        self._drift = float(drift[-1])
+
+        value = base + noise + drift
+        self._t += n
+        return value
@@ -1,13 +1,25 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
 import numpy as np
-from collector_core.sensor import SensorBase
+from collector_core.sensor import SensorBase, spawn_generators
 
 
 @dataclass
 class GaussDistributedSensor(SensorBase):
     mean: float = 0.0
     sigma: float = 1.0
+    seed: Optional[int] = None
+
+    _rngs: list = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._rngs = spawn_generators(self.seed, 1)
 
     def read(self) -> float:
-        return np.random.normal(self.mean, self.sigma)
+        (rng,) = self._rngs
+        return self.mean + self.sigma * rng.standard_normal()
+
+    def read_block(self, n: int) -> np.ndarray:
+        (rng,) = self._rngs
+        return self.mean + self.sigma * rng.standard_normal(n)
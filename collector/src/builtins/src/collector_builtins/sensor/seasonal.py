@@ -1,7 +1,10 @@
-from dataclasses import dataclass
+import math
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Optional
 
 import numpy as np
-from collector_core.sensor import SensorBase
+from collector_core.sensor import SensorBase, spawn_generators
 
 
 @dataclass
@@ -15,28 +18,75 @@ class SeasonalSensor(SensorBase):
     slow_period: float = 1440
     adc_step: float = 0.01
 
+    spike_probability: float = 0.001  # 0.1%
+    seed: Optional[int] = None
+
     _t: int = 0
     _noise_prev: float = 0.0
     _drift: float = 0.0
 
-    def read(self):
-        t = self._t
+    _rngs: list = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._rngs = spawn_generators(self.seed, 4)
+
+    def read(self) -> float:
+        # Scalar form of read_block, drawing from the same streams in the same
+        # order, so both produce the same values
+        noise_rng, drift_rng, spike_rng, spike_value_rng = self._rngs
+        t = float(self._t)
+
+        trend = self.trend_rate * t
+        seasonal = 1.0 * math.sin(2 * math.pi * t / self.slow_period) + 0.3 * math.sin(
+            2 * math.pi * t / self.fast_period
+        )
+        eps = noise_rng.standard_normal() * self.noise_scale
+        self._noise_prev = self.ar_coeff * self._noise_prev + eps
+        self._drift = self._drift + drift_rng.standard_normal() * self.drift_scale
+
+        value = 10.0 + trend + seasonal + self._noise_prev + self._drift
+
+        if spike_rng.random() < self.spike_probability:
+            value += 5.0 + 3.0 * spike_value_rng.standard_normal()
+
+        value = round(value / self.adc_step) * self.adc_step
+        self._t += 1
+        return value
+
+    def read_block(self, n: int) -> np.ndarray:
+        noise_rng, drift_rng, spike_rng, spike_value_rng = self._rngs
+        t = np.arange(self._t, self._t + n, dtype=np.float64)
 
         trend = self.trend_rate * t
         seasonal = 1.0 * np.sin(2 * np.pi * t / self.slow_period) + 0.3 * np.sin(
             2 * np.pi * t / self.fast_period
         )
-        eps = np.random.normal(scale=self.noise_scale)
-        noise = self.ar_coeff * self._noise_prev + eps
-        self._noise_prev = noise
 
-        self._drift += np.random.normal(scale=self.drift_scale)
+        # AR(1) recursion is inherently sequential; run it on plain floats so
+        # the arithmetic is the same whatever the block size is.
+        eps = noise_rng.standard_normal(n) * self.noise_scale
+        a = self.ar_coeff
+        noise = list(
+            accumulate(
+                eps.tolist(), lambda prev, e: a * prev + e, initial=self._noise_prev
+            )
+        )
+        self._noise_prev = noise[-1]
+        noise = np.array(noise[1:])
 
-        value = 10.0 + trend + seasonal + noise + self._drift
+        # cumsum starting from the carried value adds in the same order as the
+        # scalar random walk, so the result is bit-for-bit identical.
+        steps = drift_rng.standard_normal(n) * self.drift_scale
+        drift = np.cumsum(np.concatenate(([self._drift], steps)))[1:]
+        self._drift = float(drift[-1])
 
-        if np.random.random() < 0.001:  # 0.1%
-            value += np.random.normal(loc=5, scale=3)
+        value = 10.0 + trend + seasonal + noise + drift
 
-        value = round(value / self.adc_step) * self.adc_step
-        self._t += 1
-        return float(value)
+        spikes = spike_rng.random(n) < self.spike_probability
+        count = int(np.count_nonzero(spikes))
+        if count:
+            value[spikes] += 5.0 + 3.0 * spike_value_rng.standard_normal(count)
+
+        value = np.round(value / self.adc_step) * self.adc_step
+        self._t += n
+        return value
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from collector_builtins.sensor import (
+    CosineSensor,
+    GaussDistributedSensor,
+    SeasonalSensor,
+)
+
+# read_block(n) must give exactly what n calls of read() give, so the fake
+# client and the emulator can use either
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda: SeasonalSensor(name="s", seed=7, spike_probability=0.05),
+        lambda: CosineSensor(name="c", seed=7),
+        lambda: GaussDistributedSensor(name="g", mean=1.0, sigma=2.0, seed=7),
+    ],
+)
+def test_read_block_matches_sequential_reads(make):
+    blocks, scalars = make(), make()
+
+    block = np.concatenate([blocks.read_block(n) for n in (1, 999, 4000)])
+    sequential = np.array([scalars.read() for _ in range(5000)])
+
+    assert np.array_equal(block, sequential)
+    # Both stay in step afterwards, whichever way the next samples are read
+    assert blocks.read() == scalars.read_block(1)[0]
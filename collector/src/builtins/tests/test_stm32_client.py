@@ -0,0 +1,178 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+from collector_builtins.client.STM32 import STM32_RealClient
+from collector_builtins.client.STM32.emulator import MCUEmulator
+from collector_builtins.sensor import ConstantSensor
+from collector_core.mcu import MCU
+
+# STM32_RealClient against MCUEmulator on a pty, no hardware needed
+
+SENSORS = 16
+
+
+class ShuffledEmulator(MCUEmulator):
+    # Replies leave after a random delay, so pipelined ones overtake each other
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.random = random.Random(0)
+        self.emitted: list[tuple[float, int]] = []
+
+    def _emit(self, due: float, data: bytes):
+        due += self.random.uniform(0, 0.02)
+        self.emitted.append((due, data[2]))
+        super()._emit(due, data)
+
+
+class CorruptingEmulator(MCUEmulator):
+    # Flips a CRC byte of every corrupt_every-th reply
+    corrupt_every = 3
+
+    def _emit(self, due: float, data: bytes):
+        if self.frames_out % self.corrupt_every == self.corrupt_every - 1:
+            data = data[:-1] + bytes((data[-1] ^ 0xFF,))
+        super()._emit(due, data)
+
+
+def make_sensors() -> list[ConstantSensor]:
+    return [ConstantSensor(name=f"s{i}", target_value=i) for i in range(SENSORS)]
+
+
+@asynccontextmanager
+async def connected(emulator: MCUEmulator, timeout: float = 1.0):
+    emulator.open()
+    server = asyncio.create_task(emulator.serve())
+    client = STM32_RealClient(
+        mcu=MCU(name="test", description="", type=MCU.MCU_Type.REAL, dev_id=1),
+        port=emulator.path,
+        timeout=timeout,
+    )
+    try:
+        yield client
+    finally:
+        await client.close()
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+        emulator.close()
+
+
+async def take(stream, count: int) -> list:
+    readings = []
+    async for reading in stream:
+        readings.append(reading)
+        if len(readings) == count:
+            return readings
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 20))
+
+
+def test_pipelined_replies_out_of_order():
+    async def scenario():
+        emulator = ShuffledEmulator(sensors=make_sensors(), usb_frame=0)
+        async with connected(emulator) as client:
+            names = await client.get_list_of_sensors_names()
+            readings = await asyncio.gather(
+                *(client.get_sensors_data([name]) for name in names * 4)
+            )
+            for name, reading in zip(names * 4, readings):
+                assert reading.values == {name: float(name[1:])}
+        # Replies really left in another order than the requests came in
+        requests = [seq for _, seq in emulator.emitted]
+        replies = [seq for _, seq in sorted(emulator.emitted)]
+        assert replies != requests
+
+    run(scenario())
+
+
+def test_crc_corruption_and_resync():
+    async def scenario():
+        emulator = CorruptingEmulator(sensors=make_sensors(), usb_frame=0)
+        async with connected(emulator, timeout=0.2) as client:
+            while True:
+                try:
+                    names = await client.get_list_of_sensors_names()
+                    break
+                except TimeoutError:
+                    pass
+            results = []
+            for _ in range(12):
+                try:
+                    reading = await client.get_sensors_data(names[:4])
+                except TimeoutError:
+                    results.append(None)
+                else:
+                    assert reading.values == {n: float(n[1:]) for n in names[:4]}
+                    results.append(reading)
+            # A corrupted reply costs its request, not the ones after it
+            assert 0 < results.count(None) < len(results)
+
+            # A stray sync byte announcing a frame that never comes
+            emulator.corrupt_every = 1 << 30
+            os.write(emulator._master, b"\xa5\x84\x00\x00\x01")
+            started = time.monotonic()
+            assert await client.get_heartbeat()
+            assert time.monotonic() - started < 0.2
+
+    run(scenario())
+
+
+def test_device_clock_wraparound():
+    async def scenario():
+        emulator = MCUEmulator(sensors=make_sensors(), usb_frame=0)
+        # The u32 microsecond counter wraps 100 ms in
+        emulator._started = time.monotonic() - ((1 << 32) - 100_000) / 1e6
+        async with connected(emulator) as client:
+            names = await client.get_list_of_sensors_names()
+            stamps = []
+            ended = time.monotonic() + 0.3
+            while time.monotonic() < ended:
+                stamps.append((await client.get_sensors_data(names)).timestamp)
+                await asyncio.sleep(0.005)
+        assert np.all(np.diff(stamps) > 0)
+        assert abs(stamps[-1] - time.time()) < 0.1
+
+    run(scenario())
+
+
+def test_stream_restart():
+    async def scenario():
+        emulator = MCUEmulator(sensors=make_sensors(), usb_frame=0)
+        async with connected(emulator) as client:
+            names = await client.get_list_of_sensors_names()
+            for subset in (names[:2], names[2:5], names[:2]):
+                stream = client.stream(subset, 0.005)
+                readings = await take(stream, 5)
+                await stream.aclose()
+                for reading in readings:
+                    assert reading.values == {n: float(n[1:]) for n in subset}
+                assert np.all(np.diff([r.timestamp for r in readings]) > 0)
+                # The stream was stopped on the device
+                assert emulator._stream is None
+            # Polling still works once streaming is over
+            reading = await client.get_sensors_data(names[:1])
+            assert reading.values == {"s0": 0.0}
+
+    run(scenario())
+
+
+def test_stream_replaced_without_stop():
+    async def scenario():
+        emulator = MCUEmulator(sensors=make_sensors(), usb_frame=0)
+        async with connected(emulator) as client:
+            names = await client.get_list_of_sensors_names()
+            first = client.stream(names[:1], 0.002)
+            await take(first, 1)
+            # A second stream replaces the first on the device
+            second = client.stream(names[1:2], 0.002)
+            readings = await take(second, 5)
+            assert readings[-1].values == {"s1": 1.0}
+            await second.aclose()
+            await first.aclose()
+
+    run(scenario())
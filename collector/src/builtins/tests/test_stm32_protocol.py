@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from collector_builtins.client.STM32.protocol import (
+    MAX_PAYLOAD,
+    FrameDecoder,
+    FrameType,
+    ProtocolError,
+    decode_reading,
+    decode_sensor_list,
+    decode_stream_start,
+    encode_frame,
+    encode_reading,
+    encode_sensor_list,
+)
+from collector_builtins.client.STM32.real import DeviceClock
+
+PONG = encode_frame(FrameType.PONG, 7)
+
+
+def test_frames_split_across_reads():
+    data = encode_frame(FrameType.READING, 1, encode_reading(5, [0, 1], [1.5, 2.5]))
+    data += encode_frame(FrameType.PONG, 2)
+    decoder = FrameDecoder()
+    frames = [frame for byte in data for frame in decoder.feed(bytes((byte,)))]
+    assert [(f.type, f.seq) for f in frames] == [(FrameType.READING, 1), (0x81, 2)]
+    device_time_us, entries = decode_reading(frames[0].payload)
+    assert device_time_us == 5
+    assert entries["value"].tolist() == [1.5, 2.5]
+    assert decoder.dropped == 0
+
+
+@pytest.mark.parametrize(
+    "garbage",
+    [
+        # Length over MAX_PAYLOAD
+        b"\xa5\x84\x00\xff\xff",
+        # A length that fits, but the frame never completes
+        b"\xa5\x84\x00\x00\x01",
+        b"\x00\xa5\xa5\x01",
+    ],
+)
+def test_stray_sync_does_not_stall(garbage):
+    decoder = FrameDecoder()
+    assert decoder.feed(garbage) == []
+    frames = decoder.feed(PONG + PONG)
+    assert [(f.type, f.seq) for f in frames] == [(FrameType.PONG, 7)] * 2
+    assert decoder.dropped > 0
+
+
+def test_bad_crc_is_skipped():
+    corrupted = bytearray(encode_frame(FrameType.INFO_REPLY, 3, b"hello"))
+    corrupted[-1] ^= 0xFF
+    decoder = FrameDecoder()
+    frames = decoder.feed(bytes(corrupted) + PONG)
+    assert [(f.type, f.seq) for f in frames] == [(FrameType.PONG, 7)]
+    assert decoder.dropped > 0
+
+
+def test_payload_size_is_capped():
+    encode_frame(FrameType.INFO_REPLY, 1, bytes(MAX_PAYLOAD))
+    with pytest.raises(ProtocolError):
+        encode_frame(FrameType.INFO_REPLY, 1, bytes(MAX_PAYLOAD + 1))
+
+
+def test_sensor_list_roundtrip():
+    names = ["t", "humidity", "ü"]
+    assert decode_sensor_list(encode_sensor_list(names)) == names
+
+
+@pytest.mark.parametrize("payload", [b"", b"\x02\x01a", b"\x01\x05ab", b"\x01\x01\xff"])
+def test_malformed_sensor_list(payload):
+    with pytest.raises(ProtocolError):
+        decode_sensor_list(payload)
+
+
+@pytest.mark.parametrize(
+    "decode, payload",
+    [
+        (decode_reading, b""),
+        (decode_reading, b"\x00\x00\x00\x00\x02\x00"),
+        (decode_stream_start, b"\x01"),
+        (decode_stream_start, b"\x10\x00\x00\x00\x02\x00"),
+    ],
+)
+def test_malformed_payloads(decode, payload):
+    with pytest.raises(ProtocolError):
+        decode(payload)
+
+
+def test_device_clock_unwraps():
+    clock = DeviceClock()
+    host = 1000.0
+    device = (1 << 32) - 3_000_000
+    mapped = []
+    # 6 s in 10 ms steps, the u32 microsecond counter wraps after 3 s
+    for _ in range(600):
+        mapped.append(clock.to_host(device & 0xFFFFFFFF, host + 0.002))
+        device += 10_000
+        host += 0.01
+    steps = np.diff(mapped)
+    assert np.allclose(steps, 0.01, atol=1e-6)
+    assert mapped[-1] == pytest.approx(host - 0.01 + 0.002, abs=1e-3)
+
+
+def test_device_clock_follows_lower_envelope():
+    clock = DeviceClock()
+    # Transport delay of 5 ms, one reply delayed by 50 ms
+    first = clock.to_host(0, 100.005)
+    late = clock.to_host(10_000, 100.065)
+    assert first == pytest.approx(100.005)
+    assert late == pytest.approx(100.015, abs=1e-3)
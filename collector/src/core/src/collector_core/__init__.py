@@ -3,4 +3,11 @@ import os
 from collector_core.fingerprint import get_machine_fingerprint
 
 API_REFRESH_INTERVAL_MS = os.environ.get("API_REFRESH_INTERVAL_MS", 1000)
-FINGERPRINT = get_machine_fingerprint()
+API_URL = os.environ.get("API_URL", "http://localhost:8000")
+
+
+def __getattr__(name: str):
+    # FINGERPRINT is resolved on first use, importing the package stays cheap
+    if name == "FINGERPRINT":
+        return get_machine_fingerprint()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,17 @@
+import time
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 
 from collector_core.mcu import MCU
 
 
+@dataclass
+class BulkReading:
+    values: dict[str, float]
+    timestamp: float
+
+
 @dataclass
 class AsyncClientBase(ABC):
     mcu: MCU
@@ -23,3 +31,20 @@ class AsyncClientBase(ABC):
     @abstractmethod
     async def get_sensor_data(self, sensor_name: str) -> float:
         raise NotImplementedError
+
+    async def get_sensors_data(self, sensor_names: list[str]) -> BulkReading:
+        # Fallback for clients without a native bulk read: one call per sensor.
+        # Clients that can read several sensors in one round trip override it.
+        values = {name: await self.get_sensor_data(name) for name in sensor_names}
+        return BulkReading(values=values, timestamp=time.time())
+
+    def streams(self) -> bool:
+        # Clients whose MCU pushes samples on its own return True and
+        # implement stream(); the scheduler then stops polling them.
+        return False
+
+    def stream(
+        self, sensor_names: list[str], interval: float
+    ) -> AsyncIterator[BulkReading]:
+        # Yields one reading per sampling instant until the iterator is closed
+        raise NotImplementedError
@@ -1,21 +1,27 @@
-from collector_core.db.engine import get_engine
-from collector_core.db.utils import (
-    create_mcu,
-    delete_mcu,
-    get_db_session,
-    get_mcu_by_id,
-    get_mcus,
-    init_db,
-    update_mcu,
-)
+from importlib import import_module
 
-__all__ = [
-    "get_engine",
-    "init_db",
-    "get_db_session",
-    "create_mcu",
-    "get_mcus",
-    "get_mcu_by_id",
-    "update_mcu",
-    "delete_mcu",
-]
+# Exports are loaded on first use: the daemon only needs the spool, the ORM
+# helpers (and pandas for get_mcus) stay out of a headless collector
+_EXPORTS = {
+    "get_engine": "collector_core.db.engine",
+    "init_db": "collector_core.db.utils",
+    "get_db_session": "collector_core.db.utils",
+    "create_mcu": "collector_core.db.utils",
+    "get_mcus": "collector_core.db.utils",
+    "get_mcu_by_id": "collector_core.db.utils",
+    "update_mcu": "collector_core.db.utils",
+    "delete_mcu": "collector_core.db.utils",
+    "Spool": "collector_core.db.spool",
+    "SpoolRecord": "collector_core.db.spool",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
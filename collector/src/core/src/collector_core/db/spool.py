@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Union
+
+from sensors.batch import SensorBatch
+
+# Plain sqlite3 rather than SQLAlchemy: the spool is the only database the
+# daemon touches, and SQLAlchemy alone doubled the collector's import time.
+# The table is the one SQLAlchemy created, existing spools still open.
+# AUTOINCREMENT keeps ids growing once the spool has been drained: without
+# it SQLite hands out 1, 2, ... again and the uplink, whose cursor is past
+# them, never sends those rows.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mcu_name VARCHAR(100) NOT NULL,
+    sensor_name VARCHAR(255) NOT NULL,
+    value FLOAT NOT NULL,
+    timestamp FLOAT NOT NULL
+)
+"""
+
+
+@dataclass
+class SpoolRecord:
+    id: int
+    mcu_name: str
+    sensor_name: str
+    value: float
+    timestamp: float
+
+
+class Spool:
+    def __init__(self, path: str = "spool.db"):
+        self.path = path
+        # One connection per thread, the uplink calls in from worker threads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.written = 0
+        self.acked = 0
+        conn = self._connection()
+        with conn:
+            conn.execute(_SCHEMA.format(table="spool"))
+            self._migrate(conn)
+        self._size = conn.execute("SELECT count(*) FROM spool").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path)
+            # WAL lets the uplink read the backlog while new readings are
+            # appended, NORMAL sync is durable across process crashes (not
+            # power loss) in WAL.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        # Spools written by earlier versions lack AUTOINCREMENT, copy them over
+        (sql,) = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'spool'"
+        ).fetchone()
+        if "AUTOINCREMENT" in sql:
+            return
+        conn.execute(_SCHEMA.format(table="spool_new"))
+        conn.execute("INSERT INTO spool_new SELECT * FROM spool")
+        conn.execute("DROP TABLE spool")
+        conn.execute("ALTER TABLE spool_new RENAME TO spool")
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def disk_size(self) -> int:
+        return sum(
+            os.path.getsize(path)
+            for path in (self.path, f"{self.path}-wal")
+            if os.path.exists(path)
+        )
+
+    def append(self, records: Union[list[dict], SensorBatch]):
+        if isinstance(records, SensorBatch):
+            names = [
+                (mcu_name, sensor_name) for _, mcu_name, sensor_name in records.series
+            ]
+            rows = [
+                (*names[i], value, timestamp)
+                for i, value, timestamp in zip(
+                    records.ids.tolist(),
+                    records.values.tolist(),
+                    records.timestamps.tolist(),
+                )
+            ]
+        else:
+            rows = [
+                (
+                    record["mcu_name"],
+                    record["sensor_name"],
+                    record["value"],
+                    record["timestamp"],
+                )
+                for record in records
+            ]
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO spool (mcu_name, sensor_name, value, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        with self._lock:
+            self._size += len(rows)
+            self.written += len(rows)
+
+    def read(self, after_id: int, limit: int) -> list[SpoolRecord]:
+        rows = self._connection().execute(
+            "SELECT id, mcu_name, sensor_name, value, timestamp FROM spool "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return [SpoolRecord(*row) for row in rows]
+
+    def ack(self, first_id: int, last_id: int):
+        with self._connection() as conn:
+            deleted = conn.execute(
+                "DELETE FROM spool WHERE id BETWEEN ? AND ?", (first_id, last_id)
+            ).rowcount
+        with self._lock:
+            self._size -= deleted
+            self.acked += deleted
+
+    def checkpoint(self):
+        # Give the WAL file back to the OS once the backlog has been drained
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
@@ -1,15 +1,21 @@
-import pandas as pd
+from typing import TYPE_CHECKING
+
 from sqlalchemy.orm import sessionmaker
 
 from collector_core.db.engine import get_engine
 from collector_core.db.models import Base, MCU_Table
 from collector_core.mcu import MCU
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 engine = get_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def init_db():
+    # Creates the mcus table the helpers below need, entry points that use
+    # them call it once on startup
     Base.metadata.create_all(bind=engine)
 
 
@@ -49,7 +55,10 @@ def create_mcu(
         db.close()
 
 
-def get_mcus() -> pd.DataFrame:
+def get_mcus() -> "pd.DataFrame":
+    # pandas is the optional "pandas" extra, only the dashboard needs it
+    import pandas as pd
+
     db = SessionLocal()
     try:
         items = db.query(MCU_Table).all()
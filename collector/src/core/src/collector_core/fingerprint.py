@@ -1,13 +1,56 @@
 import hashlib
+import json
+import os
 import platform
 import uuid
+from functools import cache
+from pathlib import Path
 
-
-def get_machine_fingerprint():
-    raw = (
-        platform.node()
-        + platform.machine()
-        + platform.processor()
-        + str(uuid.getnode())
+# platform.processor() runs `uname -p` in a subprocess, so it is kept on disk
+# together with the host name and MAC address it was read on. The
+# fingerprint itself is always hashed from the live values: an image cloned
+# onto another box does not match the stored host and reads it again.
+MACHINE_FILE = Path(
+    os.environ.get(
+        "COLLECTOR_MACHINE_FILE",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "collector"
+        / "machine.json",
     )
+)
+
+
+def _processor(node: str, mac: int) -> str:
+    try:
+        cached = json.loads(MACHINE_FILE.read_text())
+    except (OSError, ValueError):
+        cached = None
+    if (
+        isinstance(cached, dict)
+        and cached.get("node") == node
+        and cached.get("mac") == mac
+        and isinstance(cached.get("processor"), str)
+    ):
+        return cached["processor"]
+    processor = platform.processor()
+    try:
+        MACHINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        MACHINE_FILE.write_text(
+            json.dumps({"node": node, "mac": mac, "processor": processor})
+        )
+    except OSError:
+        # Read-only filesystem: read on every start, as before
+        pass
+    return processor
+
+
+def compute_machine_fingerprint() -> str:
+    node = platform.node()
+    mac = uuid.getnode()
+    raw = node + platform.machine() + _processor(node, mac) + str(mac)
     return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@cache
+def get_machine_fingerprint() -> str:
+    return compute_machine_fingerprint()
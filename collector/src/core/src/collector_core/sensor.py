@@ -1,5 +1,18 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+def spawn_generators(seed: Optional[int], count: int) -> list[np.random.Generator]:
+    # One independent stream per random component of a sensor. A block of n
+    # draws from a stream then consumes exactly what n single draws would,
+    # which keeps read_block(n) identical to n calls of read().
+    return [
+        np.random.default_rng(child)
+        for child in np.random.SeedSequence(seed).spawn(count)
+    ]
 
 
 @dataclass
@@ -9,3 +22,6 @@ class SensorBase(ABC):
     @abstractmethod
     def read(self) -> float:
         raise NotImplementedError
+
+    def read_block(self, n: int) -> np.ndarray:
+        return np.fromiter((self.read() for _ in range(n)), dtype=np.float64, count=n)
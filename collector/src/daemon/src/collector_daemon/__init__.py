@@ -1,3 +1,24 @@
+from collector_daemon.compression import (
+    CompressionMode,
+    CompressionPolicy,
+    EdgeCompression,
+    compression_from_env,
+)
 from collector_daemon.daemon import CollectorDaemon
+from collector_daemon.scheduler import PollScheduler
+from collector_daemon.sharded import ShardedCollector
+from collector_daemon.uplink import OverflowPolicy, SendResult, Uplink, WireFormat
 
-__all__ = ["CollectorDaemon"]
+__all__ = [
+    "CollectorDaemon",
+    "CompressionMode",
+    "CompressionPolicy",
+    "EdgeCompression",
+    "PollScheduler",
+    "OverflowPolicy",
+    "SendResult",
+    "ShardedCollector",
+    "Uplink",
+    "WireFormat",
+    "compression_from_env",
+]
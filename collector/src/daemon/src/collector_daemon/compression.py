@@ -0,0 +1,292 @@
+import math
+import os
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+
+from sensors.metrics import Counter, Gauge
+
+# Edge compression: per sensor, readings that can be reconstructed from the
+# ones that are sent, within a tolerance, never leave the collector.
+#
+#   DEADBAND       send when the value moves more than deviation away from
+#                  the last sent one; reconstructed by holding that value
+#   SWINGING_DOOR  send the points where the signal stops being a straight
+#                  line within deviation; reconstructed by linear
+#                  interpolation between sent points
+#   EXCEPTION      PI-style exception/compression deviation: a deadband of
+#                  exception_deviation filters readings before they reach the
+#                  swinging door. The error is bounded by
+#                  deviation + 2 * exception_deviation: a filtered reading is
+#                  within exception_deviation of the exception before it, so
+#                  is the line between that exception and the reading that
+#                  goes along with the next one, and the door keeps the
+#                  reconstruction within deviation of that line.
+#
+# Whatever the signal, a reading goes out once max_interval has passed since
+# the last one sent, so a flat sensor still shows it is alive.
+
+Point = tuple[float, float]
+
+COMPRESSION_RECEIVED = Counter(
+    "collector_compression_received_total",
+    "Readings entering edge compression",
+    ["client", "sensor"],
+)
+COMPRESSION_SENT = Counter(
+    "collector_compression_sent_total",
+    "Readings left after edge compression",
+    ["client", "sensor"],
+)
+COMPRESSION_ERROR = Gauge(
+    "collector_compression_max_error",
+    "Largest reconstruction error of a dropped reading",
+    ["client", "sensor"],
+)
+COMPRESSION_METRICS = (COMPRESSION_RECEIVED, COMPRESSION_SENT, COMPRESSION_ERROR)
+
+
+class CompressionMode(Enum):
+    DEADBAND = "deadband"
+    SWINGING_DOOR = "swinging_door"
+    EXCEPTION = "exception"
+
+
+@dataclass
+class CompressionPolicy:
+    mode: CompressionMode = CompressionMode.SWINGING_DOOR
+    deviation: float = 0.0
+    max_interval: float = 60.0
+    # EXCEPTION mode only, half of deviation by default
+    exception_deviation: Optional[float] = None
+
+    def __post_init__(self):
+        if self.deviation < 0:
+            raise ValueError(f"Deviation must not be negative, got {self.deviation}")
+        if self.max_interval <= 0:
+            raise ValueError(
+                f"Heartbeat interval must be positive, got {self.max_interval}"
+            )
+        if self.exception_deviation is not None and self.exception_deviation < 0:
+            raise ValueError("Exception deviation must not be negative")
+
+
+@dataclass
+class CompressionStats:
+    received: int = 0
+    sent: int = 0
+    # Errors of readings whose reconstruction is settled, sent ones count as 0
+    checked: int = 0
+    error_sum: float = 0.0
+    max_error: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        return self.received / self.sent if self.sent else 0.0
+
+    @property
+    def mean_error(self) -> float:
+        return self.error_sum / self.checked if self.checked else 0.0
+
+
+class SensorCompressor:
+    def __init__(self, policy: CompressionPolicy, labels: tuple[str, str] = ("", "")):
+        self.policy = policy
+        self.stats = CompressionStats()
+        self._received = COMPRESSION_RECEIVED.labels(*labels)
+        self._sent = COMPRESSION_SENT.labels(*labels)
+        self._error = COMPRESSION_ERROR.labels(*labels)
+        self._exception_deviation = (
+            policy.deviation / 2
+            if policy.exception_deviation is None
+            else policy.exception_deviation
+        )
+        # Last sent point, the start of the current segment
+        self._archive: Optional[Point] = None
+        # Latest point that passed the door, the candidate segment end
+        self._held: Optional[Point] = None
+        self._exception: Optional[Point] = None
+        self._skipped: Optional[Point] = None
+        # Slope range of lines from the archive that stay within deviation of
+        # every point since
+        self._low = -math.inf
+        self._high = math.inf
+        # Readings since the archive, to measure the reconstruction error
+        self._segment: list[Point] = []
+
+    def feed(self, value: float, timestamp: float) -> list[Point]:
+        # Returns the (value, timestamp) readings to send, in order. Swinging
+        # door sends a point only once a later reading shows where the line
+        # bends, i.e. one reading late.
+        self.stats.received += 1
+        self._received.inc()
+        archive = self._archive
+        if archive is None or timestamp <= archive[1]:
+            # First reading, or a clock step back: start over from here
+            return self.flush() + self._restart(value, timestamp)
+        if self.policy.mode == CompressionMode.DEADBAND:
+            return self._deadband(value, timestamp, archive)
+
+        if self.policy.mode == CompressionMode.EXCEPTION:
+            last = self._exception
+            if (
+                last is not None
+                and abs(value - last[0]) <= self._exception_deviation
+                and timestamp - archive[1] < self.policy.max_interval
+            ):
+                self._skipped = (value, timestamp)
+                self._segment.append(self._skipped)
+                return []
+            self._exception = (value, timestamp)
+            sent = []
+            if self._skipped is not None:
+                # As in PI, the reading before an exception goes along with
+                # it, so a step is not smeared across the quiet stretch
+                skipped, self._skipped = self._skipped, None
+                self._segment.pop()
+                sent = self._swinging_door(*skipped, self._archive)
+            return sent + self._swinging_door(value, timestamp, self._archive)
+        return self._swinging_door(value, timestamp, archive)
+
+    def flush(self) -> list[Point]:
+        # Sends the held point, e.g. before the policy changes
+        return self._close() if self._held is not None else []
+
+    def _deadband(self, value: float, timestamp: float, archive: Point) -> list[Point]:
+        error = abs(value - archive[0])
+        if (
+            error > self.policy.deviation
+            or timestamp - archive[1] >= self.policy.max_interval
+        ):
+            return self._restart(value, timestamp)
+        self._check(error)
+        return []
+
+    def _swinging_door(
+        self, value: float, timestamp: float, archive: Point
+    ) -> list[Point]:
+        sent = []
+        slope = (value - archive[0]) / (timestamp - archive[1])
+        if not self._low <= slope <= self._high:
+            # No line from the archive through this reading covers the ones
+            # in between: the held point ends the segment
+            sent = self._close()
+            archive = self._archive
+        deviation = self.policy.deviation
+        elapsed = timestamp - archive[1]
+        self._low = max(self._low, (value - deviation - archive[0]) / elapsed)
+        self._high = min(self._high, (value + deviation - archive[0]) / elapsed)
+        self._held = (value, timestamp)
+        self._segment.append(self._held)
+        if elapsed >= self.policy.max_interval:
+            sent += self._close()
+        return sent
+
+    def _close(self) -> list[Point]:
+        (value, timestamp), (start_value, start) = self._held, self._archive
+        slope = (value - start_value) / (timestamp - start)
+        rest = []
+        for point in self._segment:
+            if point[1] < timestamp:
+                self._check(abs(point[0] - start_value - slope * (point[1] - start)))
+            elif point[1] > timestamp:
+                rest.append(point)
+        self._segment = rest
+        return self._send(value, timestamp)
+
+    def _restart(self, value: float, timestamp: float) -> list[Point]:
+        self._segment = []
+        self._skipped = None
+        self._exception = (value, timestamp)
+        return self._send(value, timestamp)
+
+    def _send(self, value: float, timestamp: float) -> list[Point]:
+        self._archive = (value, timestamp)
+        self._held = None
+        self._low, self._high = -math.inf, math.inf
+        self.stats.sent += 1
+        self._sent.inc()
+        self._check(0.0)
+        return [(value, timestamp)]
+
+    def _check(self, error: float):
+        stats = self.stats
+        stats.checked += 1
+        stats.error_sum += error
+        if error > stats.max_error:
+            stats.max_error = error
+            self._error.set(error)
+
+
+@dataclass
+class EdgeCompression:
+    # Sensors without a policy pass through untouched
+    default: Optional[CompressionPolicy] = None
+
+    _policies: dict[tuple[int, str], Optional[CompressionPolicy]] = field(
+        default_factory=dict
+    )
+    _compressors: dict[tuple[int, str], SensorCompressor] = field(default_factory=dict)
+
+    def policy(self, dev_id: int, sensor_name: str) -> Optional[CompressionPolicy]:
+        return self._policies.get((dev_id, sensor_name), self.default)
+
+    def set_policy(
+        self, dev_id: int, sensor_name: str, policy: Optional[CompressionPolicy]
+    ) -> list[Point]:
+        # Returns the point the old compressor was holding, still to be sent
+        key = (dev_id, sensor_name)
+        self._policies[key] = policy
+        compressor = self._compressors.pop(key, None)
+        return compressor.flush() if compressor is not None else []
+
+    def remove(
+        self, dev_id: int, sensor_name: Optional[str] = None
+    ) -> dict[str, list[Point]]:
+        # Forgets the client's (or one sensor's) policies and returns the
+        # points still held, by sensor name
+        held = {}
+        for key in {
+            key
+            for key in (*self._policies, *self._compressors)
+            if key[0] == dev_id and sensor_name in (None, key[1])
+        }:
+            self._policies.pop(key, None)
+            compressor = self._compressors.pop(key, None)
+            if compressor is not None:
+                held[key[1]] = compressor.flush()
+            for metric in COMPRESSION_METRICS:
+                metric.remove(str(dev_id), key[1])
+        return held
+
+    def feed(
+        self, dev_id: int, sensor_name: str, value: float, timestamp: float
+    ) -> list[Point]:
+        key = (dev_id, sensor_name)
+        compressor = self._compressors.get(key)
+        if compressor is None:
+            policy = self._policies.get(key, self.default)
+            if policy is None:
+                return [(value, timestamp)]
+            compressor = self._compressors[key] = SensorCompressor(
+                policy, (str(dev_id), sensor_name)
+            )
+        return compressor.feed(value, timestamp)
+
+    def stats(self) -> dict[tuple[int, str], CompressionStats]:
+        return {key: c.stats for key, c in self._compressors.items()}
+
+
+def compression_from_env() -> EdgeCompression:
+    # COMPRESSION_MODE (e.g. swinging_door), COMPRESSION_DEVIATION and
+    # COMPRESSION_MAX_INTERVAL set a default policy for every sensor
+    mode = os.getenv("COMPRESSION_MODE")
+    if not mode:
+        return EdgeCompression()
+    return EdgeCompression(
+        default=CompressionPolicy(
+            mode=CompressionMode(mode),
+            deviation=float(os.getenv("COMPRESSION_DEVIATION", 0.0)),
+            max_interval=float(os.getenv("COMPRESSION_MAX_INTERVAL", 60.0)),
+        )
+    )
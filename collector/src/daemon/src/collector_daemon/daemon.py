@@ -1,53 +1,204 @@
 import asyncio
-import pprint
+from collections.abc import Coroutine
+from typing import Optional
 
+from collector_core import FINGERPRINT
 from collector_core.client import AsyncClientBase
-from collector_core.db import init_db
+from collector_core.db import Spool
+from collector_core.sensor import SensorBase
 
+from collector_daemon.compression import (
+    CompressionPolicy,
+    CompressionStats,
+    EdgeCompression,
+    Point,
+)
 from collector_daemon.logger import log_debug, log_info
+from collector_daemon.scheduler import PollScheduler
+from collector_daemon.uplink import Uplink
+
+
+def run(main: Coroutine):
+    # uvloop is optional, it cuts per-read scheduling overhead when present
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(main)
+    return uvloop.run(main)
+
+
+def attach_sensor(
+    client: AsyncClientBase, sensor_name: str, sensor: Optional[SensorBase]
+):
+    # Real MCUs expose a fixed set of sensors, only simulated clients accept
+    # new sensor definitions
+    if sensor is None:
+        return
+    add = getattr(client, "add_sensor", None)
+    if add is None:
+        raise ValueError(f"Client {client.mcu.dev_id} does not accept new sensors")
+    if sensor.name != sensor_name:
+        raise ValueError(f"Sensor name mismatch: {sensor.name} != {sensor_name}")
+    error = add(sensor)
+    if error is not None:
+        raise ValueError(error)
+
+
+def detach_sensor(client: AsyncClientBase, sensor_name: str):
+    remove = getattr(client, "remove_sensor", None)
+    if remove is not None:
+        remove(sensor_name)
 
 
 class CollectorDaemon:
     clients: list[AsyncClientBase]
-    queue: asyncio.Queue = asyncio.Queue()
+    uplink: Uplink
 
-    def __init__(self):
+    def __init__(
+        self,
+        default_interval: float = 1.0,
+        max_concurrency_per_client: int = 4,
+        uplink: Optional[Uplink] = None,
+        compression: Optional[EdgeCompression] = None,
+    ):
         self.clients = []
-        init_db()
+        self.uplink = uplink or Uplink(spool=Spool())
+        self.compression = compression or EdgeCompression()
+        self.scheduler = PollScheduler(
+            on_reading=self._on_reading,
+            default_interval=default_interval,
+            max_concurrency_per_client=max_concurrency_per_client,
+        )
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
 
     def main_thread(self):
-        asyncio.run(self._entrypoint())
+        run(self._entrypoint())
 
     async def _entrypoint(self):
-        t1 = asyncio.create_task(self.task_heartbeat())
-        t2 = asyncio.create_task(self.task_collect())
-        t3 = asyncio.create_task(self.task_send_data())
-        await asyncio.gather(t1, t2, t3)
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    def start(self):
+        # Runs on the caller's loop, e.g. from a FastAPI lifespan
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self.task_heartbeat()),
+            asyncio.create_task(self.task_collect()),
+            asyncio.create_task(self.task_send_data()),
+        ]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_client(self, dev_id: int) -> AsyncClientBase:
+        for client in self.clients:
+            if client.mcu.dev_id == dev_id:
+                return client
+        raise KeyError(dev_id)
+
+    async def add_client(self, client: AsyncClientBase):
+        dev_id = client.mcu.dev_id
+        if any(c.mcu.dev_id == dev_id for c in self.clients):
+            raise ValueError(f"Client {dev_id} is already collected")
+        self.clients.append(client)
+        if self.running:
+            try:
+                await self.scheduler.add_client(client)
+            except Exception:
+                self.scheduler.remove_client(client)
+                self.clients.remove(client)
+                raise
+
+    async def remove_client(self, dev_id: int) -> AsyncClientBase:
+        client = self.get_client(dev_id)
+        self.clients.remove(client)
+        self.scheduler.remove_client(client)
+        for sensor_name, points in self.compression.remove(dev_id).items():
+            await self._send(dev_id, sensor_name, points)
+        return client
+
+    async def add_sensor(
+        self,
+        dev_id: int,
+        sensor_name: str,
+        sensor: Optional[SensorBase] = None,
+        interval: Optional[float] = None,
+    ):
+        client = self.get_client(dev_id)
+        if interval is not None:
+            self.scheduler.set_interval(dev_id, sensor_name, interval)
+        attach_sensor(client, sensor_name, sensor)
+        self.scheduler.add_sensor(client, sensor_name)
+
+    async def remove_sensor(self, dev_id: int, sensor_name: str):
+        client = self.get_client(dev_id)
+        self.scheduler.remove_sensor(client, sensor_name)
+        detach_sensor(client, sensor_name)
+        for name, points in self.compression.remove(dev_id, sensor_name).items():
+            await self._send(dev_id, name, points)
+
+    def sensor_names(self, dev_id: int) -> list[str]:
+        return self.scheduler.sensor_names(dev_id)
+
+    def set_interval(self, dev_id: int, sensor_name: str, interval: float):
+        self.scheduler.set_interval(dev_id, sensor_name, interval)
+
+    async def set_compression(
+        self, dev_id: int, sensor_name: str, policy: Optional[CompressionPolicy]
+    ):
+        self.get_client(dev_id)
+        points = self.compression.set_policy(dev_id, sensor_name, policy)
+        await self._send(dev_id, sensor_name, points)
+
+    def compression_stats(self) -> dict[tuple[int, str], CompressionStats]:
+        return self.compression.stats()
 
     async def task_heartbeat(self):
+        log_info("Starting heartbeat loop")
         while True:
-            log_info("Starting heartbeat loop")
-            for client in self.clients:
-                log_info(f"Heartbeat -> {client.mcu.dev_id}")
+            for client in list(self.clients):
+                log_debug(f"Heartbeat -> {client.mcu.dev_id}")
                 await client.get_heartbeat()
             await asyncio.sleep(5)
 
     async def task_collect(self):
-        while True:
-            log_info("Starting collect loop")
-            for client in self.clients:
-                for sensor in await client.get_list_of_sensors_names():
-                    log_info(f"GED {sensor} -> {client.mcu.dev_id}")
-                    data = await client.get_sensor_data(sensor)
-                    await self.queue.put(
-                        {"dev_id": client.mcu.dev_id, "sensor": sensor, "data": data}
-                    )
-                    log_info(f"GED {sensor}:{data:.2f} <- {client.mcu.dev_id}")
-                    await asyncio.sleep(1)
+        log_info("Starting collect loop")
+        for client in list(self.clients):
+            await self.scheduler.add_client(client)
+        try:
+            await self.scheduler.run()
+        finally:
+            await self.scheduler.stop()
+
+    async def _on_reading(
+        self, client: AsyncClientBase, sensor: str, data: float, timestamp: float
+    ):
+        dev_id = client.mcu.dev_id
+        await self._send(
+            dev_id, sensor, self.compression.feed(dev_id, sensor, data, timestamp)
+        )
+
+    async def _send(self, dev_id: int, sensor: str, points: list[Point]):
+        # Records follow the shared SensorData model accepted by core /ingest.
+        # dev_id is what identifies an MCU inside the collector.
+        for value, timestamp in points:
+            await self.uplink.put(
+                {
+                    "fingerprint": FINGERPRINT,
+                    "mcu_name": str(dev_id),
+                    "sensor_name": sensor,
+                    "value": value,
+                    "timestamp": timestamp,
+                }
+            )
 
     async def task_send_data(self):
-        while True:
-            data = await self.queue.get()
-            log_info("=" * 32)
-            for line in pprint.pformat(data).splitlines():
-                log_info(line)
+        await self.uplink.run()
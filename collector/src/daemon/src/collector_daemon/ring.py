@@ -0,0 +1,142 @@
+import platform
+from contextlib import AbstractContextManager, nullcontext
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+RECORD = np.dtype(
+    [
+        ("dev_id", "<i8"),
+        ("key", "<i4"),
+        ("_pad", "<i4"),
+        ("value", "<f8"),
+        ("timestamp", "<f8"),
+    ]
+)
+
+# Header counters live on separate cache lines: head is written only by the
+# consumer, tail, dropped and the scheduler stats only by the producer. Max
+# lag and drift are float64 slots.
+_HEAD, _TAIL, _DROPPED, _READS, _MISSED, _ERRORS = 0, 8, 16, 17, 18, 19
+_MAX_LAG, _DRIFT = 20, 21
+_HEADER_SLOTS = 24
+
+# A record is published by storing it and then tail, and released by loading
+# it and then storing head. Nothing orders those accesses for another core
+# but the CPU: x86 keeps stores in order and never moves a store before an
+# earlier load (TSO), so there plain stores are enough. Elsewhere (ARM,
+# RISC-V) head and tail go through a shared lock, whose acquire and release
+# are full barriers.
+ORDERED_STORES = platform.machine().lower() in {"x86_64", "amd64", "i386", "i686"}
+
+
+class RingBuffer:
+    # Single-producer single-consumer ring of fixed-size reading records in
+    # shared memory. Records are written in place, nothing is pickled. The
+    # producer publishes a record by advancing tail after writing it.
+    def __init__(
+        self,
+        memory: shared_memory.SharedMemory,
+        capacity: int,
+        owner: bool,
+        lock: Optional[AbstractContextManager] = None,
+    ):
+        self.memory = memory
+        self.capacity = capacity
+        self.lock = lock
+        self._owner = owner
+        self._ordered = lock if lock is not None else nullcontext()
+        header_size = _HEADER_SLOTS * 8
+        self._header = np.ndarray((_HEADER_SLOTS,), np.int64, memory.buf, 0)
+        self._floats = self._header.view(np.float64)
+        self._records = np.ndarray((capacity,), RECORD, memory.buf, header_size)
+
+    @classmethod
+    def create(
+        cls, capacity: int, lock: Optional[AbstractContextManager] = None
+    ) -> "RingBuffer":
+        # lock: a multiprocessing lock shared with the other side, needed
+        # unless ORDERED_STORES
+        size = _HEADER_SLOTS * 8 + capacity * RECORD.itemsize
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(memory, capacity, owner=True, lock=lock)
+        ring._header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(
+        cls, name: str, capacity: int, lock: Optional[AbstractContextManager] = None
+    ) -> "RingBuffer":
+        # Only the creator tracks the segment, otherwise the resource tracker
+        # unlinks it when the first attached worker exits
+        memory = shared_memory.SharedMemory(name=name, track=False)
+        return cls(memory, capacity, owner=False, lock=lock)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def dropped(self) -> int:
+        return int(self._header[_DROPPED])
+
+    @property
+    def stats(self) -> tuple[int, int, int, float, float]:
+        # reads, missed, errors, max_lag, drift
+        header, floats = self._header, self._floats
+        return (
+            int(header[_READS]),
+            int(header[_MISSED]),
+            int(header[_ERRORS]),
+            float(floats[_MAX_LAG]),
+            float(floats[_DRIFT]),
+        )
+
+    def publish_stats(
+        self, reads: int, missed: int, errors: int, max_lag: float, drift: float
+    ):
+        self._header[_READS : _ERRORS + 1] = (reads, missed, errors)
+        self._floats[_MAX_LAG : _DRIFT + 1] = (max_lag, drift)
+
+    def __len__(self) -> int:
+        return int(self._header[_TAIL] - self._header[_HEAD])
+
+    def push(self, dev_id: int, key: int, value: float, timestamp: float) -> bool:
+        header = self._header
+        tail = int(header[_TAIL])
+        with self._ordered:
+            head = int(header[_HEAD])
+        if tail - head >= self.capacity:
+            return False
+        self._records[tail % self.capacity] = (dev_id, key, 0, value, timestamp)
+        with self._ordered:
+            header[_TAIL] = tail + 1
+        return True
+
+    def drop(self, count: int = 1):
+        self._header[_DROPPED] += count
+
+    def pop(self, limit: Optional[int] = None) -> np.ndarray:
+        header = self._header
+        head = int(header[_HEAD])
+        with self._ordered:
+            tail = int(header[_TAIL])
+        if limit is not None:
+            tail = min(tail, head + limit)
+        if tail == head:
+            return self._records[:0].copy()
+        start, end = head % self.capacity, tail % self.capacity
+        if start < end:
+            records = self._records[start:end].copy()
+        else:
+            records = np.concatenate((self._records[start:], self._records[:end]))
+        with self._ordered:
+            header[_HEAD] = tail
+        return records
+
+    def close(self):
+        del self._header, self._floats, self._records
+        self.memory.close()
+        if self._owner:
+            self.memory.unlink()
@@ -0,0 +1,308 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from collector_core.client import AsyncClientBase
+from sensors.metrics import Counter, Histogram
+
+from collector_daemon.logger import log_error, log_warning
+
+OnReading = Callable[[AsyncClientBase, str, float, float], Awaitable[None]]
+
+POLL_SECONDS = Histogram(
+    "collector_poll_seconds", "Sensor read latency", ["client", "sensor"]
+)
+SCHEDULER_LAG = Histogram(
+    "collector_scheduler_lag_seconds", "Delay between deadline and dispatch"
+)
+READS = Counter("collector_reads_total", "Sensor reads")
+READ_ERRORS = Counter("collector_read_errors_total", "Failed bulk reads")
+MISSED = Counter("collector_missed_deadlines_total", "Skipped poll deadlines")
+
+MISSED_LOG_INTERVAL = 10.0
+# Pause before reopening a stream that failed
+STREAM_RETRY_DELAY = 1.0
+
+
+@dataclass
+class PollJob:
+    client: AsyncClientBase
+    sensor_name: str
+    interval: float
+    deadline: float
+
+    in_flight: bool = False
+    cancelled: bool = False
+
+    reads: int = 0
+    missed: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+
+    poll_metric: object = None
+
+
+@dataclass
+class SchedulerStats:
+    reads: int = 0
+    missed: int = 0
+    errors: int = 0
+    max_lag: float = 0.0
+    # Exponential moving average of dispatch lag (actual start - deadline)
+    drift: float = 0.0
+
+
+@dataclass
+class PollScheduler:
+    on_reading: OnReading
+    default_interval: float = 1.0
+    max_concurrency_per_client: int = 4
+    drift_alpha: float = 0.05
+
+    stats: SchedulerStats = field(default_factory=SchedulerStats)
+
+    _heap: list = field(default_factory=list)
+    _jobs: dict[tuple[int, str], PollJob] = field(default_factory=dict)
+    _semaphores: dict[int, asyncio.Semaphore] = field(default_factory=dict)
+    _intervals: dict[tuple[int, str], float] = field(default_factory=dict)
+    _tasks: set[asyncio.Task] = field(default_factory=set)
+    # Streaming clients are not polled, one task per client consumes its stream
+    _streams: dict[int, asyncio.Task] = field(default_factory=dict)
+    _stream_updates: set[int] = field(default_factory=set)
+    _counter: itertools.count = field(default_factory=itertools.count)
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    _missed_logged: int = 0
+    _missed_logged_at: float = 0.0
+
+    def set_interval(self, dev_id: int, sensor_name: str, interval: float):
+        if interval <= 0:
+            raise ValueError(f"Sampling interval must be positive, got {interval}")
+        self._intervals[(dev_id, sensor_name)] = interval
+        job = self._jobs.get((dev_id, sensor_name))
+        if job is not None and job.interval != interval:
+            job.interval = interval
+            if job.client.streams():
+                self._update_stream(job.client)
+
+    async def add_client(self, client: AsyncClientBase):
+        dev_id = client.mcu.dev_id
+        self._semaphores.setdefault(
+            dev_id, asyncio.Semaphore(self.max_concurrency_per_client)
+        )
+        # Sensors of one client share their first deadline, so with equal
+        # intervals they stay aligned and are read in the same bulk call.
+        start = time.monotonic()
+        for sensor_name in await client.get_list_of_sensors_names():
+            self.add_sensor(client, sensor_name, start=start)
+
+    def remove_client(self, client: AsyncClientBase):
+        dev_id = client.mcu.dev_id
+        for key in [key for key in self._jobs if key[0] == dev_id]:
+            self._jobs.pop(key).cancelled = True
+            POLL_SECONDS.remove(str(dev_id), key[1])
+        self._semaphores.pop(dev_id, None)
+        self._stream_updates.discard(dev_id)
+        task = self._streams.pop(dev_id, None)
+        if task is not None:
+            task.cancel()
+
+    def add_sensor(
+        self, client: AsyncClientBase, sensor_name: str, start: Optional[float] = None
+    ):
+        key = (client.mcu.dev_id, sensor_name)
+        if key in self._jobs:
+            return
+        interval = self._intervals.get(key, self.default_interval)
+        job = PollJob(
+            client=client,
+            sensor_name=sensor_name,
+            interval=interval,
+            deadline=time.monotonic() if start is None else start,
+            poll_metric=POLL_SECONDS.labels(str(client.mcu.dev_id), sensor_name),
+        )
+        self._jobs[key] = job
+        if client.streams():
+            self._update_stream(client)
+        else:
+            self._push(job)
+
+    def remove_sensor(self, client: AsyncClientBase, sensor_name: str):
+        job = self._jobs.pop((client.mcu.dev_id, sensor_name), None)
+        if job is not None:
+            job.cancelled = True
+            POLL_SECONDS.remove(str(client.mcu.dev_id), sensor_name)
+            if client.streams():
+                self._update_stream(client)
+
+    def sensor_names(self, dev_id: int) -> list[str]:
+        return [name for key_dev_id, name in self._jobs if key_dev_id == dev_id]
+
+    def _update_stream(self, client: AsyncClientBase):
+        # Sensor and interval changes restart the client's stream. Changes
+        # made in the same tick, e.g. by add_client, share one restart.
+        dev_id = client.mcu.dev_id
+        if dev_id in self._stream_updates:
+            return
+        self._stream_updates.add(dev_id)
+        task = asyncio.create_task(self._stream(client, self._streams.get(dev_id)))
+        self._streams[dev_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _stream(self, client: AsyncClientBase, previous: Optional[asyncio.Task]):
+        dev_id = client.mcu.dev_id
+        if previous is not None:
+            previous.cancel()
+            await asyncio.gather(previous, return_exceptions=True)
+        await asyncio.sleep(0)
+        self._stream_updates.discard(dev_id)
+        jobs = [job for key, job in self._jobs.items() if key[0] == dev_id]
+        if not jobs:
+            return
+        names = [job.sensor_name for job in jobs]
+        # The MCU samples all streamed sensors together at the finest interval
+        interval = min(job.interval for job in jobs)
+        while True:
+            try:
+                async for reading in client.stream(names, interval):
+                    self.stats.reads += len(reading.values)
+                    READS.inc(len(reading.values))
+                    for name, data in reading.values.items():
+                        await self.on_reading(client, name, data, reading.timestamp)
+            except Exception as e:
+                self.stats.errors += 1
+                READ_ERRORS.inc()
+                log_error(f"Stream {names} -> {dev_id} failed: {e}")
+            await asyncio.sleep(STREAM_RETRY_DELAY)
+
+    def _push(self, job: PollJob):
+        heapq.heappush(self._heap, (job.deadline, next(self._counter), job))
+        if self._heap[0][2] is job:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except TimeoutError:
+                    pass
+                continue
+
+            now = time.monotonic()
+            due: dict[int, list[PollJob]] = {}
+            while self._heap and self._heap[0][0] <= now:
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                if self._accept(job, now):
+                    due.setdefault(job.client.mcu.dev_id, []).append(job)
+                self._reschedule(job, now)
+
+            for jobs in due.values():
+                self._dispatch(jobs)
+
+    def _reschedule(self, job: PollJob, now: float):
+        # Fixed-rate schedule: the next deadline is derived from the previous
+        # one, not from "now", so dispatch jitter does not accumulate.
+        job.deadline += job.interval
+        if job.deadline <= now:
+            skipped = int((now - job.deadline) // job.interval) + 1
+            job.deadline += skipped * job.interval
+            job.missed += skipped
+            self.stats.missed += skipped
+            MISSED.inc(skipped)
+            self._log_missed(now)
+        self._push(job)
+
+    def _log_missed(self, now: float):
+        # An overloaded scheduler misses deadlines on every tick, one summary
+        # line per interval instead of one per job
+        if now - self._missed_logged_at < MISSED_LOG_INTERVAL:
+            return
+        log_warning(
+            f"Missed {self.stats.missed - self._missed_logged} deadline(s) "
+            f"in the last {MISSED_LOG_INTERVAL:.0f}s"
+        )
+        self._missed_logged = self.stats.missed
+        self._missed_logged_at = now
+
+    def _accept(self, job: PollJob, now: float) -> bool:
+        if job.in_flight:
+            # Previous read of this sensor is still running, treat the slot as
+            # missed instead of piling up concurrent reads of the same sensor.
+            job.missed += 1
+            self.stats.missed += 1
+            MISSED.inc()
+            self._log_missed(now)
+            return False
+
+        lag = now - job.deadline
+        job.last_lag = lag
+        job.max_lag = max(job.max_lag, lag)
+        self.stats.max_lag = max(self.stats.max_lag, lag)
+        self.stats.drift += self.drift_alpha * (lag - self.stats.drift)
+        SCHEDULER_LAG.observe(lag)
+        job.in_flight = True
+        return True
+
+    def _dispatch(self, jobs: list[PollJob]):
+        # All sensors of one client that are due in the same tick are read
+        # with a single bulk call, i.e. one round trip per MCU per cycle.
+        task = asyncio.create_task(self._read(jobs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read(self, jobs: list[PollJob]):
+        client = jobs[0].client
+        names = [job.sensor_name for job in jobs]
+        try:
+            # The client or some of its sensors may have been removed since
+            # the dispatch, their readings are dropped
+            semaphore = self._semaphores.get(client.mcu.dev_id)
+            if semaphore is None:
+                return
+            async with semaphore:
+                names = [job.sensor_name for job in jobs if not job.cancelled]
+                if not names:
+                    return
+                started = time.perf_counter()
+                reading = await client.get_sensors_data(names)
+                elapsed = time.perf_counter() - started
+            live = {job.sensor_name: job for job in jobs if not job.cancelled}
+            for job in live.values():
+                job.reads += 1
+                job.poll_metric.observe(elapsed)
+            self.stats.reads += len(live)
+            READS.inc(len(live))
+            for name, data in reading.values.items():
+                job = live.get(name)
+                if job is not None and not job.cancelled:
+                    await self.on_reading(client, name, data, reading.timestamp)
+        except Exception as e:
+            self.stats.errors += 1
+            READ_ERRORS.inc()
+            log_error(f"GED {names} -> {client.mcu.dev_id} failed: {e}")
+        finally:
+            for job in jobs:
+                job.in_flight = False
+
+    async def stop(self):
+        self._streams.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,758 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import signal
+import time
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import SimpleQueue
+from typing import Optional
+
+import numpy as np
+from collector_core import FINGERPRINT
+from collector_core.client import AsyncClientBase
+from collector_core.db import Spool
+from collector_core.sensor import SensorBase
+from sensors.batch import SensorBatch
+from sensors.metrics import Counter, Gauge
+
+from collector_daemon.compression import (
+    CompressionPolicy,
+    CompressionStats,
+    EdgeCompression,
+    Point,
+)
+from collector_daemon.daemon import attach_sensor, detach_sensor, run
+from collector_daemon.logger import log_debug, log_error, log_info, log_warning
+from collector_daemon.ring import ORDERED_STORES, RingBuffer
+from collector_daemon.scheduler import (
+    POLL_SECONDS,
+    SCHEDULER_LAG,
+    PollScheduler,
+    SchedulerStats,
+)
+from collector_daemon.uplink import Uplink
+
+# Sharded collector: clients are spread across worker processes, each running
+# its own PollScheduler on its own event loop. Readings go back to this
+# process, which runs the single Uplink, through one shared-memory ring per
+# worker. Sensor names travel once over the event queue, the ring only holds
+# (dev_id, key, value, timestamp) records. Edge compression runs here as
+# well, so its state survives a client moving between shards. The scheduler
+# histograms are observed in the workers and merged here for export.
+
+SHARD_LOAD = Gauge("collector_shard_load", "Readings per second", ["shard"])
+SHARD_CLIENTS = Gauge("collector_shard_clients", "Clients per shard", ["shard"])
+RING_DEPTH = Gauge("collector_ring_depth", "Records waiting in the ring", ["shard"])
+RING_DROPPED = Gauge(
+    "collector_ring_dropped", "Records dropped on a full ring", ["shard"]
+)
+SHARD_READS = Gauge("collector_shard_reads", "Sensor reads", ["shard"])
+SHARD_MISSED = Gauge("collector_shard_missed", "Skipped poll deadlines", ["shard"])
+SHARD_MAX_LAG = Gauge(
+    "collector_shard_max_lag_seconds", "Largest scheduler lag", ["shard"]
+)
+SHARD_DRIFT = Gauge(
+    "collector_shard_drift_seconds", "Moving average of scheduler lag", ["shard"]
+)
+SHARD_GAUGES = (
+    SHARD_LOAD,
+    SHARD_CLIENTS,
+    RING_DEPTH,
+    RING_DROPPED,
+    SHARD_READS,
+    SHARD_MISSED,
+    SHARD_MAX_LAG,
+    SHARD_DRIFT,
+)
+MOVES = Counter("collector_rebalance_moves_total", "Clients moved between shards")
+
+# Commands to a worker
+_ADD, _REMOVE, _INTERVAL, _STOP = "add", "remove", "interval", "stop"
+_ADD_SENSOR, _REMOVE_SENSOR = "add_sensor", "remove_sensor"
+# Events from workers
+_SENSOR, _ADDED, _REMOVED, _FAILED = "sensor", "added", "removed", "failed"
+_ERROR, _HISTOGRAMS = "error", "histograms"
+
+STATS_INTERVAL = 1.0
+# Histogram states are whole copies, about 50 ms per 10k sensors to send and
+# merge, so they go less often than the counters
+HISTOGRAM_INTERVAL = 10.0
+
+
+@dataclass
+class _SensorChanges:
+    # Sensors added or removed at runtime, replayed when a client starts on
+    # another shard
+    added: dict[str, Optional[SensorBase]] = field(default_factory=dict)
+    removed: set[str] = field(default_factory=set)
+
+
+def _worker_main(
+    index: int,
+    ring_name: str,
+    capacity: int,
+    commands: SimpleQueue,
+    events: SimpleQueue,
+    default_interval: float,
+    max_concurrency_per_client: int,
+    max_ring_wait: float,
+    ring_lock,
+):
+    # The parent owns shutdown, a Ctrl-C in the terminal must not kill the
+    # workers before the rings are drained
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = RingBuffer.attach(ring_name, capacity, ring_lock)
+    try:
+        run(
+            _Worker(
+                index=index,
+                ring=ring,
+                commands=commands,
+                events=events,
+                default_interval=default_interval,
+                max_concurrency_per_client=max_concurrency_per_client,
+                max_ring_wait=max_ring_wait,
+            ).run()
+        )
+    finally:
+        ring.close()
+
+
+@dataclass
+class _Worker:
+    index: int
+    ring: RingBuffer
+    commands: SimpleQueue
+    events: SimpleQueue
+    default_interval: float
+    max_concurrency_per_client: int
+    max_ring_wait: float
+
+    clients: dict[int, AsyncClientBase] = field(default_factory=dict)
+    _keys: dict[tuple[int, str], int] = field(default_factory=dict)
+
+    async def run(self):
+        scheduler = PollScheduler(
+            on_reading=self._on_reading,
+            default_interval=self.default_interval,
+            max_concurrency_per_client=self.max_concurrency_per_client,
+        )
+        tasks = [
+            asyncio.create_task(scheduler.run()),
+            asyncio.create_task(self._publish_stats(scheduler)),
+            asyncio.create_task(self._heartbeat()),
+        ]
+        try:
+            while True:
+                command = await asyncio.to_thread(self.commands.get)
+                kind = command[0]
+                if kind == _STOP:
+                    break
+                try:
+                    if kind == _ADD:
+                        await self._add(scheduler, *command[1:])
+                    elif kind == _REMOVE:
+                        self._remove(scheduler, command[1])
+                    elif kind == _INTERVAL:
+                        scheduler.set_interval(*command[1:])
+                    elif kind == _ADD_SENSOR:
+                        self._add_sensor(scheduler, *command[1:])
+                    elif kind == _REMOVE_SENSOR:
+                        self._remove_sensor(scheduler, *command[1:])
+                except Exception as e:
+                    self.events.put((_ERROR, self.index, command[1], str(e)))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await scheduler.stop()
+            self._publish(scheduler)
+
+    async def _add(
+        self,
+        scheduler: PollScheduler,
+        client: AsyncClientBase,
+        intervals: dict[str, float],
+        changes: Optional[_SensorChanges],
+    ):
+        dev_id = client.mcu.dev_id
+        try:
+            for sensor_name, interval in intervals.items():
+                scheduler.set_interval(dev_id, sensor_name, interval)
+            names = set(await client.get_list_of_sensors_names())
+            if changes is not None:
+                # A client handed back from another shard already carries the
+                # sensors added there
+                for sensor_name, sensor in changes.added.items():
+                    if sensor_name not in names:
+                        attach_sensor(client, sensor_name, sensor)
+                for sensor_name in changes.removed:
+                    detach_sensor(client, sensor_name)
+            await scheduler.add_client(client)
+            if changes is not None:
+                for sensor_name in changes.added:
+                    scheduler.add_sensor(client, sensor_name)
+                for sensor_name in changes.removed:
+                    scheduler.remove_sensor(client, sensor_name)
+        except Exception as e:
+            scheduler.remove_client(client)
+            self.events.put((_FAILED, self.index, dev_id, str(e)))
+            return
+        self.clients[dev_id] = client
+        self.events.put((_ADDED, self.index, dev_id, scheduler.sensor_names(dev_id)))
+
+    def _add_sensor(
+        self,
+        scheduler: PollScheduler,
+        dev_id: int,
+        sensor_name: str,
+        sensor: Optional[SensorBase],
+    ):
+        client = self.clients[dev_id]
+        attach_sensor(client, sensor_name, sensor)
+        scheduler.add_sensor(client, sensor_name)
+
+    def _remove_sensor(self, scheduler: PollScheduler, dev_id: int, sensor_name: str):
+        client = self.clients[dev_id]
+        scheduler.remove_sensor(client, sensor_name)
+        detach_sensor(client, sensor_name)
+
+    def _remove(self, scheduler: PollScheduler, dev_id: int):
+        client = self.clients.pop(dev_id, None)
+        if client is not None:
+            scheduler.remove_client(client)
+            # Hand the live client back so it keeps its state on the next
+            # shard, clients holding unpicklable handles are recreated from
+            # the parent's copy instead
+            try:
+                pickle.dumps(client)
+            except Exception:
+                client = None
+        self.events.put((_REMOVED, self.index, dev_id, client))
+
+    async def _on_reading(
+        self, client: AsyncClientBase, sensor: str, data: float, timestamp: float
+    ):
+        dev_id = client.mcu.dev_id
+        key = self._keys.get((dev_id, sensor))
+        if key is None:
+            # Published before the first record that uses it, the parent reads
+            # events after taking records off the ring
+            key = self._keys[(dev_id, sensor)] = len(self._keys)
+            self.events.put((_SENSOR, self.index, key, dev_id, sensor))
+        ring = self.ring
+        if ring.push(dev_id, key, data, timestamp):
+            return
+        # Uplink process is behind: wait a little for room, then drop
+        deadline = time.monotonic() + self.max_ring_wait
+        while not ring.push(dev_id, key, data, timestamp):
+            if time.monotonic() >= deadline:
+                ring.drop()
+                return
+            await asyncio.sleep(0.001)
+
+    def _publish(self, scheduler: PollScheduler):
+        stats = scheduler.stats
+        self.ring.publish_stats(
+            stats.reads, stats.missed, stats.errors, stats.max_lag, stats.drift
+        )
+
+    async def _publish_stats(self, scheduler: PollScheduler):
+        histograms_at = 0.0
+        while True:
+            self._publish(scheduler)
+            if time.monotonic() >= histograms_at:
+                histograms_at = time.monotonic() + HISTOGRAM_INTERVAL
+                self.events.put(
+                    (
+                        _HISTOGRAMS,
+                        self.index,
+                        POLL_SECONDS.state(),
+                        SCHEDULER_LAG.state(),
+                    )
+                )
+            await asyncio.sleep(STATS_INTERVAL)
+
+    async def _heartbeat(self):
+        while True:
+            for client in list(self.clients.values()):
+                log_debug(f"Heartbeat -> {client.mcu.dev_id}")
+                await client.get_heartbeat()
+            await asyncio.sleep(5)
+
+
+@dataclass
+class _Shard:
+    index: int
+    ring: RingBuffer
+    commands: SimpleQueue
+    process: BaseProcess
+    clients: set[int] = field(default_factory=set)
+    # Sensor names by ring key
+    sensors: dict[int, tuple[int, str]] = field(default_factory=dict)
+    # Latest scheduler histogram states of the worker
+    poll_seconds: dict = field(default_factory=dict)
+    scheduler_lag: dict = field(default_factory=dict)
+
+
+class ShardedCollector:
+    clients: list[AsyncClientBase]
+    uplink: Uplink
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        default_interval: float = 1.0,
+        max_concurrency_per_client: int = 4,
+        uplink: Optional[Uplink] = None,
+        ring_capacity: int = 1 << 16,
+        max_ring_wait: float = 0.5,
+        drain_batch: int = 4096,
+        drain_interval: float = 0.002,
+        rebalance_interval: float = 30.0,
+        imbalance: float = 0.25,
+        rate_alpha: float = 0.5,
+        compression: Optional[EdgeCompression] = None,
+    ):
+        self.clients = []
+        self.uplink = uplink or Uplink(spool=Spool())
+        self.compression = compression or EdgeCompression()
+        self.workers = workers or os.cpu_count() or 1
+        self.default_interval = default_interval
+        self.max_concurrency_per_client = max_concurrency_per_client
+        self.ring_capacity = ring_capacity
+        self.max_ring_wait = max_ring_wait
+        self.drain_batch = drain_batch
+        self.drain_interval = drain_interval
+        self.rebalance_interval = rebalance_interval
+        # Shards are rebalanced when the busiest one does this much more
+        # work than the idlest, relative to the mean load
+        self.imbalance = imbalance
+        self.rate_alpha = rate_alpha
+
+        self._shards: list[_Shard] = []
+        self._events: Optional[SimpleQueue] = None
+        self._known: dict[int, AsyncClientBase] = {}
+        self._owner: dict[int, int] = {}
+        self._intervals: dict[int, dict[str, float]] = {}
+        # dev_id -> target shard of a move waiting for the source to let go
+        self._moving: dict[int, int] = {}
+        self._changes: dict[int, _SensorChanges] = {}
+        self._names: dict[int, set[str]] = {}
+        self._counts: dict[int, int] = {}
+        self._rates: dict[int, float] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def stats(self) -> SchedulerStats:
+        # Scheduler counters summed over the shards, lag and drift of the
+        # worst shard, refreshed by the workers every STATS_INTERVAL
+        stats = SchedulerStats()
+        for shard in self._shards:
+            reads, missed, errors, max_lag, drift = shard.ring.stats
+            stats.reads += reads
+            stats.missed += missed
+            stats.errors += errors
+            stats.max_lag = max(stats.max_lag, max_lag)
+            stats.drift = max(stats.drift, drift)
+        return stats
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def main_thread(self):
+        run(self.run())
+
+    async def run(self):
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    def start(self):
+        # Runs on the caller's loop, e.g. from a FastAPI lifespan
+        if self._tasks:
+            return
+        self._start()
+        log_info(f"Started {len(self._shards)} collector shard(s)")
+        for client in self.clients:
+            self._place(client)
+        self._tasks = [
+            asyncio.create_task(self.uplink.run()),
+            asyncio.create_task(self._drain()),
+            asyncio.create_task(self._rebalance()),
+        ]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._shards:
+            await asyncio.to_thread(self._stop)
+
+    def get_client(self, dev_id: int) -> AsyncClientBase:
+        # The parent's copy, the live client is in its worker
+        for client in self.clients:
+            if client.mcu.dev_id == dev_id:
+                return client
+        raise KeyError(dev_id)
+
+    async def add_client(self, client: AsyncClientBase):
+        dev_id = client.mcu.dev_id
+        if any(c.mcu.dev_id == dev_id for c in self.clients):
+            raise ValueError(f"Client {dev_id} is already collected")
+        self.clients.append(client)
+        if self._shards:
+            self._place(client)
+
+    async def remove_client(self, dev_id: int) -> AsyncClientBase:
+        client = self.get_client(dev_id)
+        self.clients.remove(client)
+        for state in (self._known, self._moving, self._rates, self._changes):
+            state.pop(dev_id, None)
+        self._names.pop(dev_id, None)
+        index = self._owner.pop(dev_id, None)
+        if index is not None:
+            self._shards[index].clients.discard(dev_id)
+            self._shards[index].commands.put((_REMOVE, dev_id))
+        for sensor_name, points in self.compression.remove(dev_id).items():
+            await self._send_points(dev_id, sensor_name, points)
+        return client
+
+    async def add_sensor(
+        self,
+        dev_id: int,
+        sensor_name: str,
+        sensor: Optional[SensorBase] = None,
+        interval: Optional[float] = None,
+    ):
+        client = self.get_client(dev_id)
+        if sensor is not None:
+            if not hasattr(client, "add_sensor"):
+                raise ValueError(f"Client {dev_id} does not accept new sensors")
+            if sensor_name in self._names.get(dev_id, ()):
+                raise ValueError(f"There is a sensor with the same name: {sensor_name}")
+        if interval is not None:
+            self.set_interval(dev_id, sensor_name, interval)
+        # Remembered so the sensor survives a move to another shard
+        changes = self._changes.setdefault(dev_id, _SensorChanges())
+        changes.removed.discard(sensor_name)
+        changes.added[sensor_name] = sensor
+        self._names.setdefault(dev_id, set()).add(sensor_name)
+        self._send(dev_id, (_ADD_SENSOR, dev_id, sensor_name, sensor))
+
+    async def remove_sensor(self, dev_id: int, sensor_name: str):
+        self.get_client(dev_id)
+        changes = self._changes.setdefault(dev_id, _SensorChanges())
+        changes.added.pop(sensor_name, None)
+        changes.removed.add(sensor_name)
+        self._names.get(dev_id, set()).discard(sensor_name)
+        self._send(dev_id, (_REMOVE_SENSOR, dev_id, sensor_name))
+        for name, points in self.compression.remove(dev_id, sensor_name).items():
+            await self._send_points(dev_id, name, points)
+
+    def sensor_names(self, dev_id: int) -> list[str]:
+        # Sensors reported by the worker plus the ones added since
+        return sorted(self._names.get(dev_id, ()))
+
+    def set_interval(self, dev_id: int, sensor_name: str, interval: float):
+        if interval <= 0:
+            raise ValueError(f"Sampling interval must be positive, got {interval}")
+        self._intervals.setdefault(dev_id, {})[sensor_name] = interval
+        self._send(dev_id, (_INTERVAL, dev_id, sensor_name, interval))
+
+    async def set_compression(
+        self, dev_id: int, sensor_name: str, policy: Optional[CompressionPolicy]
+    ):
+        self.get_client(dev_id)
+        points = self.compression.set_policy(dev_id, sensor_name, policy)
+        await self._send_points(dev_id, sensor_name, points)
+
+    def compression_stats(self) -> dict[tuple[int, str], CompressionStats]:
+        return self.compression.stats()
+
+    async def _send_points(self, dev_id: int, sensor: str, points: list[Point]):
+        for value, timestamp in points:
+            await self.uplink.put(
+                {
+                    "fingerprint": FINGERPRINT,
+                    "mcu_name": str(dev_id),
+                    "sensor_name": sensor,
+                    "value": value,
+                    "timestamp": timestamp,
+                }
+            )
+
+    def _send(self, dev_id: int, command: tuple):
+        # A client in the middle of a move gets the change with its _ADD
+        index = self._owner.get(dev_id)
+        if index is not None and dev_id not in self._moving:
+            self._shards[index].commands.put(command)
+
+    def _start(self):
+        # Workers are spawned, not forked: the parent has a running event
+        # loop and the uplink's threads
+        context = multiprocessing.get_context("spawn")
+        self._events = context.SimpleQueue()
+        for index in range(self.workers):
+            ring = RingBuffer.create(
+                self.ring_capacity, None if ORDERED_STORES else context.Lock()
+            )
+            commands = context.SimpleQueue()
+            process = context.Process(
+                target=_worker_main,
+                args=(
+                    index,
+                    ring.name,
+                    self.ring_capacity,
+                    commands,
+                    self._events,
+                    self.default_interval,
+                    self.max_concurrency_per_client,
+                    self.max_ring_wait,
+                    ring.lock,
+                ),
+                name=f"collector-shard-{index}",
+                daemon=True,
+            )
+            process.start()
+            shard = _Shard(index=index, ring=ring, commands=commands, process=process)
+            self._shards.append(shard)
+            self._register_metrics(shard)
+
+    def _register_metrics(self, shard: _Shard):
+        label = str(shard.index)
+        ring = shard.ring
+        SHARD_LOAD.labels(label).set_function(lambda: self._load(shard))
+        SHARD_CLIENTS.labels(label).set_function(lambda: len(shard.clients))
+        RING_DEPTH.labels(label).set_function(ring.__len__)
+        RING_DROPPED.labels(label).set_function(lambda: ring.dropped)
+        SHARD_READS.labels(label).set_function(lambda: ring.stats[0])
+        SHARD_MISSED.labels(label).set_function(lambda: ring.stats[1])
+        SHARD_MAX_LAG.labels(label).set_function(lambda: ring.stats[3])
+        SHARD_DRIFT.labels(label).set_function(lambda: ring.stats[4])
+
+    def _stop(self):
+        for shard in self._shards:
+            shard.commands.put((_STOP,))
+        for shard in self._shards:
+            shard.process.join(timeout=5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+                shard.process.join()
+        self._handle_events()
+        for shard in self._shards:
+            label = str(shard.index)
+            for gauge in SHARD_GAUGES:
+                gauge.remove(label)
+            shard.ring.close()
+            shard.commands.close()
+        self._events.close()
+        # Queue locks are released once the last reference goes
+        self._shards, self._events = [], None
+        self._owner.clear()
+        self._moving.clear()
+
+    def _place(self, client: AsyncClientBase):
+        dev_id = client.mcu.dev_id
+        self._known[dev_id] = client
+        self._assign(dev_id, self._least_loaded())
+
+    def _assign(self, dev_id: int, index: int):
+        self._owner[dev_id] = index
+        shard = self._shards[index]
+        shard.clients.add(dev_id)
+        shard.commands.put(
+            (
+                _ADD,
+                self._known[dev_id],
+                self._intervals.get(dev_id, {}),
+                self._changes.get(dev_id),
+            )
+        )
+
+    def _load(self, shard: _Shard) -> float:
+        return sum(self._rates.get(dev_id, 0.0) for dev_id in shard.clients)
+
+    def _least_loaded(self) -> int:
+        shard = min(self._shards, key=lambda s: (self._load(s), len(s.clients)))
+        return shard.index
+
+    def _handle_events(self):
+        events = self._events
+        merge = False
+        while not events.empty():
+            event = events.get()
+            kind, index = event[0], event[1]
+            shard = self._shards[index]
+            if kind == _SENSOR:
+                _, _, key, dev_id, sensor = event
+                shard.sensors[key] = (dev_id, sensor)
+                if dev_id in self._owner:
+                    self._names.setdefault(dev_id, set()).add(sensor)
+            elif kind == _ADDED:
+                _, _, dev_id, names = event
+                log_debug(f"Client {dev_id} -> shard {index}")
+                if self._owner.get(dev_id) == index:
+                    self._names[dev_id] = set(names)
+            elif kind == _FAILED:
+                _, _, dev_id, message = event
+                log_error(
+                    f"Client {dev_id} failed to start on shard {index}: {message}"
+                )
+                if self._owner.get(dev_id) == index:
+                    self._owner.pop(dev_id)
+                    self._known.pop(dev_id, None)
+                    shard.clients.discard(dev_id)
+                    self.clients = [c for c in self.clients if c.mcu.dev_id != dev_id]
+            elif kind == _ERROR:
+                _, _, dev_id, message = event
+                log_error(f"Client {dev_id} on shard {index}: {message}")
+            elif kind == _HISTOGRAMS:
+                _, _, shard.poll_seconds, shard.scheduler_lag = event
+                merge = True
+            elif kind == _REMOVED:
+                _, _, dev_id, client = event
+                target = self._moving.pop(dev_id, None)
+                if target is None or dev_id not in self._known:
+                    continue
+                if client is not None:
+                    self._known[dev_id] = client
+                self._assign(dev_id, target)
+        if merge:
+            self._merge_histograms()
+
+    def _merge_histograms(self):
+        # Shards poll disjoint clients, so only the lag histogram has a child
+        # in every shard
+        for metric, states in (
+            (POLL_SECONDS, [shard.poll_seconds for shard in self._shards]),
+            (SCHEDULER_LAG, [shard.scheduler_lag for shard in self._shards]),
+        ):
+            merged: dict[tuple, tuple[list[int], float]] = {}
+            for state in states:
+                for values, (counts, total) in state.items():
+                    if values in merged:
+                        merged_counts, merged_total = merged[values]
+                        counts = [a + b for a, b in zip(merged_counts, counts)]
+                        total += merged_total
+                    merged[values] = (counts, total)
+            metric.load(merged)
+
+    def _decode(self, shard: _Shard, records: np.ndarray) -> SensorBatch:
+        # Ring records to columns. Sensors without a compression policy are
+        # copied over as they are, the rest go through their compressor one
+        # reading at a time.
+        compression = self.compression
+        keys, index = np.unique(records["key"], return_inverse=True)
+        names = [shard.sensors[key] for key in keys.tolist()]
+        series = [(FINGERPRINT, str(dev_id), sensor) for dev_id, sensor in names]
+        compressed = np.fromiter(
+            (
+                compression.policy(dev_id, sensor) is not None
+                for dev_id, sensor in names
+            ),
+            bool,
+            len(names),
+        )
+        ids = index.astype(np.uint32)
+        values, timestamps = records["value"], records["timestamp"]
+        if not compressed.any():
+            return SensorBatch(series, ids, values.copy(), timestamps.copy())
+
+        passed = ~compressed[index]
+        kept_ids, kept_values, kept_timestamps = [], [], []
+        for i, value, timestamp in zip(
+            index[~passed].tolist(),
+            values[~passed].tolist(),
+            timestamps[~passed].tolist(),
+        ):
+            dev_id, sensor = names[i]
+            for point_value, point_timestamp in compression.feed(
+                dev_id, sensor, value, timestamp
+            ):
+                kept_ids.append(i)
+                kept_values.append(point_value)
+                kept_timestamps.append(point_timestamp)
+        return SensorBatch(
+            series,
+            np.concatenate((ids[passed], np.array(kept_ids, np.uint32))),
+            np.concatenate((values[passed], kept_values)),
+            np.concatenate((timestamps[passed], kept_timestamps)),
+        )
+
+    async def _drain(self):
+        while True:
+            drained = 0
+            for shard in self._shards:
+                records = shard.ring.pop(self.drain_batch)
+                if not len(records):
+                    continue
+                drained += len(records)
+                # Every key in these records was announced before the record
+                # was pushed
+                self._handle_events()
+                dev_ids, counts = np.unique(records["dev_id"], return_counts=True)
+                for dev_id, count in zip(dev_ids.tolist(), counts.tolist()):
+                    self._counts[dev_id] = self._counts.get(dev_id, 0) + count
+                await self.uplink.put_batch(self._decode(shard, records))
+            self._handle_events()
+            if drained == 0:
+                await asyncio.sleep(self.drain_interval)
+            else:
+                await asyncio.sleep(0)
+
+    async def _rebalance(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            counts, self._counts = self._counts, {}
+            for dev_id in self._owner:
+                rate = counts.get(dev_id, 0) / elapsed
+                previous = self._rates.get(dev_id)
+                self._rates[dev_id] = (
+                    rate
+                    if previous is None
+                    else previous + self.rate_alpha * (rate - previous)
+                )
+            if len(self._shards) > 1 and not self._moving:
+                self._move_one()
+
+    def _move_one(self):
+        # Moves at most one client per round: rates are re-measured after
+        # every move, so the shards converge without oscillating
+        loads = [self._load(shard) for shard in self._shards]
+        busiest = max(range(len(loads)), key=loads.__getitem__)
+        idlest = min(range(len(loads)), key=loads.__getitem__)
+        gap = loads[busiest] - loads[idlest]
+        mean = sum(loads) / len(loads)
+        if mean <= 0 or gap <= self.imbalance * mean:
+            return
+        # The best client halves the gap, one carrying more than the whole
+        # gap would only flip the imbalance
+        candidates = [
+            dev_id
+            for dev_id in self._shards[busiest].clients
+            if 0 < self._rates.get(dev_id, 0.0) < gap
+        ]
+        if not candidates:
+            return
+        dev_id = min(candidates, key=lambda d: abs(gap / 2 - self._rates[d]))
+        log_warning(
+            f"Shard loads {[round(load) for load in loads]} readings/s, "
+            f"moving client {dev_id} from shard {busiest} to {idlest}"
+        )
+        MOVES.inc()
+        shard = self._shards[busiest]
+        shard.clients.discard(dev_id)
+        self._owner[dev_id] = idlest
+        self._shards[idlest].clients.add(dev_id)
+        self._moving[dev_id] = idlest
+        shard.commands.put((_REMOVE, dev_id))
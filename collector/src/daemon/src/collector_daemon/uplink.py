@@ -0,0 +1,419 @@
+import asyncio
+import gzip
+import json
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional, Union
+
+import httpx
+from collector_core import API_URL, FINGERPRINT
+from collector_core.db import Spool, SpoolRecord
+from sensors.batch import CONTENT_TYPE as BATCH_CONTENT_TYPE
+from sensors.batch import SensorBatch
+from sensors.metrics import SIZE_BUCKETS, Counter, Gauge, Histogram
+
+from collector_daemon.logger import log_error, log_info, log_warning
+
+QUEUE_DEPTH = Gauge("collector_uplink_queue_depth", "Records waiting in memory")
+SPOOL_DEPTH = Gauge("collector_spool_depth", "Records waiting in the spool")
+BATCH_SIZE = Histogram(
+    "collector_uplink_batch_size", "Records per sent batch", buckets=SIZE_BUCKETS
+)
+BATCH_SECONDS = Histogram("collector_uplink_batch_seconds", "POST /ingest latency")
+SENT = Counter("collector_uplink_sent_total", "Records acknowledged by core")
+DROPPED = Counter("collector_uplink_dropped_total", "Records dropped by the uplink")
+RETRIES = Counter("collector_uplink_retries_total", "Retried POST attempts")
+
+# A batch leaves the uplink as records (SensorData-shaped dicts) or, when any
+# producer handed over columns, as one SensorBatch
+Records = Union[list[dict], SensorBatch]
+
+
+def _size(item: Union[dict, SensorBatch]) -> int:
+    return len(item) if isinstance(item, SensorBatch) else 1
+
+
+def _as_records(batch: Records) -> list[dict]:
+    return batch.to_records() if isinstance(batch, SensorBatch) else batch
+
+
+class _RecordQueue(asyncio.Queue):
+    # Holds records and SensorBatch items; size and maxsize count records.
+    # A batch is let in while there is room for at least one record.
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.records = 0
+
+    def _put(self, item):
+        super()._put(item)
+        self.records += _size(item)
+
+    def _get(self):
+        item = super()._get()
+        self.records -= _size(item)
+        return item
+
+    def qsize(self) -> int:
+        return self.records
+
+
+class SendResult(Enum):
+    SENT = "SENT"
+    REJECTED = "REJECTED"
+    FAILED = "FAILED"
+
+
+class WireFormat(Enum):
+    # JSON list of SensorData, or the columnar sensors.batch format
+    JSON = "JSON"
+    BATCH = "BATCH"
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "BLOCK"
+    DROP_NEWEST = "DROP_NEWEST"
+    DROP_OLDEST = "DROP_OLDEST"
+
+
+@dataclass
+class UplinkStats:
+    enqueued: int = 0
+    dropped: int = 0
+    sent: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    retries: int = 0
+    last_batch_size: int = 0
+    last_batch_latency: float = 0.0
+
+
+@dataclass
+class SpoolStats:
+    size: int = 0
+    disk_size: int = 0
+    write_rate: float = 0.0
+    replay_rate: float = 0.0
+
+
+@dataclass
+class Uplink:
+    api_url: str = API_URL
+    endpoint: str = "/ingest"
+
+    max_queue_size: int = 100_000
+    overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+
+    batch_size: int = 5_000
+    max_batch_age: float = 0.5
+    max_in_flight: int = 4
+
+    max_retries: int = 8
+    backoff_base: float = 0.2
+    backoff_max: float = 30.0
+
+    timeout: float = 10.0
+    max_connections: int = 8
+    compress_level: int = 5
+    wire_format: WireFormat = WireFormat.BATCH
+    # httpx transport override, e.g. httpx.MockTransport for a stub core
+    transport: Optional[httpx.AsyncBaseTransport] = None
+
+    # When set, every batch is persisted before it is sent and removed only
+    # once core has acknowledged it
+    spool: Optional[Spool] = None
+    replay_batch_size: int = 50_000
+    report_interval: float = 30.0
+    # Called with every batch core has committed
+    on_sent: Optional[Callable[[list[dict]], None]] = None
+
+    stats: UplinkStats = field(default_factory=UplinkStats)
+    spool_stats: SpoolStats = field(default_factory=SpoolStats)
+
+    _queue: Optional[asyncio.Queue] = None
+    _in_flight: Optional[asyncio.Semaphore] = None
+    _tasks: set[asyncio.Task] = field(default_factory=set)
+    _spooled: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so the queue belongs to the loop the daemon runs on
+        if self._queue is None:
+            self._queue = _RecordQueue(maxsize=self.max_queue_size)
+        return self._queue
+
+    async def put(self, record: dict):
+        queue = self.queue
+        if self.overflow_policy == OverflowPolicy.BLOCK:
+            await queue.put(record)
+        elif self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+            if queue.full():
+                self.stats.dropped += 1
+                DROPPED.inc()
+                return
+            queue.put_nowait(record)
+        else:
+            while queue.full():
+                dropped = _size(queue.get_nowait())
+                self.stats.dropped += dropped
+                DROPPED.inc(dropped)
+            queue.put_nowait(record)
+        self.stats.enqueued += 1
+
+    async def put_batch(self, batch: SensorBatch):
+        # Columns from the sharded collector, queued as one item. The drop
+        # policies drop whole batches from the old end, and cut the tail of
+        # a new one that does not fit.
+        if not len(batch):
+            return
+        queue = self.queue
+        if self.overflow_policy == OverflowPolicy.BLOCK:
+            await queue.put(batch)
+        elif self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+            room = self.max_queue_size - queue.qsize()
+            if room < len(batch):
+                dropped = len(batch) - max(room, 0)
+                self.stats.dropped += dropped
+                DROPPED.inc(dropped)
+                if room <= 0:
+                    return
+                batch = SensorBatch(
+                    batch.series,
+                    batch.ids[:room],
+                    batch.values[:room],
+                    batch.timestamps[:room],
+                )
+            queue.put_nowait(batch)
+        else:
+            while not queue.empty() and (
+                queue.qsize() + len(batch) > self.max_queue_size
+            ):
+                dropped = _size(queue.get_nowait())
+                self.stats.dropped += dropped
+                DROPPED.inc(dropped)
+            queue.put_nowait(batch)
+        self.stats.enqueued += len(batch)
+
+    async def run(self):
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        if self.spool is not None:
+            SPOOL_DEPTH.set_function(lambda: self.spool.size)
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+        async with httpx.AsyncClient(
+            base_url=self.api_url,
+            limits=limits,
+            timeout=self.timeout,
+            transport=self.transport,
+        ) as client:
+            log_info(f"Uplink -> {self.api_url}{self.endpoint}")
+            try:
+                if self.spool is None:
+                    await self._run_direct(client)
+                else:
+                    await asyncio.gather(
+                        self._run_spool_writer(),
+                        self._run_spool_sender(client),
+                        self._run_spool_reporter(),
+                    )
+            finally:
+                for task in list(self._tasks):
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_direct(self, client: httpx.AsyncClient):
+        while True:
+            batch = await self._next_batch()
+            await self._in_flight.acquire()
+            self._spawn(self._send(client, batch))
+
+    async def _run_spool_writer(self):
+        while True:
+            batch = await self._next_batch()
+            await asyncio.to_thread(self.spool.append, batch)
+            self._spooled.set()
+
+    async def _run_spool_sender(self, client: httpx.AsyncClient):
+        spool = self.spool
+        # Everything left on disk from a previous run is replayed first
+        cursor = 0
+        while True:
+            self._spooled.clear()
+            # A large backlog is replayed in bigger batches than live traffic
+            limit = (
+                self.replay_batch_size
+                if spool.size > self.batch_size
+                else self.batch_size
+            )
+            rows = await asyncio.to_thread(spool.read, cursor, limit)
+            if not rows:
+                await self._spooled.wait()
+                continue
+            cursor = rows[-1].id
+            await self._in_flight.acquire()
+            self._spawn(self._send_spooled(client, rows))
+
+    async def _send_spooled(self, client: httpx.AsyncClient, rows: list[SpoolRecord]):
+        batch = [
+            {
+                "fingerprint": FINGERPRINT,
+                "mcu_name": row.mcu_name,
+                "sensor_name": row.sensor_name,
+                "value": row.value,
+                "timestamp": row.timestamp,
+            }
+            for row in rows
+        ]
+        try:
+            while True:
+                result = await self.post(client, batch)
+                if result != SendResult.FAILED:
+                    break
+                # Rows are safe on disk, keep trying until core is back
+                self.stats.failed_batches += 1
+                await asyncio.sleep(self.backoff_max * random.uniform(0.5, 1.0))
+
+            if result == SendResult.SENT:
+                self.stats.sent += len(batch)
+                SENT.inc(len(batch))
+                if self.on_sent is not None:
+                    self.on_sent(batch)
+            else:
+                self.stats.dropped += len(batch)
+                DROPPED.inc(len(batch))
+                log_error(f"Uplink dropped rejected batch of {len(batch)} records")
+            await asyncio.to_thread(self.spool.ack, rows[0].id, rows[-1].id)
+        finally:
+            self._in_flight.release()
+
+    async def _run_spool_reporter(self):
+        spool = self.spool
+        written, acked = spool.written, spool.acked
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.report_interval)
+            now = time.monotonic()
+            elapsed = now - last
+            stats = self.spool_stats
+            stats.size = spool.size
+            stats.disk_size = await asyncio.to_thread(spool.disk_size)
+            stats.write_rate = (spool.written - written) / elapsed
+            stats.replay_rate = (spool.acked - acked) / elapsed
+            written, acked, last = spool.written, spool.acked, now
+            log_info(
+                f"Spool: {stats.size} records, {stats.disk_size / 2**20:.1f} MiB, "
+                f"write {stats.write_rate:.0f}/s, replay {stats.replay_rate:.0f}/s"
+            )
+            if stats.size == 0 and stats.disk_size > 0:
+                await asyncio.to_thread(spool.checkpoint)
+
+    async def _next_batch(self) -> Records:
+        queue = self.queue
+        items = [await queue.get()]
+        size = _size(items[0])
+        deadline = time.monotonic() + self.max_batch_age
+        while size < self.batch_size:
+            # Drain whatever is already queued without suspending
+            while not queue.empty() and size < self.batch_size:
+                items.append(queue.get_nowait())
+                size += _size(items[-1])
+            if size >= self.batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), remaining))
+                size += _size(items[-1])
+            except TimeoutError:
+                break
+        if not any(isinstance(item, SensorBatch) for item in items):
+            return items
+        # Runs of single records are folded into the columns, in order
+        parts, run = [], []
+        for item in items:
+            if isinstance(item, SensorBatch):
+                if run:
+                    parts.append(SensorBatch.from_records(run))
+                    run = []
+                parts.append(item)
+            else:
+                run.append(item)
+        if run:
+            parts.append(SensorBatch.from_records(run))
+        return SensorBatch.concat(parts)
+
+    def _encode(self, batch: Records) -> bytes:
+        if self.wire_format == WireFormat.BATCH:
+            if not isinstance(batch, SensorBatch):
+                batch = SensorBatch.from_records(batch)
+            body = batch.to_bytes()
+        else:
+            body = json.dumps(_as_records(batch), separators=(",", ":")).encode()
+        return gzip.compress(body, compresslevel=self.compress_level)
+
+    async def _send(self, client: httpx.AsyncClient, batch: Records):
+        try:
+            if await self.post(client, batch) == SendResult.SENT:
+                self.stats.sent += len(batch)
+                SENT.inc(len(batch))
+                if self.on_sent is not None:
+                    self.on_sent(_as_records(batch))
+            else:
+                self.stats.failed_batches += 1
+                self.stats.dropped += len(batch)
+                DROPPED.inc(len(batch))
+                log_error(f"Uplink dropped batch of {len(batch)} records")
+        finally:
+            self._in_flight.release()
+
+    async def post(self, client: httpx.AsyncClient, batch: Records) -> SendResult:
+        payload = await asyncio.to_thread(self._encode, batch)
+        content_type = (
+            BATCH_CONTENT_TYPE
+            if self.wire_format == WireFormat.BATCH
+            else "application/json"
+        )
+        headers = {"Content-Type": content_type, "Content-Encoding": "gzip"}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.retries += 1
+                RETRIES.inc()
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    self.endpoint, content=payload, headers=headers
+                )
+            except httpx.TransportError as e:
+                log_warning(f"Uplink attempt {attempt + 1} failed: {e!r}")
+                continue
+
+            if response.status_code < 300:
+                self.stats.batches += 1
+                self.stats.last_batch_size = len(batch)
+                self.stats.last_batch_latency = time.perf_counter() - start
+                BATCH_SIZE.observe(len(batch))
+                BATCH_SECONDS.observe(self.stats.last_batch_latency)
+                return SendResult.SENT
+            if response.status_code != 429 and response.status_code < 500:
+                # Client errors will not go away on retry
+                log_error(f"Uplink rejected: {response.status_code} {response.text}")
+                return SendResult.REJECTED
+            log_warning(
+                f"Uplink attempt {attempt + 1} failed: HTTP {response.status_code}"
+            )
+        return SendResult.FAILED
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# The machine details cache is written on first use, keep it out of $HOME
+os.environ.setdefault(
+    "COLLECTOR_MACHINE_FILE", os.path.join(tempfile.mkdtemp(), "machine.json")
+)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from collector_builtins.sensor import SeasonalSensor
+from collector_daemon.compression import (
+    CompressionMode,
+    CompressionPolicy,
+    SensorCompressor,
+)
+
+# The readings that are dropped must be reconstructible from the sent ones
+# within each mode's bound
+
+DEVIATION = 0.3
+EXCEPTION_DEVIATION = 0.15
+BOUNDS = {
+    CompressionMode.DEADBAND: DEVIATION,
+    CompressionMode.SWINGING_DOOR: DEVIATION,
+    CompressionMode.EXCEPTION: DEVIATION + 2 * EXCEPTION_DEVIATION,
+}
+
+
+def reconstruction_error(mode, values, timestamps):
+    compressor = SensorCompressor(
+        CompressionPolicy(
+            mode=mode,
+            deviation=DEVIATION,
+            exception_deviation=EXCEPTION_DEVIATION,
+            max_interval=1e9,
+        )
+    )
+    sent = [
+        point
+        for value, timestamp in zip(values, timestamps)
+        for point in compressor.feed(value, timestamp)
+    ]
+    sent += compressor.flush()
+    sent_values, sent_timestamps = np.array(sent).T
+
+    # Readings after the last sent point are not reconstructed yet
+    covered = timestamps <= sent_timestamps[-1]
+    if mode == CompressionMode.DEADBAND:
+        last = np.searchsorted(sent_timestamps, timestamps[covered], "right") - 1
+        reconstructed = sent_values[last]
+    else:
+        reconstructed = np.interp(timestamps[covered], sent_timestamps, sent_values)
+    error = float(np.abs(values[covered] - reconstructed).max())
+    return error, compressor.stats, len(sent)
+
+
+@pytest.mark.parametrize("mode", list(CompressionMode))
+@pytest.mark.parametrize("seed", range(5))
+def test_reconstruction_error_within_bound(mode, seed):
+    values = SeasonalSensor(name="s", seed=seed, noise_scale=0.3).read_block(5000)
+    timestamps = np.arange(len(values), dtype=np.float64)
+
+    error, stats, sent = reconstruction_error(mode, values, timestamps)
+
+    assert error <= BOUNDS[mode] + 1e-9
+    # The exported max error is the one of the reconstruction
+    assert stats.max_error == pytest.approx(error, abs=1e-9)
+    assert sent < len(values) / 2
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+from collector_core.db import Spool
+from collector_daemon.compression import (
+    COMPRESSION_RECEIVED,
+    CompressionPolicy,
+    EdgeCompression,
+)
+from collector_daemon.scheduler import POLL_SECONDS, SCHEDULER_LAG
+from collector_daemon.sharded import ShardedCollector
+from collector_daemon.uplink import Uplink
+from sensors.metrics import Counter, Histogram, Registry
+
+# Labelled children of removed clients and sensors must stop being exported
+
+
+def test_remove_drops_child():
+    registry = Registry()
+    counter = Counter("test_total", "Test", ["client", "sensor"], registry=registry)
+    counter.labels("1", "t").inc()
+    counter.labels("2", "t").inc(2)
+
+    counter.remove("1", "t")
+    counter.remove("3", "t")
+
+    text = registry.render()
+    assert 'client="1"' not in text
+    assert 'test_total{client="2",sensor="t"} 2' in text
+    # A sensor added again starts from zero
+    assert counter.labels("1", "t").value == 0
+
+
+def test_compression_remove_drops_children():
+    compression = EdgeCompression(default=CompressionPolicy(deviation=0.5))
+    for dev_id in (901, 902):
+        for sensor_name in ("t", "h"):
+            compression.feed(dev_id, sensor_name, 1.0, 1.0)
+    children = COMPRESSION_RECEIVED._children
+
+    compression.remove(901, "t")
+    assert ("901", "t") not in children
+    assert ("901", "h") in children
+
+    compression.remove(901)
+    assert ("901", "h") not in children
+    assert ("902", "t") in children and ("902", "h") in children
+
+
+def test_histogram_load_replaces_children():
+    source = Histogram("test_seconds", "Test", ["client"], registry=Registry())
+    source.labels("1").observe(0.002)
+    source.labels("1").observe(3.0)
+    target = Histogram("test_seconds", "Test", ["client"], registry=Registry())
+    kept = target.labels("1")
+    target.labels("2").observe(1.0)
+
+    target.load(source.state())
+
+    assert target.state() == source.state()
+    # Children that are kept stay the same objects
+    assert target.labels("1") is kept
+    assert kept.sum == 3.002
+
+
+def test_sharded_merges_worker_histograms(tmp_path):
+    # Workers send their histogram states over the event queue, the parent
+    # exports their sum
+    collector = ShardedCollector(
+        workers=2, uplink=Uplink(spool=Spool(str(tmp_path / "spool.db")))
+    )
+    lag = SCHEDULER_LAG.buckets
+    shards = []
+    for index, dev_id in enumerate(("911", "912")):
+        poll = Histogram("poll", "Test", ["client", "sensor"], registry=Registry())
+        poll.labels(dev_id, "t").observe(0.01)
+        scheduler_lag = Histogram("lag", "Test", buckets=lag, registry=Registry())
+        scheduler_lag.observe(0.001 * (index + 1))
+        shards.append(
+            SimpleNamespace(
+                poll_seconds=poll.state(), scheduler_lag=scheduler_lag.state()
+            )
+        )
+    collector._shards = shards
+    try:
+        collector._merge_histograms()
+
+        poll = POLL_SECONDS.state()
+        assert sum(poll[("911", "t")][0]) == 1
+        assert sum(poll[("912", "t")][0]) == 1
+        counts, total = SCHEDULER_LAG.state()[()]
+        assert sum(counts) == 2
+        assert total == pytest.approx(0.003)
+    finally:
+        collector._shards = []
+        POLL_SECONDS.load({})
+        SCHEDULER_LAG.load({(): ([0] * (len(lag) + 1), 0.0)})
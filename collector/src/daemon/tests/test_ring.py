@@ -0,0 +1,51 @@
+import multiprocessing
+
+import pytest
+from collector_daemon.ring import RingBuffer
+
+
+@pytest.fixture(params=["plain", "locked"])
+def ring(request):
+    # The locked ring is what non-x86 machines use
+    lock = multiprocessing.get_context("spawn").Lock()
+    ring = RingBuffer.create(4, lock if request.param == "locked" else None)
+    yield ring
+    ring.close()
+
+
+def test_push_pop_wraps_around(ring):
+    for i in range(3):
+        assert ring.push(1, i, float(i), 100.0 + i)
+    assert ring.pop(2)["key"].tolist() == [0, 1]
+    for i in range(3, 6):
+        assert ring.push(1, i, float(i), 100.0 + i)
+    # Full: four records waiting
+    assert not ring.push(1, 6, 6.0, 106.0)
+    assert len(ring) == 4
+
+    records = ring.pop()
+    assert records["key"].tolist() == [2, 3, 4, 5]
+    assert records["value"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert len(ring) == 0
+    assert len(ring.pop()) == 0
+
+
+def test_attached_ring_shares_records(ring):
+    other = RingBuffer.attach(ring.name, ring.capacity, ring.lock)
+    try:
+        assert other.push(7, 1, 1.5, 200.0)
+        records = ring.pop()
+        assert records["dev_id"].tolist() == [7]
+        assert records["timestamp"].tolist() == [200.0]
+    finally:
+        other.close()
+
+
+def test_stats_round_trip(ring):
+    assert ring.stats == (0, 0, 0, 0.0, 0.0)
+    ring.publish_stats(10, 2, 1, 0.25, 0.0125)
+    other = RingBuffer.attach(ring.name, ring.capacity, ring.lock)
+    try:
+        assert other.stats == (10, 2, 1, 0.25, 0.0125)
+    finally:
+        other.close()
@@ -0,0 +1,102 @@
+import asyncio
+from dataclasses import dataclass, field
+
+from collector_core.client import AsyncClientBase
+from collector_core.mcu import MCU
+from collector_daemon.scheduler import PollScheduler
+
+# Readings that arrive after their client or sensor was removed are dropped
+
+
+@dataclass
+class SlowClient(AsyncClientBase):
+    # Bulk reads block until released, so removals can land mid-read
+    release: asyncio.Event = field(default_factory=asyncio.Event)
+    started: asyncio.Event = field(default_factory=asyncio.Event)
+
+    async def get_heartbeat(self) -> bool:
+        return True
+
+    async def get_mcu_info(self) -> str:
+        return "slow"
+
+    async def get_list_of_sensors_names(self) -> list[str]:
+        return ["t", "h"]
+
+    async def get_sensor_data(self, sensor_name: str) -> float:
+        self.started.set()
+        await self.release.wait()
+        return 1.0
+
+
+def make_scheduler():
+    readings = []
+
+    async def on_reading(client, name, value, timestamp):
+        readings.append((client.mcu.dev_id, name))
+
+    return PollScheduler(on_reading=on_reading, default_interval=60.0), readings
+
+
+async def start_read(scheduler: PollScheduler, client: SlowClient) -> asyncio.Task:
+    await scheduler.add_client(client)
+    runner = asyncio.create_task(scheduler.run())
+    await asyncio.wait_for(client.started.wait(), 1)
+    return runner
+
+
+async def finish(scheduler: PollScheduler, runner: asyncio.Task):
+    await asyncio.gather(*scheduler._tasks)
+    runner.cancel()
+    await scheduler.stop()
+
+
+def test_removed_client_readings_are_dropped():
+    asyncio.run(_removed_client_readings_are_dropped())
+
+
+async def _removed_client_readings_are_dropped():
+    scheduler, readings = make_scheduler()
+    client = SlowClient(mcu=MCU(name="slow", description="", dev_id=701))
+    runner = await start_read(scheduler, client)
+
+    scheduler.remove_client(client)
+    client.release.set()
+    await finish(scheduler, runner)
+
+    assert readings == []
+    assert scheduler.stats.errors == 0
+
+
+def test_removed_sensor_readings_are_dropped():
+    asyncio.run(_removed_sensor_readings_are_dropped())
+
+
+async def _removed_sensor_readings_are_dropped():
+    scheduler, readings = make_scheduler()
+    client = SlowClient(mcu=MCU(name="slow", description="", dev_id=702))
+    runner = await start_read(scheduler, client)
+
+    scheduler.remove_sensor(client, "h")
+    client.release.set()
+    await finish(scheduler, runner)
+
+    assert readings == [(702, "t")]
+
+
+def test_read_dispatched_after_remove_client_is_skipped():
+    asyncio.run(_read_dispatched_after_remove_client_is_skipped())
+
+
+async def _read_dispatched_after_remove_client_is_skipped():
+    scheduler, readings = make_scheduler()
+    client = SlowClient(mcu=MCU(name="slow", description="", dev_id=703))
+    await scheduler.add_client(client)
+    jobs = list(scheduler._jobs.values())
+    scheduler.remove_client(client)
+
+    await scheduler._read(jobs)
+
+    assert not client.started.is_set()
+    assert readings == []
+    assert scheduler.stats.errors == 0
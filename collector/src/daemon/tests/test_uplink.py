@@ -0,0 +1,295 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+from collector_core.db import Spool
+from collector_daemon import uplink as uplink_module
+from collector_daemon.uplink import OverflowPolicy, SendResult, Uplink, WireFormat
+from sensors.batch import CONTENT_TYPE as BATCH_CONTENT_TYPE
+from sensors.batch import SensorBatch
+
+# Uplink against a stub /ingest served by httpx.MockTransport
+
+
+class StubCore:
+    # Answers with the scripted statuses in order, then with 200. An
+    # exception in the script is raised instead, like a dropped connection.
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.attempts = 0
+        self.received: list[dict] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.attempts += 1
+        assert request.url.path == "/ingest"
+        assert request.headers["content-encoding"] == "gzip"
+        if self.script:
+            status = self.script.pop(0)
+            if isinstance(status, Exception):
+                raise status
+            if status >= 300:
+                return httpx.Response(status, text="stub")
+        body = gzip.decompress(request.content)
+        if request.headers["content-type"] == BATCH_CONTENT_TYPE:
+            records = SensorBatch.from_bytes(body).to_records()
+        else:
+            assert request.headers["content-type"] == "application/json"
+            records = json.loads(body)
+        self.received.extend(records)
+        return httpx.Response(200, json={"rows": len(records)})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url="http://core", transport=self.transport())
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self)
+
+
+def records(count: int, start: int = 0) -> list[dict]:
+    return [
+        {
+            "fingerprint": "f",
+            "mcu_name": "mcu",
+            "sensor_name": f"s{i % 3}",
+            "value": float(i),
+            "timestamp": 1_700_000_000.0 + i,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Backoff delays without the waiting, jitter pinned to its upper end
+    delays = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(uplink_module.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(uplink_module.random, "uniform", lambda low, high: high)
+    return delays
+
+
+async def post(uplink: Uplink, core: StubCore, batch: list[dict]) -> SendResult:
+    async with core.client() as client:
+        return await uplink.post(client, batch)
+
+
+@pytest.mark.parametrize("wire_format", list(WireFormat))
+def test_gzip_body(wire_format):
+    core = StubCore()
+    batch = records(10)
+    result = asyncio.run(post(Uplink(wire_format=wire_format), core, batch))
+    assert result == SendResult.SENT
+    assert core.received == batch
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503])
+def test_retries_with_backoff(sleeps, status):
+    core = StubCore([status, status, status])
+    uplink = Uplink(backoff_base=0.1, backoff_max=0.3)
+    assert asyncio.run(post(uplink, core, records(5))) == SendResult.SENT
+    assert core.attempts == 4
+    assert uplink.stats.retries == 3
+    # Exponential, capped at backoff_max
+    assert sleeps == pytest.approx([0.1, 0.2, 0.3])
+    assert len(core.received) == 5
+
+
+def test_transport_errors_are_retried(sleeps):
+    core = StubCore([httpx.ConnectError("refused"), httpx.ReadTimeout("slow")])
+    uplink = Uplink(backoff_base=0.1)
+    assert asyncio.run(post(uplink, core, records(5))) == SendResult.SENT
+    assert core.attempts == 3
+
+
+def test_gives_up_after_max_retries(sleeps):
+    core = StubCore([503] * 10)
+    uplink = Uplink(max_retries=3)
+    assert asyncio.run(post(uplink, core, records(5))) == SendResult.FAILED
+    assert core.attempts == 4
+    assert core.received == []
+
+
+@pytest.mark.parametrize("status", [400, 404, 413, 422])
+def test_other_client_errors_are_not_retried(sleeps, status):
+    core = StubCore([status])
+    uplink = Uplink()
+    assert asyncio.run(post(uplink, core, records(5))) == SendResult.REJECTED
+    assert core.attempts == 1
+    assert sleeps == []
+
+
+def fill(uplink: Uplink, count: int) -> list[dict]:
+    async def scenario():
+        for record in records(count):
+            await uplink.put(record)
+        queue = uplink.queue
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(scenario())
+
+
+def test_overflow_drop_newest():
+    uplink = Uplink(max_queue_size=3, overflow_policy=OverflowPolicy.DROP_NEWEST)
+    assert fill(uplink, 5) == records(3)
+    assert uplink.stats.dropped == 2
+    assert uplink.stats.enqueued == 3
+
+
+def test_overflow_drop_oldest():
+    uplink = Uplink(max_queue_size=3, overflow_policy=OverflowPolicy.DROP_OLDEST)
+    assert fill(uplink, 5) == records(3, start=2)
+    assert uplink.stats.dropped == 2
+    assert uplink.stats.enqueued == 5
+
+
+def test_overflow_block():
+    async def scenario():
+        uplink = Uplink(max_queue_size=3, overflow_policy=OverflowPolicy.BLOCK)
+        for record in records(3):
+            await uplink.put(record)
+        blocked = asyncio.create_task(uplink.put(records(1, start=3)[0]))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        # Room in the queue lets the producer through, nothing is dropped
+        uplink.queue.get_nowait()
+        await asyncio.wait_for(blocked, 1)
+        assert uplink.stats.dropped == 0
+        assert uplink.queue.qsize() == 3
+
+    asyncio.run(scenario())
+
+
+def columns(count: int, start: int = 0) -> SensorBatch:
+    return SensorBatch.from_records(records(count, start))
+
+
+def test_put_batch_drop_newest_cuts_the_tail():
+    uplink = Uplink(max_queue_size=5, overflow_policy=OverflowPolicy.DROP_NEWEST)
+
+    async def scenario():
+        await uplink.put(records(1)[0])
+        await uplink.put_batch(columns(6, start=1))
+        await uplink.put_batch(columns(2, start=7))
+        return await uplink._next_batch()
+
+    batch = asyncio.run(scenario())
+    assert batch.to_records() == records(5)
+    assert uplink.stats.dropped == 4
+    assert uplink.stats.enqueued == 5
+
+
+def test_put_batch_drop_oldest_drops_whole_batches():
+    uplink = Uplink(max_queue_size=5, overflow_policy=OverflowPolicy.DROP_OLDEST)
+
+    async def scenario():
+        await uplink.put_batch(columns(3))
+        await uplink.put_batch(columns(2, start=3))
+        await uplink.put_batch(columns(2, start=5))
+        assert uplink.queue.qsize() == 4
+        # A record makes room by dropping what is oldest, a batch here
+        await uplink.put(records(1, start=7)[0])
+        await uplink.put(records(1, start=8)[0])
+        return await uplink._next_batch()
+
+    batch = asyncio.run(scenario())
+    assert batch.to_records() == records(4, start=5)
+    assert uplink.stats.dropped == 5
+
+
+def test_next_batch_keeps_order_of_records_and_columns():
+    uplink = Uplink(batch_size=100, max_batch_age=0.01)
+
+    async def scenario():
+        for record in records(2):
+            await uplink.put(record)
+        await uplink.put_batch(columns(3, start=2))
+        await uplink.put(records(1, start=5)[0])
+        return await uplink._next_batch()
+
+    batch = asyncio.run(scenario())
+    assert isinstance(batch, SensorBatch)
+    assert batch.to_records() == records(6)
+    assert uplink.queue.qsize() == 0
+
+
+@pytest.mark.parametrize("wire_format", list(WireFormat))
+def test_run_sends_columns(tmp_path, wire_format):
+    core = StubCore()
+    uplink = Uplink(
+        transport=core.transport(),
+        spool=Spool(str(tmp_path / "spool.db")),
+        wire_format=wire_format,
+        batch_size=10,
+        max_batch_age=0.01,
+    )
+
+    async def scenario():
+        await uplink.put_batch(columns(15))
+        await uplink.put(records(1, start=15)[0])
+        await run_until(uplink, lambda: uplink.stats.sent == 16)
+
+    asyncio.run(scenario())
+    assert sorted(core.received, key=lambda r: r["timestamp"]) == [
+        {**record, "fingerprint": uplink_module.FINGERPRINT} for record in records(16)
+    ]
+
+
+async def run_until(uplink: Uplink, condition, timeout: float = 5.0):
+    task = asyncio.create_task(uplink.run())
+    try:
+        async with asyncio.timeout(timeout):
+            while not condition():
+                await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_run_batches_and_drops_rejected():
+    core = StubCore([422])
+    uplink = Uplink(
+        transport=core.transport(), batch_size=10, max_batch_age=0.01, max_in_flight=1
+    )
+
+    async def scenario():
+        for record in records(30):
+            await uplink.put(record)
+        await run_until(uplink, lambda: uplink.stats.sent + uplink.stats.dropped == 30)
+
+    asyncio.run(scenario())
+    # The first batch was rejected and dropped, the others went through
+    assert core.received == records(20, start=10)
+    assert uplink.stats.dropped == 10
+    assert uplink.stats.batches == 2
+
+
+def test_run_spool_survives_outage(tmp_path, sleeps):
+    # Rows stay on disk while core fails and are removed once it accepts them
+    core = StubCore([503] * 12)
+    spool = Spool(str(tmp_path / "spool.db"))
+    uplink = Uplink(
+        transport=core.transport(),
+        spool=spool,
+        batch_size=10,
+        max_batch_age=0.01,
+        max_retries=2,
+    )
+
+    async def scenario():
+        for record in records(25):
+            await uplink.put(record)
+        # Rows are acked after they count as sent, wait for both
+        await run_until(uplink, lambda: uplink.stats.sent == 25 and spool.size == 0)
+
+    asyncio.run(scenario())
+    assert sorted(core.received, key=lambda r: r["timestamp"]) == [
+        {**record, "fingerprint": uplink_module.FINGERPRINT} for record in records(25)
+    ]
+    assert uplink.stats.failed_batches > 0
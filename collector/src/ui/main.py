@@ -6,6 +6,7 @@ import requests
 import streamlit as st
 from collector_core import FINGERPRINT
 from collector_core.daemon import CollectorCore
+from collector_core.db import create_mcu, init_db
 from collector_core.mcu import MCU
 
 st.set_page_config(
@@ -13,6 +14,8 @@ st.set_page_config(
     page_icon=":bar_chart:",
 )
 
+init_db()
+
 core = CollectorCore()
 thread = threading.Thread(target=core.main_thread)
 thread.start()
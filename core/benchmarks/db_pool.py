@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+parser = argparse.ArgumentParser(
+    description="Concurrent /history/{id} throughput: threadpool + sync engine vs async"
+)
+parser.add_argument("--database-url", default="sqlite:///bench_pool.db")
+parser.add_argument("--rows", type=int, default=200_000)
+parser.add_argument("--sensors", type=int, default=20)
+parser.add_argument("--requests", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256])
+parser.add_argument("--window", type=float, default=600, help="Query window, s")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+# See history_range_query.py: the engine is configured at import time
+for name in ("PGSQL_USER", "PGSQL_PASSWORD", "PGSQL_HOSTNAME", "PGSQL_DATABASE"):
+    os.environ[name] = ""
+os.environ["DATABASE_URL"] = args.database_url
+
+from fastapi.concurrency import run_in_threadpool  # noqa: E402
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from src.db.engine import get_async_engine, get_engine  # noqa: E402
+from src.db.ingest import _copy_history  # noqa: E402
+from src.db.models import (  # noqa: E402
+    Base,
+    Collectors_Table,
+    History_Table,
+    MCUs_Table,
+    Sensors_Table,
+)
+from src.db.partitions import ensure_partitions, init_history  # noqa: E402
+from src.db.rollups import backfill_rollups, query_history  # noqa: E402
+
+engine = get_engine()
+START = datetime(2025, 1, 1)
+CHUNK = 50_000
+
+# Modes, each serving the same queries:
+#
+#   threadpool-default  run_in_threadpool + sync engine, SQLAlchemy's default
+#                       pool (5 + 10 overflow), i.e. before
+#   threadpool          run_in_threadpool + sync engine, DB_POOL_* settings
+#   async               per-request AsyncSession, run_sync on the event loop
+
+
+def reset():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DROP TABLE IF EXISTS history CASCADE"
+                if conn.dialect.name == "postgresql"
+                else "DROP TABLE IF EXISTS history"
+            )
+        )
+    Base.metadata.drop_all(bind=engine)
+    init_history()
+    with engine.begin() as conn:
+        conn.execute(insert(Collectors_Table), [{"id": 1, "fingerprint": "bench"}])
+        conn.execute(
+            insert(MCUs_Table), [{"id": 1, "collector_id": 1, "name": "bench"}]
+        )
+        conn.execute(
+            insert(Sensors_Table),
+            [
+                {"id": i, "mcu_id": 1, "name": f"s{i}"}
+                for i in range(1, args.sensors + 1)
+            ],
+        )
+
+
+def fill() -> datetime:
+    rng = np.random.default_rng(0)
+    end = START + timedelta(seconds=args.rows // args.sensors)
+    ensure_partitions(START, end)
+    for offset in range(0, args.rows, CHUNK):
+        count = min(args.rows, offset + CHUNK) - offset
+        values = rng.normal(10, 1, count).round(2).tolist()
+        rows = [
+            (
+                1,
+                1,
+                i % args.sensors + 1,
+                value,
+                START + timedelta(seconds=i // args.sensors),
+            )
+            for i, value in zip(range(offset, offset + count), values)
+        ]
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                _copy_history(conn, rows)
+            else:
+                conn.execute(
+                    insert(History_Table),
+                    [
+                        {
+                            "collector_id": c,
+                            "mcu_id": m,
+                            "sensor_id": s,
+                            "value": v,
+                            "timestamp": t,
+                        }
+                        for c, m, s, v, t in rows
+                    ],
+                )
+    return end
+
+
+def queries(end: datetime) -> list[tuple]:
+    random.seed(1)
+    span = max(0.0, (end - START).total_seconds() - args.window)
+    result = []
+    for _ in range(args.requests):
+        start = START + timedelta(seconds=random.uniform(0, span))
+        result.append(
+            (
+                random.randint(1, args.sensors),
+                start,
+                start + timedelta(seconds=args.window),
+            )
+        )
+    return result
+
+
+def threadpool_handler(sync_engine):
+    def query(sensor_id: int, start: datetime, end: datetime):
+        with sync_engine.connect() as conn:
+            return query_history(conn, sensor_id, start, end)
+
+    async def handle(sensor_id: int, start: datetime, end: datetime):
+        return await run_in_threadpool(query, sensor_id, start, end)
+
+    return handle
+
+
+async def async_handler(sensor_id: int, start: datetime, end: datetime):
+    async with AsyncSession(get_async_engine()) as session:
+        conn = await session.connection()
+        return await conn.run_sync(query_history, sensor_id, start, end)
+
+
+async def measure(handle, work: list[tuple], concurrency: int) -> dict:
+    pending = iter(work)
+    latencies = []
+
+    async def client():
+        for query in pending:
+            started = time.perf_counter()
+            await handle(*query)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_second": len(work) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1e3,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1e3,
+    }
+
+
+async def run(work: list[tuple]) -> dict:
+    modes = {
+        "threadpool-default": threadpool_handler(create_engine(args.database_url)),
+        "threadpool": threadpool_handler(engine),
+        "async": async_handler,
+    }
+    results = {}
+    for name, handle in modes.items():
+        # Warm up connections and caches
+        await measure(handle, work[:100], 16)
+        results[name] = {
+            concurrency: await measure(handle, work, concurrency)
+            for concurrency in args.concurrency
+        }
+    await get_async_engine().dispose()
+    return results
+
+
+def main():
+    reset()
+    end = fill()
+    backfill_rollups()
+    results = asyncio.run(run(queries(end)))
+
+    print(f"{'mode':>20} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, levels in results.items():
+        for concurrency, result in levels.items():
+            print(
+                f"{name:>20} {concurrency:>5} "
+                f"{result['requests_per_second']:>8.0f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"database": engine.dialect.name, "args": vars(args), **results},
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+parser = argparse.ArgumentParser(
+    description="Bytes per point and scan speed, row per sample vs chunks"
+)
+parser.add_argument("--database-url", default="sqlite:///bench_chunks.db")
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--sensors", type=int, default=20)
+parser.add_argument("--queries", type=int, default=50)
+parser.add_argument("--window", type=float, default=3600, help="Query window, s")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+# See history_range_query.py: the engine is configured at import time
+for name in ("PGSQL_USER", "PGSQL_PASSWORD", "PGSQL_HOSTNAME", "PGSQL_DATABASE"):
+    os.environ[name] = ""
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert, text  # noqa: E402
+from src.db.chunks import compact_history  # noqa: E402
+from src.db.engine import get_engine  # noqa: E402
+from src.db.ingest import _copy_history  # noqa: E402
+from src.db.models import (  # noqa: E402
+    Base,
+    Collectors_Table,
+    History_Table,
+    MCUs_Table,
+    Sensors_Table,
+)
+from src.db.partitions import ensure_partitions, init_history  # noqa: E402
+from src.db.rollups import _query_raw  # noqa: E402
+
+engine = get_engine()
+START = datetime(2025, 1, 1)
+CHUNK = 50_000
+
+
+def reset():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DROP TABLE IF EXISTS history CASCADE"
+                if conn.dialect.name == "postgresql"
+                else "DROP TABLE IF EXISTS history"
+            )
+        )
+    Base.metadata.drop_all(bind=engine)
+    init_history()
+    with engine.begin() as conn:
+        conn.execute(insert(Collectors_Table), [{"id": 1, "fingerprint": "bench"}])
+        conn.execute(
+            insert(MCUs_Table), [{"id": 1, "collector_id": 1, "name": "bench"}]
+        )
+        conn.execute(
+            insert(Sensors_Table),
+            [
+                {"id": i, "mcu_id": 1, "name": f"s{i}"}
+                for i in range(1, args.sensors + 1)
+            ],
+        )
+
+
+def fill() -> datetime:
+    # One sample per sensor per second, a random walk quantized to 0.01 like
+    # SeasonalSensor's ADC
+    rng = np.random.default_rng(0)
+    end = START + timedelta(seconds=args.rows // args.sensors)
+    ensure_partitions(START, end)
+    levels = np.full(args.sensors, 10.0)
+    for offset in range(0, args.rows, CHUNK):
+        count = min(args.rows, offset + CHUNK) - offset
+        rows = []
+        for i in range(offset, offset + count):
+            sensor = i % args.sensors
+            levels[sensor] += rng.normal(0, 0.05)
+            rows.append(
+                (
+                    1,
+                    1,
+                    sensor + 1,
+                    round(float(levels[sensor]), 2),
+                    START + timedelta(seconds=i // args.sensors),
+                )
+            )
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                _copy_history(conn, rows)
+            else:
+                conn.execute(
+                    insert(History_Table),
+                    [
+                        {
+                            "collector_id": c,
+                            "mcu_id": m,
+                            "sensor_id": s,
+                            "value": v,
+                            "timestamp": t,
+                        }
+                        for c, m, s, v, t in rows
+                    ],
+                )
+    return end
+
+
+def storage_bytes() -> int:
+    # Table plus index pages of history and history_chunks
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("VACUUM FULL"))
+            return conn.execute(
+                text(
+                    "SELECT COALESCE(sum(pg_total_relation_size(c.oid)), 0) "
+                    "FROM pg_class c WHERE c.relname IN ('history_chunks') "
+                    "OR c.oid IN (SELECT inhrelid FROM pg_inherits i "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "WHERE p.relname = 'history')"
+                )
+            ).scalar_one()
+        conn.execute(text("VACUUM"))
+        return conn.execute(
+            text(
+                "SELECT COALESCE(sum(pgsize), 0) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_schema "
+                "WHERE tbl_name IN ('history', 'history_chunks'))"
+            )
+        ).scalar_one()
+
+
+def measure(end: datetime) -> dict:
+    random.seed(1)
+    span = max(0.0, (end - START).total_seconds() - args.window)
+    latencies, returned = [], 0
+    filtered_latencies, filtered = [], 0
+    with engine.connect() as conn:
+        for _ in range(args.queries):
+            sensor_id = random.randint(1, args.sensors)
+            start = START + timedelta(seconds=random.uniform(0, span))
+            window = start + timedelta(seconds=args.window)
+            t0 = time.perf_counter()
+            returned += len(_query_raw(conn, sensor_id, start, window, None, None))
+            latencies.append(time.perf_counter() - t0)
+            # Whole history of one sensor, values far above the walk's start
+            t0 = time.perf_counter()
+            filtered += len(_query_raw(conn, sensor_id, START, end, 12.0, None))
+            filtered_latencies.append(time.perf_counter() - t0)
+    return {
+        "range_p50_ms": float(np.median(latencies)) * 1e3,
+        "range_points_per_second": returned / sum(latencies),
+        "rows_per_query": returned / args.queries,
+        "filtered_p50_ms": float(np.median(filtered_latencies)) * 1e3,
+        "filtered_rows_per_query": filtered / args.queries,
+    }
+
+
+def main():
+    reset()
+    end = fill()
+    rows_layout = {"bytes_per_point": storage_bytes() / args.rows, **measure(end)}
+
+    t0 = time.perf_counter()
+    stats = compact_history(max_age=0)
+    compaction = time.perf_counter() - t0
+    chunks_layout = {
+        "bytes_per_point": storage_bytes() / args.rows,
+        "chunks": stats.chunks,
+        "compaction_rows_per_second": stats.rows / compaction,
+        **measure(end),
+    }
+
+    print(
+        f"{'layout':>8} {'B/point':>8} {'p50 ms':>8} {'points/s':>12} {'filter ms':>10}"
+    )
+    for name, result in (("rows", rows_layout), ("chunks", chunks_layout)):
+        print(
+            f"{name:>8} {result['bytes_per_point']:>8.1f} "
+            f"{result['range_p50_ms']:>8.2f} "
+            f"{result['range_points_per_second']:>12.0f} "
+            f"{result['filtered_p50_ms']:>10.2f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "database": engine.dialect.name,
+                    "args": vars(args),
+                    "rows": rows_layout,
+                    "chunks": chunks_layout,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
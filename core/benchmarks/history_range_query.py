@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(
+    description="Per-sensor range query latency against history table size"
+)
+parser.add_argument("--database-url", default="sqlite:///bench_history.db")
+parser.add_argument(
+    "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+)
+parser.add_argument("--sensors", type=int, default=100)
+parser.add_argument("--queries", type=int, default=200)
+parser.add_argument("--window", type=float, default=600, help="Query window, s")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+# The engine is configured from the environment at import time. Blank PGSQL_*
+# so neither the shell nor core/.env can point the benchmark at a real database.
+for name in ("PGSQL_USER", "PGSQL_PASSWORD", "PGSQL_HOSTNAME", "PGSQL_DATABASE"):
+    os.environ[name] = ""
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert, text  # noqa: E402
+from src.db.engine import get_engine  # noqa: E402
+from src.db.ingest import _copy_history  # noqa: E402
+from src.db.models import (  # noqa: E402
+    Base,
+    Collectors_Table,
+    History_Table,
+    MCUs_Table,
+    Sensors_Table,
+)
+from src.db.partitions import ensure_partitions, init_history  # noqa: E402
+
+engine = get_engine()
+START = datetime(2025, 1, 1)
+CHUNK = 50_000
+
+QUERY = text(
+    "SELECT timestamp, value FROM history "
+    "WHERE sensor_id = :sensor_id AND timestamp >= :start AND timestamp < :end "
+    "ORDER BY timestamp"
+)
+
+
+def reset():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DROP TABLE IF EXISTS history CASCADE"
+                if conn.dialect.name == "postgresql"
+                else "DROP TABLE IF EXISTS history"
+            )
+        )
+    Base.metadata.drop_all(bind=engine)
+    init_history()
+    with engine.begin() as conn:
+        conn.execute(insert(Collectors_Table), [{"id": 1, "fingerprint": "bench"}])
+        conn.execute(
+            insert(MCUs_Table), [{"id": 1, "collector_id": 1, "name": "bench"}]
+        )
+        conn.execute(
+            insert(Sensors_Table),
+            [
+                {"id": i, "mcu_id": 1, "name": f"s{i}"}
+                for i in range(1, args.sensors + 1)
+            ],
+        )
+
+
+def fill(size: int) -> datetime:
+    # One sample per sensor per second, sensors interleaved like real ingest
+    end = START + timedelta(seconds=size // args.sensors)
+    ensure_partitions(START, end)
+    for offset in range(0, size, CHUNK):
+        rows = [
+            (
+                1,
+                1,
+                i % args.sensors + 1,
+                random.random(),
+                START + timedelta(seconds=i // args.sensors),
+            )
+            for i in range(offset, min(size, offset + CHUNK))
+        ]
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                _copy_history(conn, rows)
+            else:
+                conn.execute(
+                    insert(History_Table),
+                    [
+                        {
+                            "collector_id": c,
+                            "mcu_id": m,
+                            "sensor_id": s,
+                            "value": v,
+                            "timestamp": t,
+                        }
+                        for c, m, s, v, t in rows
+                    ],
+                )
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    return end
+
+
+def measure(end: datetime) -> dict:
+    span = max(0.0, (end - START).total_seconds() - args.window)
+    latencies = []
+    returned = 0
+    with engine.connect() as conn:
+        for _ in range(args.queries):
+            start = START + timedelta(seconds=random.uniform(0, span))
+            params = {
+                "sensor_id": random.randint(1, args.sensors),
+                "start": start,
+                "end": start + timedelta(seconds=args.window),
+            }
+            t0 = time.perf_counter()
+            returned += len(conn.execute(QUERY, params).all())
+            latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1e3,
+        "mean_rows": returned / args.queries,
+    }
+
+
+def main():
+    results = []
+    print(f"{'rows':>12} {'insert/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'rows/q':>8}")
+    for size in args.sizes:
+        reset()
+        t0 = time.perf_counter()
+        end = fill(size)
+        insert_rate = size / (time.perf_counter() - t0)
+        result = {"rows": size, "insert_rate": insert_rate, **measure(end)}
+        results.append(result)
+        print(
+            f"{size:>12} {insert_rate:>12.0f} {result['p50_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['mean_rows']:>8.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "database": engine.dialect.name,
+                    "args": vars(args),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+parser = argparse.ArgumentParser(
+    description="Streamed vs materialized history export, SQL vs Python aggregation"
+)
+parser.add_argument("--database-url", default="sqlite:///bench_stream.db")
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--sensors", type=int, default=10)
+parser.add_argument("--chunks", action="store_true", help="Compact into chunks first")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+# See history_range_query.py: the engine is configured at import time
+for name in ("PGSQL_USER", "PGSQL_PASSWORD", "PGSQL_HOSTNAME", "PGSQL_DATABASE"):
+    os.environ[name] = ""
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert, text  # noqa: E402
+from src.db.chunks import compact_history  # noqa: E402
+from src.db.engine import get_engine  # noqa: E402
+from src.db.ingest import _copy_history  # noqa: E402
+from src.db.models import (  # noqa: E402
+    Base,
+    Collectors_Table,
+    History_Table,
+    MCUs_Table,
+    Sensors_Table,
+)
+from src.db.partitions import ensure_partitions, init_history  # noqa: E402
+from src.db.rollups import _query_raw, backfill_rollups, to_epoch  # noqa: E402
+from src.db.stream import stream_history  # noqa: E402
+from src.export import ndjson_stream  # noqa: E402
+
+engine = get_engine()
+START = datetime(2025, 1, 1)
+CHUNK = 50_000
+
+
+def reset():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DROP TABLE IF EXISTS history CASCADE"
+                if conn.dialect.name == "postgresql"
+                else "DROP TABLE IF EXISTS history"
+            )
+        )
+    Base.metadata.drop_all(bind=engine)
+    init_history()
+    with engine.begin() as conn:
+        conn.execute(insert(Collectors_Table), [{"id": 1, "fingerprint": "bench"}])
+        conn.execute(
+            insert(MCUs_Table), [{"id": 1, "collector_id": 1, "name": "bench"}]
+        )
+        conn.execute(
+            insert(Sensors_Table),
+            [
+                {"id": i, "mcu_id": 1, "name": f"s{i}"}
+                for i in range(1, args.sensors + 1)
+            ],
+        )
+
+
+def fill() -> datetime:
+    rng = np.random.default_rng(0)
+    end = START + timedelta(seconds=args.rows // args.sensors)
+    ensure_partitions(START, end)
+    for offset in range(0, args.rows, CHUNK):
+        count = min(args.rows, offset + CHUNK) - offset
+        values = rng.normal(10, 1, count).round(2).tolist()
+        rows = [
+            (
+                1,
+                1,
+                i % args.sensors + 1,
+                value,
+                START + timedelta(seconds=i // args.sensors),
+            )
+            for i, value in zip(range(offset, offset + count), values)
+        ]
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                _copy_history(conn, rows)
+            else:
+                conn.execute(
+                    insert(History_Table),
+                    [
+                        {
+                            "collector_id": c,
+                            "mcu_id": m,
+                            "sensor_id": s,
+                            "value": v,
+                            "timestamp": t,
+                        }
+                        for c, m, s, v, t in rows
+                    ],
+                )
+    return end
+
+
+def materialized(sensor_ids: list[int], end: datetime) -> int:
+    # What a non-streaming endpoint does: every row as a dict, then one body
+    with engine.connect() as conn:
+        body = {
+            sensor_id: _query_raw(conn, sensor_id, START, end, None, None)
+            for sensor_id in sensor_ids
+        }
+    return len(json.dumps(body, default=str))
+
+
+def streamed(sensor_ids: list[int], end: datetime) -> int:
+    return sum(
+        len(part) for part in ndjson_stream(stream_history(sensor_ids, START, end))
+    )
+
+
+def python_aggregate(sensor_ids: list[int], end: datetime, bucket: int) -> int:
+    buckets = 0
+    with engine.connect() as conn:
+        for sensor_id in sensor_ids:
+            rows = _query_raw(conn, sensor_id, START, end, None, None)
+            keys = np.array([to_epoch(row["timestamp"]) for row in rows]) // bucket
+            values = np.array([row["value"] for row in rows])
+            unique, inverse = np.unique(keys, return_inverse=True)
+            np.bincount(inverse, values) / np.bincount(inverse)
+            buckets += len(unique)
+    return buckets
+
+
+def sql_aggregate(sensor_ids: list[int], end: datetime, bucket: int) -> int:
+    return sum(
+        len(batch.timestamps)
+        for batch in stream_history(sensor_ids, START, end, bucket, ("avg",))
+    )
+
+
+def measure(function, *arguments) -> dict:
+    started = time.perf_counter()
+    result = function(*arguments)
+    elapsed = time.perf_counter() - started
+    # Separate pass, tracemalloc slows the run down
+    tracemalloc.start()
+    function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 2**20, "result": result}
+
+
+def main():
+    reset()
+    end = fill()
+    backfill_rollups()
+    if args.chunks:
+        compact_history(max_age=0)
+    sensor_ids = list(range(1, args.sensors + 1))
+
+    results = {
+        "export_materialized": measure(materialized, sensor_ids, end),
+        "export_streamed": measure(streamed, sensor_ids, end),
+    }
+    for bucket in (10, 60):
+        results[f"aggregate_{bucket}s_python"] = measure(
+            python_aggregate, sensor_ids, end, bucket
+        )
+        results[f"aggregate_{bucket}s_sql"] = measure(
+            sql_aggregate, sensor_ids, end, bucket
+        )
+
+    print(f"{'case':>22} {'seconds':>8} {'peak MB':>8}")
+    for name, result in results.items():
+        print(f"{name:>22} {result['seconds']:>8.2f} {result['peak_mb']:>8.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"database": engine.dialect.name, "args": vars(args), **results},
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
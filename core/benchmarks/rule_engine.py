@@ -0,0 +1,68 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from src.rules import CombinedRule, RuleEngine, ThresholdRule
+
+parser = argparse.ArgumentParser(description="Rule engine evaluation throughput")
+parser.add_argument("--rules", type=int, default=5000)
+parser.add_argument("--sensors", type=int, default=2000)
+parser.add_argument("--combined", type=int, default=500)
+parser.add_argument("--batch-size", type=int, default=10_000)
+parser.add_argument("--batches", type=int, default=100)
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+rules = [
+    ThresholdRule(
+        id=i,
+        sensor_id=int(rng.integers(args.sensors)),
+        above=float(rng.uniform(1.5, 3.0)),
+        below=float(rng.uniform(-3.0, -1.5)),
+        duration=float(rng.choice([0, 5, 30])),
+    )
+    for i in range(args.rules)
+]
+rules += [
+    CombinedRule(
+        id=args.rules + i,
+        rules=rng.choice(args.rules, size=3, replace=False).tolist(),
+        mode="all" if i % 2 else "any",
+    )
+    for i in range(args.combined)
+]
+
+engine = RuleEngine()
+started = time.perf_counter()
+engine.set_rules(rules)
+compile_time = time.perf_counter() - started
+
+alarms = 0
+elapsed = 0.0
+now = 0.0
+for _ in range(args.batches):
+    sensor_ids = rng.integers(args.sensors, size=args.batch_size)
+    mcu_ids = sensor_ids // 10
+    values = rng.normal(size=args.batch_size)
+    timestamps = now + np.sort(rng.uniform(0, 1, size=args.batch_size))
+    now += 1
+    started = time.perf_counter()
+    alarms += len(engine.evaluate(sensor_ids, mcu_ids, values, timestamps))
+    elapsed += time.perf_counter() - started
+
+results = {
+    "rules": args.rules,
+    "combined": args.combined,
+    "sensors": args.sensors,
+    "batch_size": args.batch_size,
+    "compile_ms": compile_time * 1000,
+    "samples_per_second": args.batch_size * args.batches / elapsed,
+    "batch_ms": elapsed / args.batches * 1000,
+    "alarms": alarms,
+}
+print(json.dumps(results, indent=2))
+if args.output:
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+parser = argparse.ArgumentParser(description="WebSocket hub fan-out load test")
+parser.add_argument("--subscribers", type=int, default=1000)
+parser.add_argument("--sensors", type=int, default=200)
+parser.add_argument("--sensors-per-subscriber", type=int, default=10)
+parser.add_argument("--wildcard-share", type=float, default=0.05)
+parser.add_argument("--batches-per-second", type=float, default=20)
+parser.add_argument("--duration", type=float, default=10)
+parser.add_argument("--client-processes", type=int, default=4)
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--database-url", default="sqlite:///bench_ws.db")
+parser.add_argument("--output", help="Write results as JSON to this file")
+args = parser.parse_args()
+
+BASE_URL = f"http://127.0.0.1:{args.port}"
+WS_URL = f"ws://127.0.0.1:{args.port}/ws"
+
+
+def start_core() -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=args.database_url)
+    for name in ("PGSQL_USER", "PGSQL_PASSWORD", "PGSQL_HOSTNAME", "PGSQL_DATABASE"):
+        env[name] = ""
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+
+
+def make_batch(timestamp: float) -> list[dict]:
+    return [
+        {
+            "fingerprint": "bench",
+            "mcu_name": f"mcu{i // 10}",
+            "sensor_name": f"s{i}",
+            "value": random.random(),
+            "timestamp": timestamp,
+        }
+        for i in range(args.sensors)
+    ]
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Core did not start")
+
+
+async def subscriber(url: str, latencies: list, ready: asyncio.Event, stop):
+    async with websockets.connect(url, max_queue=None) as ws:
+        ready.set()
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), 0.5)
+            except TimeoutError:
+                continue
+            received = time.time()
+            latencies.extend(received - m["published"] for m in json.loads(frame))
+
+
+async def run_subscribers(urls: list[str], connected, finished) -> list[float]:
+    latencies: list[float] = []
+    stop = asyncio.Event()
+    tasks = []
+    for url in urls:
+        ready = asyncio.Event()
+        tasks.append(asyncio.create_task(subscriber(url, latencies, ready, stop)))
+        await ready.wait()
+    connected.release()
+    await asyncio.to_thread(finished.wait)
+    await asyncio.sleep(1)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
+
+
+def subscriber_process(urls: list[str], connected, finished, results):
+    # Clients live in separate processes so decoding frames on the client side
+    # does not become the bottleneck being measured
+    results.put(asyncio.run(run_subscribers(urls, connected, finished)))
+
+
+def subscriber_urls(sensor_ids: list[int]) -> list[str]:
+    urls = []
+    for _ in range(args.subscribers):
+        if random.random() < args.wildcard_share:
+            urls.append(WS_URL)
+        else:
+            chosen = random.sample(sensor_ids, args.sensors_per_subscriber)
+            urls.append(f"{WS_URL}?sensors={','.join(map(str, chosen))}")
+    return urls
+
+
+async def run() -> dict:
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=30) as client:
+        await wait_ready(client)
+        # Registers every sensor so subscribers can filter on known ids
+        await client.post("/ingest", json=make_batch(time.time()))
+        latest = (await client.get("/sensors/latest")).json()
+        urls = subscriber_urls([item["sensor_id"] for item in latest])
+
+        connected = multiprocessing.Semaphore(0)
+        finished = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=subscriber_process,
+                args=(urls[i :: args.client_processes], connected, finished, results),
+            )
+            for i in range(args.client_processes)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            await asyncio.to_thread(connected.acquire)
+
+        period = 1 / args.batches_per_second
+        posted = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            t0 = time.perf_counter()
+            await client.post("/ingest", json=make_batch(time.time()))
+            posted += args.sensors
+            await asyncio.sleep(max(0.0, period - (time.perf_counter() - t0)))
+        elapsed = time.perf_counter() - started
+
+        finished.set()
+        latencies = []
+        for _ in processes:
+            latencies.extend(await asyncio.to_thread(results.get))
+        for process in processes:
+            process.join()
+
+    latencies.sort()
+    return {
+        "subscribers": args.subscribers,
+        "samples_posted": posted,
+        "ingest_rate": posted / elapsed,
+        "messages_received": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1e3 if latencies else None,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1e3
+        if latencies
+        else None,
+    }
+
+
+def main():
+    core = start_core()
+    try:
+        result = asyncio.run(run())
+    finally:
+        core.terminate()
+        core.wait()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "result": result}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,115 @@
-from fastapi import FastAPI
+import asyncio
+import gzip
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from datetime import UTC, datetime
+from typing import Optional
+
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sensors.batch import CONTENT_TYPE as BATCH_CONTENT_TYPE
+from sensors.batch import SensorBatch
+from sensors.data import SensorData
+from sensors.metrics import REGISTRY, Counter, Gauge, Histogram
+from src.cache import identity_cache, latest_values
+from src.db.chunks import CHUNK_MAX_AGE, chunks_enabled, compact_history
+from src.db.ingest import check_timestamps, ingest_batch
+from src.db.partitions import maintain_partitions
+from src.db.rollups import latest_from_rollups, read_history
+from src.db.rules import create_rule, delete_rule, load_rules
+from src.db.stream import stream_history
 from src.db.utils import init_db
+from src.export import (
+    ARROW_CONTENT_TYPE,
+    NDJSON_CONTENT_TYPE,
+    arrow_available,
+    arrow_stream,
+    ndjson_stream,
+)
+from src.hub import Severity, Subscriber, Subscription, hub
+from src.logger import log_error
+from src.rules import RuleDefinition, rule_engine
 
 init_db()
 
+MAINTENANCE_INTERVAL = 3600
+COMPACTION_INTERVAL = 60
+# Upper bound of max_points on GET /history/{sensor_id}
+MAX_HISTORY_POINTS = 10_000
+
+INGEST_SECONDS = Histogram("core_ingest_request_seconds", "POST /ingest handling time")
+INGEST_REJECTED = Counter("core_ingest_rejected_total", "Rejected ingest requests")
+RULES_SECONDS = Histogram("core_rules_evaluation_seconds", "Rule evaluation per batch")
+ALARMS = Counter("core_alarms_total", "Alarm state changes")
+Gauge("core_ws_subscribers", "Connected WebSocket subscribers").set_function(
+    lambda: len(hub.subscribers)
+)
+Gauge("core_latest_sensors", "Sensors with a cached latest value").set_function(
+    lambda: len(latest_values.items())
+)
+
+
+async def task_maintenance():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            await run_in_threadpool(maintain_partitions)
+        except Exception as e:
+            log_error(f"History maintenance failed: {e}")
+
+
+async def task_compaction():
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL)
+        try:
+            await run_in_threadpool(compact_history, CHUNK_MAX_AGE)
+        except Exception as e:
+            log_error(f"History compaction failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rule_engine.set_rules(await run_in_threadpool(load_rules))
+    # Current state is served from memory only, warm it once at startup
+    if not await run_in_threadpool(latest_values.load_from_redis):
+        latest_values.load(await run_in_threadpool(latest_from_rollups))
+    tasks = [asyncio.create_task(task_maintenance())]
+    if chunks_enabled():
+        tasks.append(asyncio.create_task(task_compaction()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 app = FastAPI(
     title="Graduate Work Core API",
     description="Core API for communication between system components",
     version="0.1.1",
+    lifespan=lifespan,
 )
 
+_records_adapter = TypeAdapter(list[SensorData])
+
+
+def _decode_batch(body: bytes, encoding: str, content_type: str) -> SensorBatch:
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    if content_type == BATCH_CONTENT_TYPE:
+        return SensorBatch.from_bytes(body)
+    return SensorBatch.from_data(_records_adapter.validate_json(body))
+
 
 @app.get("/")
 async def root():
@@ -22,3 +123,232 @@ async def health():
     return {
         "status": "ok",
     }
+
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    started = time.perf_counter()
+    body = await request.body()
+    encoding = request.headers.get("content-encoding", "")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        received = await run_in_threadpool(_decode_batch, body, encoding, content_type)
+    except ValidationError as e:
+        INGEST_REJECTED.inc()
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    except (OSError, EOFError, ValueError) as e:
+        INGEST_REJECTED.inc()
+        raise HTTPException(status_code=400, detail=f"Bad payload: {e}")
+    try:
+        check_timestamps(received)
+    except ValueError as e:
+        INGEST_REJECTED.inc()
+        raise HTTPException(status_code=422, detail=str(e))
+
+    batch = await run_in_threadpool(ingest_batch, received)
+    hub.publish_values(batch.sensor_ids, batch.mcu_ids, batch.values, batch.timestamps)
+    evaluation_started = time.perf_counter()
+    alarms = await run_in_threadpool(
+        rule_engine.evaluate,
+        batch.sensor_ids,
+        batch.mcu_ids,
+        batch.values,
+        batch.timestamps,
+    )
+    RULES_SECONDS.observe(time.perf_counter() - evaluation_started)
+    ALARMS.inc(len(alarms))
+    for alarm in alarms:
+        hub.publish_alarm(
+            alarm.sensor_id, alarm.mcu_id, alarm.rule.severity, alarm.payload()
+        )
+    INGEST_SECONDS.observe(time.perf_counter() - started)
+    return {
+        "rows": batch.rows,
+    }
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(UTC).replace(tzinfo=None)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/history")
+async def history_stream(
+    sensors: str,
+    start: datetime,
+    end: datetime,
+    bucket: Optional[int] = Query(default=None, gt=0),
+    aggregates: str = "avg",
+    format: str = "ndjson",
+):
+    # Streams samples, or per bucket aggregates, of several sensors. The
+    # response is written while the rows are read, see src/db/stream.py
+    try:
+        sensor_ids = sorted(_parse_ids(sensors) or ())
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Bad sensor list")
+    if not sensor_ids:
+        raise HTTPException(status_code=422, detail="No sensors given")
+    if format not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=422, detail=f"Unknown format: {format}")
+    if format == "arrow" and not arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow output needs pyarrow")
+    names = tuple(name for name in aggregates.split(",") if name)
+    try:
+        batches = stream_history(
+            sensor_ids, _naive_utc(start), _naive_utc(end), bucket, names
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if format == "arrow":
+        return StreamingResponse(
+            arrow_stream(batches, list(names) if bucket else ["value"]),
+            media_type=ARROW_CONTENT_TYPE,
+        )
+    return StreamingResponse(ndjson_stream(batches), media_type=NDJSON_CONTENT_TYPE)
+
+
+@app.get("/history/{sensor_id}")
+async def history(
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    max_points: int = Query(default=1000, gt=0, le=MAX_HISTORY_POINTS),
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+):
+    # Picking the resolution, decoding chunks and building the points is sync
+    # work, it runs in the threadpool so a large range does not stall the loop
+    resolution, points = await run_in_threadpool(
+        read_history,
+        sensor_id,
+        _naive_utc(start),
+        _naive_utc(end),
+        max_points,
+        min_value,
+        max_value,
+    )
+    return {
+        "sensor_id": sensor_id,
+        "resolution": resolution.name,
+        "points": points,
+    }
+
+
+@app.get("/sensors/latest")
+async def sensors_latest():
+    return [
+        {"sensor_id": sensor_id, "value": value, "timestamp": timestamp}
+        for sensor_id, (value, timestamp) in latest_values.items()
+    ]
+
+
+@app.get("/sensors/{sensor_id}/latest")
+async def sensor_latest(sensor_id: int):
+    latest = latest_values.get(sensor_id)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No data for this sensor")
+    value, timestamp = latest
+    return {"sensor_id": sensor_id, "value": value, "timestamp": timestamp}
+
+
+@app.get("/cache")
+async def cache_stats():
+    return {
+        "identity": identity_cache.stats(),
+        "latest": len(latest_values.items()),
+        "redis": identity_cache.redis is not None,
+    }
+
+
+def _describe_rule(rule) -> dict:
+    return {**asdict(rule), "severity": rule.severity.name}
+
+
+def _describe(alarm) -> dict:
+    return {
+        "sensor_id": alarm.sensor_id,
+        "mcu_id": alarm.mcu_id,
+        "severity": alarm.rule.severity.name,
+        **alarm.payload(),
+    }
+
+
+@app.get("/rules")
+async def rules_list():
+    return [_describe_rule(rule) for rule in rule_engine.rules]
+
+
+@app.post("/rules", status_code=201)
+async def rules_create(definition: RuleDefinition):
+    try:
+        rule = await run_in_threadpool(create_rule, definition)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _describe_rule(rule)
+
+
+@app.delete("/rules/{rule_id}")
+async def rules_delete(rule_id: int):
+    try:
+        deleted = await run_in_threadpool(delete_rule, rule_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="No such rule")
+    return {"deleted": rule_id}
+
+
+@app.get("/alarms/active")
+async def alarms_active():
+    return [_describe(alarm) for alarm in rule_engine.active()]
+
+
+def _parse_ids(raw: Optional[str]) -> Optional[set[int]]:
+    if not raw:
+        return None
+    return {int(part) for part in raw.split(",") if part}
+
+
+@app.websocket("/ws")
+async def websocket_subscribe(
+    websocket: WebSocket,
+    sensors: Optional[str] = None,
+    mcus: Optional[str] = None,
+    severity: str = "INFO",
+    values: bool = True,
+    alarms: bool = True,
+    coalesce: bool = True,
+):
+    try:
+        subscription = Subscription(
+            sensor_ids=_parse_ids(sensors),
+            mcu_ids=_parse_ids(mcus),
+            min_severity=Severity[severity.upper()],
+            values=values,
+            alarms=alarms,
+            coalesce=coalesce,
+        )
+    except (KeyError, ValueError):
+        await websocket.close(code=1008, reason="Bad subscription filter")
+        return
+
+    await websocket.accept()
+    subscriber = Subscriber(websocket=websocket, subscription=subscription)
+    sender = hub.start(subscriber)
+    try:
+        # Clients do not send anything, this only waits for the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+        sender.cancel()
@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from typing import Optional
+
+import numpy as np
+import redis
+from src.logger import log_info, log_warning
+
+CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 100_000))
+REDIS_URL = os.getenv("REDIS_URL")
+# Seconds to connect and per command. Kept short: an unreachable Redis must
+# fall back to the database instead of stalling every ingest batch
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", 0.25))
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_many(self, keys: Iterable[Hashable]) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._items.get(key)
+                if value is None:
+                    self.misses += 1
+                    continue
+                self._items.move_to_end(key)
+                found[key] = value
+                self.hits += 1
+        return found
+
+    def put_many(self, items: dict):
+        with self._lock:
+            for key, value in items.items():
+                self._items[key] = value
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def connect_redis(url: Optional[str]) -> Optional[redis.Redis]:
+    if not url:
+        return None
+    try:
+        client = redis.Redis.from_url(
+            url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+        )
+        client.ping()
+    except redis.RedisError as e:
+        log_warning(f"Redis at {url} is unavailable, using in-process cache: {e}")
+        return None
+    log_info(f"Using Redis cache at {url}")
+    return client
+
+
+class IdentityCache:
+    # Each namespace maps an external key (fingerprint, (collector_id, MCU
+    # name) or (mcu_id, sensor name)) to a database id. Lookups go
+    # LRU -> Redis -> DB.
+    def __init__(self, max_size: int, redis_client: Optional[redis.Redis] = None):
+        self.redis = redis_client
+        self._lru: dict[str, LRUCache] = {}
+        self._max_size = max_size
+
+    def _namespace(self, name: str) -> LRUCache:
+        lru = self._lru.get(name)
+        if lru is None:
+            lru = self._lru.setdefault(name, LRUCache(self._max_size))
+        return lru
+
+    @staticmethod
+    def _field(key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return ":".join(str(part) for part in key)
+        return str(key)
+
+    def resolve(
+        self,
+        namespace: str,
+        keys: set,
+        load: Callable[[set], dict],
+    ) -> dict:
+        lru = self._namespace(namespace)
+        ids = lru.get_many(keys)
+        missing = keys - ids.keys()
+        if not missing:
+            return ids
+
+        if self.redis is not None:
+            missing_keys = list(missing)
+            try:
+                values = self.redis.hmget(
+                    f"identity:{namespace}", [self._field(k) for k in missing_keys]
+                )
+            except redis.RedisError as e:
+                log_warning(f"Redis lookup failed: {e}")
+                values = [None] * len(missing_keys)
+            found = {
+                key: int(value)
+                for key, value in zip(missing_keys, values)
+                if value is not None
+            }
+            lru.put_many(found)
+            ids.update(found)
+            missing -= found.keys()
+            if not missing:
+                return ids
+
+        loaded = load(missing)
+        lru.put_many(loaded)
+        ids.update(loaded)
+        if self.redis is not None and loaded:
+            try:
+                self.redis.hset(
+                    f"identity:{namespace}",
+                    mapping={self._field(k): v for k, v in loaded.items()},
+                )
+            except redis.RedisError as e:
+                log_warning(f"Redis update failed: {e}")
+        return ids
+
+    def stats(self) -> dict:
+        return {
+            name: {"size": len(lru), "hits": lru.hits, "misses": lru.misses}
+            for name, lru in self._lru.items()
+        }
+
+
+class LatestValues:
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self.redis = redis_client
+        self._values: dict[int, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, sensor_id: int) -> Optional[tuple[float, float]]:
+        return self._values.get(sensor_id)
+
+    def items(self) -> list[tuple[int, tuple[float, float]]]:
+        return list(self._values.items())
+
+    def load(self, latest: dict[int, tuple[float, float]]):
+        with self._lock:
+            for sensor_id, (value, timestamp) in latest.items():
+                current = self._values.get(sensor_id)
+                if current is None or current[1] <= timestamp:
+                    self._values[sensor_id] = (value, timestamp)
+
+    def load_from_redis(self) -> bool:
+        if self.redis is None:
+            return False
+        try:
+            stored = self.redis.hgetall("latest")
+        except redis.RedisError as e:
+            log_warning(f"Redis read failed: {e}")
+            return False
+        latest = {}
+        for sensor_id, packed in stored.items():
+            value, timestamp = packed.decode().split(",")
+            latest[int(sensor_id)] = (float(value), float(timestamp))
+        self.load(latest)
+        return bool(latest)
+
+    def update(
+        self, sensor_ids: np.ndarray, values: np.ndarray, timestamps: np.ndarray
+    ):
+        if len(sensor_ids) == 0:
+            return
+        # Latest sample per sensor in the batch: sort by (sensor, timestamp)
+        # and take the last element of every sensor group
+        order = np.lexsort((timestamps, sensor_ids))
+        sorted_ids = sensor_ids[order]
+        last = order[np.append(sorted_ids[1:] != sorted_ids[:-1], True)]
+
+        changed = {}
+        with self._lock:
+            for sensor_id, value, timestamp in zip(
+                sensor_ids[last].tolist(),
+                values[last].tolist(),
+                timestamps[last].tolist(),
+            ):
+                current = self._values.get(sensor_id)
+                if current is None or current[1] <= timestamp:
+                    self._values[sensor_id] = (value, timestamp)
+                    changed[sensor_id] = f"{value!r},{timestamp!r}"
+
+        if self.redis is not None and changed:
+            try:
+                self.redis.hset("latest", mapping=changed)
+            except redis.RedisError as e:
+                log_warning(f"Redis update failed: {e}")
+
+
+_redis = connect_redis(REDIS_URL)
+identity_cache = IdentityCache(max_size=CACHE_SIZE, redis_client=_redis)
+latest_values = LatestValues(redis_client=_redis)
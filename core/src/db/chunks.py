@@ -0,0 +1,403 @@
+import argparse
+import os
+import struct
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sensors.metrics import Counter
+from sqlalchemy import Connection, delete, func, insert, or_, select, tuple_
+from src.db.engine import get_engine
+from src.db.models import History_Table, HistoryChunk_Table
+from src.logger import log_info
+
+engine = get_engine()
+
+# Chunked history: the history table stays the write path, a compaction job
+# moves every sensor's samples into compressed chunks of CHUNK_SIZE points.
+# Queries read both and merge them.
+#
+# A chunk encodes timestamps as zigzag delta-of-delta varints and values
+# Gorilla-style, XOR against the previous value. The XOR keeps only its
+# meaningful bytes, not bits: byte alignment lets numpy encode and decode a
+# whole chunk without a Python loop, a flat or regular series still costs
+# about 2 bytes per point.
+#
+#   header   magic "GCH1", u32 count, i64 first timestamp (us), u32 ts size
+#   ts       varint(zigzag(delta of delta)) x (count - 1)
+#   headers  u8 x count, leading zero bytes * 9 + meaningful bytes of the XOR
+#   payload  meaningful XOR bytes, big endian, concatenated
+
+HISTORY_STORAGE = os.getenv("HISTORY_STORAGE", "rows")
+CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", 1000))
+# Rows this old are chunked even when they do not fill a chunk
+CHUNK_MAX_AGE = float(os.getenv("HISTORY_CHUNK_MAX_AGE", 3600))
+# Bounds the time span of a chunk, so a range query only looks this far back
+CHUNK_MAX_SPAN = timedelta(seconds=float(os.getenv("HISTORY_CHUNK_MAX_SPAN", 86400)))
+
+COMPACTED_ROWS = Counter("core_compacted_rows_total", "History rows moved to chunks")
+CHUNKS_WRITTEN = Counter("core_chunks_written_total", "History chunks written")
+
+_MAGIC = b"GCH1"
+_HEADER = struct.Struct("<4sIqI")
+_EPOCH = np.datetime64("1970-01-01T00:00:00", "us")
+_EPOCH_DATETIME = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_BYTE_COLUMNS = np.arange(8)
+
+
+def chunks_enabled() -> bool:
+    return HISTORY_STORAGE == "chunks"
+
+
+def to_micros(moments: list[datetime]) -> np.ndarray:
+    # Several times faster than np.array(moments, "datetime64[us]")
+    return np.fromiter(
+        ((moment - _EPOCH_DATETIME) // _MICROSECOND for moment in moments),
+        np.int64,
+        len(moments),
+    )
+
+
+def from_micros(micros: np.ndarray) -> list[datetime]:
+    return (micros.astype("timedelta64[us]") + _EPOCH).tolist()
+
+
+def _varints(numbers: np.ndarray) -> np.ndarray:
+    # LEB128 of unsigned numbers, 7 bits per byte, high bit set on all but
+    # the last byte of a number
+    sizes = np.ones(len(numbers), np.int64)
+    rest = numbers >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    owner = np.repeat(np.arange(len(numbers)), sizes)
+    position = np.arange(len(owner)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    out = (numbers[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(
+        0x7F
+    )
+    out |= (position < sizes[owner] - 1).astype(np.uint64) << np.uint64(7)
+    return out.astype(np.uint8)
+
+
+def _from_varints(data: np.ndarray) -> np.ndarray:
+    if not len(data):
+        return np.empty(0, np.uint64)
+    last = (data & 0x80) == 0
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    owner = np.cumsum(last) - last
+    position = np.arange(len(data)) - starts[owner]
+    parts = (data & 0x7F).astype(np.uint64) << (
+        np.uint64(7) * position.astype(np.uint64)
+    )
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def encode_chunk(timestamps: np.ndarray, values: np.ndarray) -> bytes:
+    # timestamps in microseconds, sorted
+    count = len(timestamps)
+    deltas = np.diff(timestamps)
+    dods = np.diff(deltas, prepend=0)
+    zigzag = ((dods << 1) ^ (dods >> 63)).view(np.uint64)
+    ts = _varints(zigzag)
+
+    bits = np.ascontiguousarray(values, np.float64).view(np.uint64)
+    xors = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+    columns = xors.astype(">u8").view(np.uint8).reshape(count, 8)
+    nonzero = columns != 0
+    empty = ~nonzero.any(axis=1)
+    leading = np.where(empty, 8, nonzero.argmax(axis=1))
+    trailing = np.where(empty, 0, nonzero[:, ::-1].argmax(axis=1))
+    meaningful = 8 - leading - trailing
+    mask = (_BYTE_COLUMNS >= leading[:, None]) & (
+        _BYTE_COLUMNS < (leading + meaningful)[:, None]
+    )
+    headers = (leading * 9 + meaningful).astype(np.uint8)
+
+    return b"".join(
+        (
+            _HEADER.pack(_MAGIC, count, int(timestamps[0]), len(ts)),
+            ts.tobytes(),
+            headers.tobytes(),
+            columns[mask].tobytes(),
+        )
+    )
+
+
+def decode_chunk(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    magic, count, first, ts_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a history chunk")
+    buffer = np.frombuffer(data, np.uint8)
+    offset = _HEADER.size
+
+    zigzag = _from_varints(buffer[offset : offset + ts_size])
+    offset += ts_size
+    dods = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(
+        np.int64
+    )
+    timestamps = np.empty(count, np.int64)
+    timestamps[0] = first
+    np.cumsum(np.cumsum(dods), out=timestamps[1:])
+    timestamps[1:] += first
+
+    headers = buffer[offset : offset + count]
+    offset += count
+    leading, meaningful = headers // 9, headers % 9
+    mask = (_BYTE_COLUMNS >= leading[:, None]) & (
+        _BYTE_COLUMNS < (leading + meaningful)[:, None]
+    )
+    columns = np.zeros((count, 8), np.uint8)
+    columns[mask] = buffer[offset:]
+    xors = columns.view(">u8").reshape(count).astype(np.uint64)
+    values = np.bitwise_xor.accumulate(xors).view(np.float64)
+    return timestamps, values
+
+
+@dataclass
+class ChunkStats:
+    sensors: int = 0
+    rows: int = 0
+    chunks: int = 0
+
+
+def _split(timestamps: np.ndarray, final: bool) -> list[tuple[int, int]]:
+    # [start, end) index ranges: CHUNK_SIZE points at most, CHUNK_MAX_SPAN
+    # wide at most. The trailing partial range is only taken when final.
+    span = CHUNK_MAX_SPAN // timedelta(microseconds=1)
+    ranges = []
+    start = 0
+    while start < len(timestamps):
+        end = min(start + CHUNK_SIZE, len(timestamps))
+        end = min(
+            end,
+            int(np.searchsorted(timestamps, timestamps[start] + span, side="right")),
+        )
+        if end - start < CHUNK_SIZE and end == len(timestamps) and not final:
+            break
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _write_chunks(
+    conn: Connection,
+    sensor_id: int,
+    ranges: list[tuple[int, int]],
+    ids: np.ndarray,
+    values: np.ndarray,
+    timestamps: np.ndarray,
+    moments: list[datetime],
+):
+    conn.execute(
+        insert(HistoryChunk_Table),
+        [
+            {
+                "sensor_id": sensor_id,
+                "start": moments[start],
+                "end": moments[end - 1],
+                "count": end - start,
+                "min": float(values[start:end].min()),
+                "max": float(values[start:end].max()),
+                "data": encode_chunk(timestamps[start:end], values[start:end]),
+            }
+            for start, end in ranges
+        ],
+    )
+    # Rows are in time order, the time range of every slice lets PostgreSQL
+    # prune the history partitions it does not touch
+    moved = ranges[-1][1]
+    history = History_Table.__table__.c
+    for offset in range(0, moved, 10_000):
+        end = min(offset + 10_000, moved)
+        conn.execute(
+            delete(History_Table).where(
+                history.sensor_id == sensor_id,
+                history.timestamp >= moments[offset],
+                history.timestamp <= moments[end - 1],
+                history.id.in_(ids[offset:end].tolist()),
+            )
+        )
+
+
+def _compact_sensor(conn: Connection, sensor_id: int, cutoff: datetime) -> ChunkStats:
+    # Pages of CHUNK_SIZE rows in (timestamp, id) order. Rows that do not
+    # fill a chunk yet are carried over to the next page.
+    history = History_Table.__table__.c
+    stats = ChunkStats()
+    ids = np.empty(0, np.int64)
+    values = np.empty(0, np.float64)
+    timestamps = np.empty(0, np.int64)
+    moments: list[datetime] = []
+    after = None
+    while True:
+        query = select(history.id, history.value, history.timestamp).where(
+            history.sensor_id == sensor_id
+        )
+        if after is not None:
+            query = query.where(tuple_(history.timestamp, history.id) > after)
+        rows = conn.execute(
+            query.order_by(history.timestamp, history.id).limit(CHUNK_SIZE)
+        ).all()
+        done = len(rows) < CHUNK_SIZE
+        if rows:
+            after = (rows[-1][2], rows[-1][0])
+            ids = np.append(ids, np.fromiter((row[0] for row in rows), np.int64))
+            values = np.append(
+                values, np.fromiter((row[1] for row in rows), np.float64)
+            )
+            page = [row[2] for row in rows]
+            timestamps = np.append(timestamps, to_micros(page))
+            moments += page
+
+        ranges = _split(timestamps, final=False)
+        if done:
+            # Rows older than the cutoff are chunked even without a full chunk
+            taken = ranges[-1][1] if ranges else 0
+            old = int(np.searchsorted(timestamps, to_micros([cutoff])[0]))
+            if taken < old:
+                ranges += [
+                    (taken + start, taken + end)
+                    for start, end in _split(timestamps[taken:old], final=True)
+                ]
+        if ranges:
+            _write_chunks(conn, sensor_id, ranges, ids, values, timestamps, moments)
+            moved = ranges[-1][1]
+            stats.rows += moved
+            stats.chunks += len(ranges)
+            ids, values, timestamps = ids[moved:], values[moved:], timestamps[moved:]
+            moments = moments[moved:]
+        if done:
+            break
+    stats.sensors = int(stats.rows > 0)
+    return stats
+
+
+def compact_history(max_age: float = CHUNK_MAX_AGE) -> ChunkStats:
+    # Sensors with a full chunk of rows, or with rows older than max_age
+    cutoff = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=max_age)
+    history = History_Table.__table__.c
+    with engine.connect() as conn:
+        sensor_ids = conn.execute(
+            select(history.sensor_id)
+            .group_by(history.sensor_id)
+            .having(
+                or_(func.count() >= CHUNK_SIZE, func.min(history.timestamp) < cutoff)
+            )
+        ).scalars()
+        sensor_ids = list(sensor_ids)
+
+    total = ChunkStats()
+    for sensor_id in sensor_ids:
+        # One transaction per sensor: rows leave history in the same commit
+        # that writes their chunks
+        with engine.begin() as conn:
+            stats = _compact_sensor(conn, sensor_id, cutoff)
+        total.sensors += stats.sensors
+        total.rows += stats.rows
+        total.chunks += stats.chunks
+    COMPACTED_ROWS.inc(total.rows)
+    CHUNKS_WRITTEN.inc(total.chunks)
+    if total.rows:
+        log_info(
+            f"Compacted {total.rows} history rows of {total.sensors} sensor(s) "
+            f"into {total.chunks} chunk(s)"
+        )
+    return total
+
+
+def read_chunks(
+    conn: Connection,
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Samples in [start, end) as (microseconds, values), unsorted across
+    # chunks. Chunks are skipped on their time and value range before
+    # anything is decoded.
+    chunk = HistoryChunk_Table.__table__.c
+    conditions = [
+        chunk.sensor_id == sensor_id,
+        chunk.start >= start - CHUNK_MAX_SPAN,
+        chunk.start < end,
+        chunk.end >= start,
+    ]
+    if min_value is not None:
+        conditions.append(chunk.max >= min_value)
+    if max_value is not None:
+        conditions.append(chunk.min <= max_value)
+    blobs = conn.execute(select(chunk.data).where(*conditions)).scalars().all()
+    if not blobs:
+        return np.empty(0, np.int64), np.empty(0, np.float64)
+
+    low, high = to_micros([start, end])
+    parts_t, parts_v = [], []
+    for blob in blobs:
+        timestamps, values = decode_chunk(blob)
+        keep = (timestamps >= low) & (timestamps < high)
+        if min_value is not None:
+            keep &= values >= min_value
+        if max_value is not None:
+            keep &= values <= max_value
+        parts_t.append(timestamps[keep])
+        parts_v.append(values[keep])
+    return np.concatenate(parts_t), np.concatenate(parts_v)
+
+
+def iter_chunks(
+    conn: Connection, start: datetime, end: datetime, batch_size: int = 100
+):
+    # (sensor_ids, values, epoch seconds) of every sensor in [start, end), per
+    # batch of chunks, for rebuilding rollups
+    chunk = HistoryChunk_Table.__table__.c
+    low, high = to_micros([start, end])
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(chunk.id, chunk.sensor_id, chunk.data)
+            .where(
+                chunk.id > last_id,
+                chunk.start >= start - CHUNK_MAX_SPAN,
+                chunk.start < end,
+                chunk.end >= start,
+            )
+            .order_by(chunk.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        sensor_ids, values, timestamps = [], [], []
+        for _, sensor_id, data in rows:
+            micros, chunk_values = decode_chunk(data)
+            keep = (micros >= low) & (micros < high)
+            sensor_ids.append(np.full(int(keep.sum()), sensor_id, np.int64))
+            values.append(chunk_values[keep])
+            timestamps.append(micros[keep] / 1e6)
+        yield (
+            np.concatenate(sensor_ids),
+            np.concatenate(values),
+            np.concatenate(timestamps),
+        )
+
+
+def drop_chunks_before(cutoff: datetime) -> int:
+    with engine.begin() as conn:
+        return conn.execute(
+            delete(HistoryChunk_Table).where(HistoryChunk_Table.end < cutoff)
+        ).rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move history rows into chunks")
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=CHUNK_MAX_AGE,
+        help="Also chunk rows older than this without a full chunk, s",
+    )
+    args = parser.parse_args()
+    compact_history(args.max_age)
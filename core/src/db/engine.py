@@ -2,8 +2,10 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from src.logger import log_info
+from sensors.metrics import Gauge
+from sqlalchemy import Engine, QueuePool, create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from src.logger import log_info, log_warning
 
 if Path(".env").exists():
     log_info("Loading environment variables from .env file")
@@ -14,14 +16,90 @@ USER = os.getenv("PGSQL_USER")
 PASSWORD = os.getenv("PGSQL_PASSWORD")
 HOSTNAME = os.getenv("PGSQL_HOSTNAME")
 DATABASE_NAME = os.getenv("PGSQL_DATABASE")
-if not (USER and PASSWORD and HOSTNAME and DATABASE_NAME):
-    raise ValueError("Environment variables for database not set")
 
-_engine = create_engine(
-    f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOSTNAME}/{DATABASE_NAME}"
+if USER and PASSWORD and HOSTNAME and DATABASE_NAME:
+    DATABASE_URL = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOSTNAME}/{DATABASE_NAME}"
+elif os.getenv("DATABASE_URL"):
+    DATABASE_URL = os.getenv("DATABASE_URL")
+else:
+    # Local runs and tests without PostgreSQL
+    DATABASE_URL = "sqlite:///core.db"
+    log_warning("Environment variables for database not set, using SQLite")
+
+# Per engine, and there are two: the sync one (ingest, background jobs,
+# threadpool endpoints) and the async one (request sessions)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+# Connections older than this are replaced on checkout, s; -1 never
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# How long a checkout waits for a free connection before it fails, s
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# Sync drivers and their asyncio counterparts
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+POOL_SIZE_GAUGE = Gauge("core_db_pool_size", "Connections kept in the pool", ["engine"])
+POOL_CHECKED_OUT = Gauge(
+    "core_db_pool_checked_out", "Pool connections in use", ["engine"]
 )
+POOL_OVERFLOW = Gauge(
+    "core_db_pool_overflow", "Connections opened beyond the pool size", ["engine"]
+)
+
+
+def _pool_options(url: str) -> dict:
+    parsed = make_url(url)
+    in_memory = parsed.database in (None, "", ":memory:")
+    if parsed.get_backend_name() == "sqlite" and in_memory:
+        # In-memory SQLite lives in a single connection, keep SQLAlchemy's pool
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    }
+
+
+def _watch_pool(engine: Engine, name: str):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    POOL_SIZE_GAUGE.labels(name).set_function(pool.size)
+    POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    # overflow() counts from -pool_size while the pool is filling up
+    POOL_OVERFLOW.labels(name).set_function(lambda: max(0, pool.overflow()))
+
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(False) if driver else url
+
+
+_engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL))
+_watch_pool(_engine, "sync")
 log_info("Database connection established!")
 
+_async_engine = None
+
 
 def get_engine():
     return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    # Created on first use: scripts and jobs that only use the sync engine
+    # do not need the asyncio driver
+    global _async_engine
+    if _async_engine is None:
+        url = async_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, **_pool_options(url))
+        _watch_pool(_async_engine.sync_engine, "async")
+    return _async_engine
@@ -0,0 +1,272 @@
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+import numpy as np
+from sensors.batch import SensorBatch
+from sensors.data import SensorData
+from sensors.metrics import SIZE_BUCKETS, Counter, Histogram
+from src.cache import identity_cache, latest_values
+from sqlalchemy import Connection, insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.db.engine import get_engine
+from src.db.models import Collectors_Table, History_Table, MCUs_Table, Sensors_Table
+from src.db.partitions import ensure_partitions_for
+from src.db.rollups import apply_rollups
+
+engine = get_engine()
+
+INGEST_ROWS = Counter("core_ingest_rows_total", "History rows committed")
+INGEST_BATCH_SIZE = Histogram(
+    "core_ingest_batch_size", "Rows per ingest batch", buckets=SIZE_BUCKETS
+)
+DB_COMMIT_SECONDS = Histogram(
+    "core_db_commit_seconds", "History insert, rollup upsert and commit"
+)
+
+# Samples outside [INGEST_EARLIEST_TIMESTAMP, now + INGEST_MAX_FUTURE_SECONDS]
+# are rejected: a device with a broken clock (1970, 2100) would otherwise
+# create partitions and rollups far off
+EARLIEST_TIMESTAMP = (
+    datetime.fromisoformat(os.getenv("INGEST_EARLIEST_TIMESTAMP", "2000-01-01"))
+    .replace(tzinfo=UTC)
+    .timestamp()
+)
+MAX_FUTURE_SECONDS = float(os.getenv("INGEST_MAX_FUTURE_SECONDS", 86400))
+
+# Serializes creation of unknown entities inside one process. Across processes
+# the unique constraints plus ON CONFLICT DO NOTHING keep the tables clean.
+_create_lock = threading.Lock()
+
+
+def _insert_ignore(conn: Connection, table, rows: list[dict]):
+    if conn.dialect.name == "postgresql":
+        statement = pg_insert(table).on_conflict_do_nothing()
+    elif conn.dialect.name == "sqlite":
+        statement = sqlite_insert(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    conn.execute(statement, rows)
+
+
+def resolve_collectors(conn: Connection, fingerprints: set[str]) -> dict[str, int]:
+    table = Collectors_Table.__table__
+    query = select(table.c.fingerprint, table.c.id).where(
+        table.c.fingerprint.in_(fingerprints)
+    )
+    ids = dict(conn.execute(query).all())
+    missing = fingerprints - ids.keys()
+    if missing:
+        with _create_lock:
+            _insert_ignore(conn, table, [{"fingerprint": f} for f in missing])
+            ids.update(conn.execute(query).all())
+    return ids
+
+
+def resolve_mcus(
+    conn: Connection, keys: set[tuple[int, str]]
+) -> dict[tuple[int, str], int]:
+    table = MCUs_Table.__table__
+    query = select(table.c.collector_id, table.c.name, table.c.id).where(
+        tuple_(table.c.collector_id, table.c.name).in_(keys)
+    )
+    ids = {(collector_id, name): id for collector_id, name, id in conn.execute(query)}
+    missing = keys - ids.keys()
+    if missing:
+        with _create_lock:
+            _insert_ignore(
+                conn,
+                table,
+                [
+                    {"collector_id": collector_id, "name": name}
+                    for collector_id, name in missing
+                ],
+            )
+            ids.update(
+                ((collector_id, name), id)
+                for collector_id, name, id in conn.execute(query)
+            )
+    return ids
+
+
+def resolve_sensors(
+    conn: Connection, keys: set[tuple[int, str]]
+) -> dict[tuple[int, str], int]:
+    table = Sensors_Table.__table__
+    query = select(table.c.mcu_id, table.c.name, table.c.id).where(
+        tuple_(table.c.mcu_id, table.c.name).in_(keys)
+    )
+    ids = {(mcu_id, name): id for mcu_id, name, id in conn.execute(query)}
+    missing = keys - ids.keys()
+    if missing:
+        with _create_lock:
+            _insert_ignore(
+                conn,
+                table,
+                [{"mcu_id": mcu_id, "name": name} for mcu_id, name in missing],
+            )
+            ids.update(((mcu_id, name), id) for mcu_id, name, id in conn.execute(query))
+    return ids
+
+
+def to_datetime(timestamp: float) -> datetime:
+    # History stores naive UTC timestamps
+    return datetime.fromtimestamp(timestamp, UTC).replace(tzinfo=None)
+
+
+def check_timestamps(batch: SensorBatch):
+    timestamps = np.asarray(batch.timestamps, np.float64)
+    # Written as a negation so NaN counts as implausible too
+    bad = ~(
+        (timestamps >= EARLIEST_TIMESTAMP)
+        & (timestamps <= time.time() + MAX_FUTURE_SECONDS)
+    )
+    if bad.any():
+        first = int(np.argmax(bad))
+        _, mcu_name, sensor_name = batch.series[int(batch.ids[first])]
+        raise ValueError(
+            f"{int(bad.sum())} sample(s) with implausible timestamps, "
+            f"first {float(timestamps[first])!r} from {mcu_name}/{sensor_name}"
+        )
+
+
+def _copy_history(conn: Connection, rows: list[tuple]):
+    buffer = io.StringIO()
+    buffer.writelines(
+        f"{collector_id}\t{mcu_id}\t{sensor_id}\t{value!r}\t{timestamp.isoformat()}\n"
+        for collector_id, mcu_id, sensor_id, value, timestamp in rows
+    )
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY history (collector_id, mcu_id, sensor_id, value, timestamp) "
+            "FROM STDIN",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_history(conn: Connection, rows: list[tuple]):
+    conn.execute(
+        insert(History_Table),
+        [
+            {
+                "collector_id": collector_id,
+                "mcu_id": mcu_id,
+                "sensor_id": sensor_id,
+                "value": value,
+                "timestamp": timestamp,
+            }
+            for collector_id, mcu_id, sensor_id, value, timestamp in rows
+        ],
+    )
+
+
+@dataclass
+class IngestedBatch:
+    rows: int
+    sensor_ids: np.ndarray
+    mcu_ids: np.ndarray
+    values: np.ndarray
+    timestamps: np.ndarray
+
+
+def _in_transaction(resolver):
+    def load(keys: set) -> dict:
+        # Unknown entities are created and committed on their own, so the
+        # cache never holds ids from a rolled back ingest transaction
+        with engine.begin() as conn:
+            return resolver(conn, keys)
+
+    return load
+
+
+def ingest_records(records: list[SensorData]) -> IngestedBatch:
+    return ingest_batch(SensorBatch.from_data(records))
+
+
+def ingest_batch(batch: SensorBatch) -> IngestedBatch:
+    if not len(batch):
+        empty = np.empty(0)
+        return IngestedBatch(0, empty, empty, empty, empty)
+
+    batch_timestamps = np.asarray(batch.timestamps, np.float64)
+    batch_values = np.asarray(batch.values, np.float64)
+    ensure_partitions_for(batch_timestamps)
+
+    # Identities are resolved once per series, samples pick them up by index
+    series = batch.series
+    collector_ids = identity_cache.resolve(
+        "collectors",
+        {fingerprint for fingerprint, _, _ in series},
+        _in_transaction(resolve_collectors),
+    )
+    # MCU names are only unique within a collector
+    series_mcu_keys = [
+        (collector_ids[fingerprint], mcu_name) for fingerprint, mcu_name, _ in series
+    ]
+    mcu_ids = identity_cache.resolve(
+        "mcus", set(series_mcu_keys), _in_transaction(resolve_mcus)
+    )
+    series_mcu_ids = [mcu_ids[key] for key in series_mcu_keys]
+    sensor_ids = identity_cache.resolve(
+        "sensors",
+        {
+            (mcu_id, sensor_name)
+            for mcu_id, (_, _, sensor_name) in zip(series_mcu_ids, series)
+        },
+        _in_transaction(resolve_sensors),
+    )
+    series_collectors = np.fromiter(
+        (collector_ids[fingerprint] for fingerprint, _, _ in series),
+        np.int64,
+        len(series),
+    )
+    series_mcus = np.array(series_mcu_ids, np.int64)
+    series_sensors = np.fromiter(
+        (
+            sensor_ids[(mcu_id, sensor_name)]
+            for mcu_id, (_, _, sensor_name) in zip(series_mcu_ids, series)
+        ),
+        np.int64,
+        len(series),
+    )
+    batch_collector_ids = series_collectors[batch.ids]
+    batch_mcu_ids = series_mcus[batch.ids]
+    batch_sensor_ids = series_sensors[batch.ids]
+
+    rows = list(
+        zip(
+            batch_collector_ids.tolist(),
+            batch_mcu_ids.tolist(),
+            batch_sensor_ids.tolist(),
+            batch_values.tolist(),
+            map(to_datetime, batch_timestamps.tolist()),
+        )
+    )
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            _copy_history(conn, rows)
+        else:
+            _insert_history(conn, rows)
+        apply_rollups(conn, batch_sensor_ids, batch_values, batch_timestamps)
+    DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+    INGEST_ROWS.inc(len(rows))
+    INGEST_BATCH_SIZE.observe(len(rows))
+
+    latest_values.update(batch_sensor_ids, batch_values, batch_timestamps)
+    return IngestedBatch(
+        rows=len(rows),
+        sensor_ids=batch_sensor_ids,
+        mcu_ids=batch_mcu_ids,
+        values=batch_values,
+        timestamps=batch_timestamps,
+    )
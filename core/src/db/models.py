@@ -1,4 +1,15 @@
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    JSON,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -6,8 +17,11 @@ Base = declarative_base()
 
 class MCUs_Table(Base):
     __tablename__ = "mcus"
+    # MCU names are only unique within a collector
+    __table_args__ = (UniqueConstraint("collector_id", "name"),)
 
     id = Column(Integer, primary_key=True)
+    collector_id = Column(Integer, ForeignKey("collectors.id"), nullable=False)
     name = Column(String(100), nullable=False)
     description = Column(String(255), nullable=True)
 
@@ -16,11 +30,12 @@ class Collectors_Table(Base):
     __tablename__ = "collectors"
 
     id = Column(Integer, primary_key=True)
-    fingerprint = Column(String(255), nullable=False)
+    fingerprint = Column(String(255), nullable=False, unique=True)
 
 
 class Sensors_Table(Base):
     __tablename__ = "sensors"
+    __table_args__ = (UniqueConstraint("mcu_id", "name"),)
 
     id = Column(Integer, primary_key=True)
     mcu_id = Column(Integer, ForeignKey("mcus.id"), nullable=False)
@@ -29,6 +44,11 @@ class Sensors_Table(Base):
 
 class History_Table(Base):
     __tablename__ = "history"
+    # Per-sensor time range lookups. On PostgreSQL the table is additionally
+    # partitioned by timestamp, see src.db.partitions
+    __table_args__ = (
+        Index("ix_history_sensor_id_timestamp", "sensor_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True)
     collector_id = Column(Integer, ForeignKey("collectors.id"), nullable=False)
@@ -36,3 +56,57 @@ class History_Table(Base):
     sensor_id = Column(Integer, ForeignKey("sensors.id"), nullable=False)
     value = Column(Float(16), nullable=False)
     timestamp = Column(DateTime(), nullable=False)
+
+
+class HistoryChunk_Table(Base):
+    __tablename__ = "history_chunks"
+    # Compressed runs of one sensor's history, see src.db.chunks. Chunks of
+    # a sensor may overlap in time when late samples arrive.
+    __table_args__ = (Index("ix_history_chunks_sensor_id_start", "sensor_id", "start"),)
+
+    id = Column(Integer, primary_key=True)
+    sensor_id = Column(Integer, ForeignKey("sensors.id"), nullable=False)
+    start = Column(DateTime(), nullable=False)
+    end = Column(DateTime(), nullable=False)
+    count = Column(Integer, nullable=False)
+    min = Column(Float(16), nullable=False)
+    max = Column(Float(16), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class _RollupColumns:
+    sensor_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(), primary_key=True)
+    min = Column(Float(16), nullable=False)
+    max = Column(Float(16), nullable=False)
+    sum = Column(Float(16), nullable=False)
+    count = Column(Integer, nullable=False)
+    last = Column(Float(16), nullable=False)
+    last_timestamp = Column(DateTime(), nullable=False)
+
+
+class HistoryMinute_Table(_RollupColumns, Base):
+    __tablename__ = "history_1m"
+
+
+class HistoryHour_Table(_RollupColumns, Base):
+    __tablename__ = "history_1h"
+
+
+class HistoryDay_Table(_RollupColumns, Base):
+    __tablename__ = "history_1d"
+
+
+class Rules_Table(Base):
+    __tablename__ = "rules"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    severity = Column(String(16), nullable=False)
+    # Threshold rules watch one sensor, combined rules reference other rules
+    sensor_id = Column(Integer, ForeignKey("sensors.id"), nullable=True)
+    above = Column(Float(16), nullable=True)
+    below = Column(Float(16), nullable=True)
+    duration = Column(Float(16), nullable=False, default=0.0)
+    mode = Column(String(8), nullable=True)
+    children = Column(JSON(none_as_null=True), nullable=True)
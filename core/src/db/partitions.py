@@ -0,0 +1,308 @@
+import argparse
+import os
+import threading
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import Connection, delete, inspect, text
+from src.db.chunks import drop_chunks_before
+from src.db.engine import get_engine
+from src.db.models import Base, History_Table
+from src.logger import log_info, log_warning
+
+engine = get_engine()
+
+PARTITION_DAYS = int(os.getenv("HISTORY_PARTITION_DAYS", 1))
+PARTITIONS_AHEAD = int(os.getenv("HISTORY_PARTITIONS_AHEAD", 3))
+RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 0))  # 0 keeps everything
+
+_EPOCH = datetime(1970, 1, 1)
+_PARTITION_PREFIX = "history_p"
+
+_known_partitions: set[str] = set()
+_partitions_lock = threading.Lock()
+# False while history is still the plain table of older versions, see
+# migrate_history()
+_partitioned = True
+
+_CREATE_PARTITIONED_HISTORY = """
+CREATE TABLE history (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    collector_id INTEGER NOT NULL REFERENCES collectors (id),
+    mcu_id INTEGER NOT NULL REFERENCES mcus (id),
+    sensor_id INTEGER NOT NULL REFERENCES sensors (id),
+    value DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+
+def _is_postgresql(conn: Connection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+def partition_bounds(moment: datetime) -> tuple[datetime, datetime]:
+    days = (moment - _EPOCH).days // PARTITION_DAYS * PARTITION_DAYS
+    start = _EPOCH + timedelta(days=days)
+    return start, start + timedelta(days=PARTITION_DAYS)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{_PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def list_partitions(conn: Connection) -> list[str]:
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'history' ORDER BY c.relname"
+        )
+    )
+    return [name for (name,) in rows]
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return (
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = 'history'"
+            )
+        ).first()
+        is not None
+    )
+
+
+def _create_partition(conn: Connection, start: datetime):
+    name = partition_name(start)
+    end = start + timedelta(days=PARTITION_DAYS)
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF history "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+    _known_partitions.add(name)
+
+
+def ensure_partitions(start: datetime, end: datetime):
+    moments = []
+    moment, _ = partition_bounds(start)
+    while moment <= end:
+        moments.append(moment)
+        moment += timedelta(days=PARTITION_DAYS)
+    _ensure(moments)
+
+
+def ensure_partitions_for(timestamps: np.ndarray):
+    # Only the partitions the samples fall into, however far apart they are
+    days = np.unique(timestamps // (PARTITION_DAYS * 86400)).astype(np.int64)
+    _ensure(_EPOCH + timedelta(days=day * PARTITION_DAYS) for day in days.tolist())
+
+
+def _ensure(moments: Iterable[datetime]):
+    if engine.dialect.name != "postgresql" or not _partitioned:
+        return
+
+    missing = [
+        moment for moment in moments if partition_name(moment) not in _known_partitions
+    ]
+    if not missing:
+        return
+
+    # Partitions are created in their own short transaction, so the ingest
+    # transaction never holds the lock on the parent table for long.
+    with _partitions_lock, engine.begin() as conn:
+        if not _known_partitions:
+            _known_partitions.update(list_partitions(conn))
+        for moment in missing:
+            if partition_name(moment) not in _known_partitions:
+                _create_partition(conn, moment)
+                log_info(f"Created history partition {partition_name(moment)}")
+
+
+def drop_partitions_before(cutoff: datetime) -> int:
+    with engine.begin() as conn:
+        if not _is_postgresql(conn) or not _partitioned:
+            # No partitions, fall back to a plain delete
+            return conn.execute(
+                delete(History_Table).where(History_Table.timestamp < cutoff)
+            ).rowcount
+
+        dropped = 0
+        for name in list_partitions(conn):
+            start = datetime.strptime(name.removeprefix(_PARTITION_PREFIX), "%Y%m%d")
+            if start + timedelta(days=PARTITION_DAYS) > cutoff:
+                continue
+            # Dropping a whole partition is a catalog operation, unlike DELETE
+            conn.execute(text(f"ALTER TABLE history DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            _known_partitions.discard(name)
+            dropped += 1
+            log_info(f"Dropped history partition {name}")
+        return dropped
+
+
+def _migrate_to_partitioned(conn: Connection):
+    log_info("Migrating history to a partitioned table")
+    conn.execute(text("ALTER TABLE history RENAME TO history_legacy"))
+    conn.execute(
+        text("ALTER INDEX IF EXISTS history_pkey RENAME TO history_legacy_pkey")
+    )
+    conn.execute(
+        text("ALTER SEQUENCE IF EXISTS history_id_seq RENAME TO history_legacy_id_seq")
+    )
+    conn.execute(text("DROP INDEX IF EXISTS ix_history_sensor_id_timestamp"))
+    conn.execute(text(_CREATE_PARTITIONED_HISTORY))
+
+    # Only the partitions that get rows, a stray timestamp far off does not
+    # turn into thousands of empty tables
+    days = conn.execute(
+        text(
+            "SELECT DISTINCT floor(extract(epoch FROM timestamp) / :span) "
+            "FROM history_legacy"
+        ),
+        {"span": PARTITION_DAYS * 86400},
+    ).scalars()
+    for day in days:
+        _create_partition(conn, _EPOCH + timedelta(days=int(day) * PARTITION_DAYS))
+
+    conn.execute(
+        text(
+            "INSERT INTO history "
+            "(id, collector_id, mcu_id, sensor_id, value, timestamp) "
+            "SELECT id, collector_id, mcu_id, sensor_id, value, timestamp "
+            "FROM history_legacy"
+        )
+    )
+    conn.execute(
+        text(
+            "SELECT setval(pg_get_serial_sequence('history', 'id'), "
+            "COALESCE((SELECT max(id) FROM history), 0) + 1, false)"
+        )
+    )
+    conn.execute(text("DROP TABLE history_legacy"))
+
+
+def _upgrade_mcus(conn: Connection):
+    # MCUs of older versions were keyed by name alone. Each one is assigned
+    # to the collector its history came from.
+    if "collector_id" in {c["name"] for c in inspect(conn).get_columns("mcus")}:
+        return
+    log_info("Adding collector_id to mcus")
+    conn.execute(
+        text(
+            "ALTER TABLE mcus ADD COLUMN collector_id INTEGER REFERENCES collectors (id)"
+        )
+    )
+    if inspect(conn).has_table("history"):
+        conn.execute(
+            text(
+                "UPDATE mcus SET collector_id = (SELECT min(collector_id) "
+                "FROM history WHERE history.mcu_id = mcus.id)"
+            )
+        )
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_mcus_collector_id_name "
+            "ON mcus (collector_id, name)"
+        )
+    )
+    if _is_postgresql(conn):
+        conn.execute(text("ALTER TABLE mcus DROP CONSTRAINT IF EXISTS mcus_name_key"))
+    else:
+        log_warning(
+            "SQLite cannot drop a unique constraint on mcus.name; if the table "
+            "has one, recreate the database to accept the same MCU name from "
+            "several collectors"
+        )
+
+
+def init_history():
+    global _partitioned
+    with engine.begin() as conn:
+        if not _is_postgresql(conn):
+            Base.metadata.create_all(bind=conn)
+            _upgrade_mcus(conn)
+            # Tables created before the index existed do not get it from
+            # create_all, add it explicitly
+            for index in History_Table.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+            return
+
+        tables = [t for t in Base.metadata.sorted_tables if t.name != "history"]
+        Base.metadata.create_all(bind=conn, tables=tables)
+        _upgrade_mcus(conn)
+
+        if not inspect(conn).has_table("history"):
+            conn.execute(text(_CREATE_PARTITIONED_HISTORY))
+        _partitioned = is_partitioned(conn)
+        if not _partitioned:
+            # Rewriting the whole table does not belong in a service start
+            log_warning(
+                "history is not partitioned, new rows go into the plain table; "
+                "run `python -m src.db.partitions --migrate` to convert it"
+            )
+
+        # Indexes on a partitioned parent are created on every partition
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_history_sensor_id_timestamp "
+                "ON history (sensor_id, timestamp)"
+            )
+        )
+        _known_partitions.update(list_partitions(conn))
+
+    now = datetime.now(UTC).replace(tzinfo=None)
+    ensure_partitions(now, now + timedelta(days=PARTITIONS_AHEAD * PARTITION_DAYS))
+
+
+def migrate_history():
+    global _partitioned
+    with engine.begin() as conn:
+        if not _is_postgresql(conn):
+            log_info("Partitions are a PostgreSQL feature, nothing to migrate")
+            return
+        if is_partitioned(conn):
+            log_info("history is already partitioned")
+            return
+        # One transaction: history keeps its old contents until the copy is
+        # committed. It locks the table, stop core first on large tables.
+        _migrate_to_partitioned(conn)
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_history_sensor_id_timestamp "
+                "ON history (sensor_id, timestamp)"
+            )
+        )
+        _known_partitions.update(list_partitions(conn))
+    _partitioned = True
+    log_info("history migrated to a partitioned table")
+
+
+def maintain_partitions():
+    now = datetime.now(UTC).replace(tzinfo=None)
+    ensure_partitions(now, now + timedelta(days=PARTITIONS_AHEAD * PARTITION_DAYS))
+    if RETENTION_DAYS > 0:
+        drop_partitions_before(now - timedelta(days=RETENTION_DAYS))
+        drop_chunks_before(now - timedelta(days=RETENTION_DAYS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History partition maintenance")
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Move an unpartitioned history table into partitions",
+    )
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_history()
+    else:
+        init_history()
+    maintain_partitions()
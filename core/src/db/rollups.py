@@ -0,0 +1,393 @@
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import BigInteger, Connection, case, cast, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.db.chunks import (
+    CHUNK_MAX_SPAN,
+    from_micros,
+    iter_chunks,
+    read_chunks,
+    to_micros,
+)
+from src.db.engine import get_engine
+from src.db.models import (
+    HistoryChunk_Table,
+    HistoryDay_Table,
+    HistoryHour_Table,
+    HistoryMinute_Table,
+    History_Table,
+)
+from src.logger import log_info
+
+engine = get_engine()
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class Resolution:
+    name: str
+    seconds: int
+    table: type
+
+
+RAW = Resolution(name="raw", seconds=0, table=History_Table)
+ROLLUPS = [
+    Resolution(name="1m", seconds=60, table=HistoryMinute_Table),
+    Resolution(name="1h", seconds=3600, table=HistoryHour_Table),
+    Resolution(name="1d", seconds=86400, table=HistoryDay_Table),
+]
+
+
+def to_epoch(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds()
+
+
+def from_epoch(seconds: float) -> datetime:
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def epoch_bucket(conn: Connection, column, bucket: int):
+    # Bucket start in whole seconds since the epoch
+    if conn.dialect.name == "postgresql":
+        seconds = cast(func.floor(func.extract("epoch", column)), BigInteger)
+    else:
+        # strftime() rounds to milliseconds, the fraction is cut off first so
+        # 59.9999 s stays in its bucket
+        seconds = cast(func.strftime("%s", func.substr(column, 1, 19)), BigInteger)
+    return seconds // bucket * bucket
+
+
+def _aggregate(
+    sensor_ids: np.ndarray, values: np.ndarray, timestamps: np.ndarray, seconds: int
+) -> list[dict]:
+    buckets = (timestamps // seconds * seconds).astype(np.int64)
+    # Sort by (sensor, bucket, timestamp): groups become contiguous and the
+    # last element of every group is its latest sample
+    order = np.lexsort((timestamps, buckets, sensor_ids))
+    sensor_ids, buckets = sensor_ids[order], buckets[order]
+    values, timestamps = values[order], timestamps[order]
+
+    boundary = np.empty(len(order), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = (sensor_ids[1:] != sensor_ids[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(order)) - 1
+
+    mins = np.minimum.reduceat(values, starts)
+    maxs = np.maximum.reduceat(values, starts)
+    sums = np.add.reduceat(values, starts)
+    counts = np.diff(np.append(starts, len(order)))
+
+    return [
+        {
+            "sensor_id": int(sensor_ids[start]),
+            "bucket": from_epoch(int(buckets[start])),
+            "min": float(mins[i]),
+            "max": float(maxs[i]),
+            "sum": float(sums[i]),
+            "count": int(counts[i]),
+            "last": float(values[end]),
+            "last_timestamp": from_epoch(float(timestamps[end])),
+        }
+        for i, (start, end) in enumerate(zip(starts, ends))
+    ]
+
+
+def _upsert(conn: Connection, table, rows: list[dict]):
+    if conn.dialect.name == "postgresql":
+        statement = pg_insert(table)
+        least, greatest = func.least, func.greatest
+    else:
+        statement = sqlite_insert(table)
+        # SQLite's multi-argument min()/max() are scalar functions
+        least, greatest = func.min, func.max
+
+    current, new = table.__table__.c, statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[current.sensor_id, current.bucket],
+        set_={
+            "min": least(current.min, new.min),
+            "max": greatest(current.max, new.max),
+            "sum": current.sum + new.sum,
+            "count": current.count + new.count,
+            "last": case(
+                (new.last_timestamp >= current.last_timestamp, new.last),
+                else_=current.last,
+            ),
+            "last_timestamp": greatest(current.last_timestamp, new.last_timestamp),
+        },
+    )
+    conn.execute(statement, rows)
+
+
+def apply_rollups(
+    conn: Connection,
+    sensor_ids: np.ndarray,
+    values: np.ndarray,
+    timestamps: np.ndarray,
+):
+    if len(sensor_ids) == 0:
+        return
+    for resolution in ROLLUPS:
+        rows = _aggregate(sensor_ids, values, timestamps, resolution.seconds)
+        # Rows are sorted by key, so concurrent batches lock them in the same
+        # order and cannot deadlock each other
+        _upsert(conn, resolution.table, rows)
+
+
+def latest_from_rollups() -> dict[int, tuple[float, float]]:
+    day = HistoryDay_Table.__table__
+    newest = day.alias("newest")
+    query = select(day.c.sensor_id, day.c.last, day.c.last_timestamp).where(
+        day.c.bucket
+        == select(func.max(newest.c.bucket))
+        .where(newest.c.sensor_id == day.c.sensor_id)
+        .scalar_subquery()
+    )
+    with engine.connect() as conn:
+        return {
+            sensor_id: (last, to_epoch(last_timestamp))
+            for sensor_id, last, last_timestamp in conn.execute(query)
+        }
+
+
+def choose_resolution(
+    conn: Connection, sensor_id: int, start: datetime, end: datetime, max_points: int
+) -> Resolution:
+    minute = HistoryMinute_Table.__table__.c
+    raw_points = conn.execute(
+        select(func.coalesce(func.sum(minute.count), 0)).where(
+            minute.sensor_id == sensor_id,
+            minute.bucket >= from_epoch(to_epoch(start) // 60 * 60),
+            minute.bucket < end,
+        )
+    ).scalar_one()
+    if raw_points <= max_points:
+        return RAW
+
+    span = (end - start).total_seconds()
+    for resolution in ROLLUPS:
+        if span / resolution.seconds <= max_points:
+            return resolution
+    return ROLLUPS[-1]
+
+
+def _query_raw(
+    conn: Connection,
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    min_value: Optional[float],
+    max_value: Optional[float],
+) -> list[dict]:
+    history = History_Table.__table__.c
+    conditions = [
+        history.sensor_id == sensor_id,
+        history.timestamp >= start,
+        history.timestamp < end,
+    ]
+    if min_value is not None:
+        conditions.append(history.value >= min_value)
+    if max_value is not None:
+        conditions.append(history.value <= max_value)
+    rows = conn.execute(
+        select(history.timestamp, history.value)
+        .where(*conditions)
+        .order_by(history.timestamp)
+    ).all()
+    chunk_timestamps, chunk_values = read_chunks(
+        conn, sensor_id, start, end, min_value, max_value
+    )
+    if not len(chunk_timestamps):
+        return [{"timestamp": timestamp, "value": value} for timestamp, value in rows]
+
+    # Samples not compacted yet are merged with the decoded chunks
+    timestamps = np.concatenate(
+        (chunk_timestamps, to_micros([timestamp for timestamp, _ in rows]))
+    )
+    values = np.concatenate(
+        (chunk_values, np.fromiter((value for _, value in rows), np.float64, len(rows)))
+    )
+    order = np.argsort(timestamps, kind="stable")
+    return [
+        {"timestamp": timestamp, "value": value}
+        for timestamp, value in zip(
+            from_micros(timestamps[order]), values[order].tolist()
+        )
+    ]
+
+
+def query_history(
+    conn: Connection,
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    max_points: int = 1000,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+) -> tuple[Resolution, list[dict]]:
+    # min_value/max_value keep raw samples within the range, or buckets that
+    # overlap it
+    resolution = choose_resolution(conn, sensor_id, start, end, max_points)
+    if resolution is RAW:
+        return resolution, _query_raw(conn, sensor_id, start, end, min_value, max_value)
+
+    rollup = resolution.table.__table__.c
+    conditions = [
+        rollup.sensor_id == sensor_id,
+        rollup.bucket
+        >= from_epoch(to_epoch(start) // resolution.seconds * resolution.seconds),
+        rollup.bucket < end,
+    ]
+    if min_value is not None:
+        conditions.append(rollup.max >= min_value)
+    if max_value is not None:
+        conditions.append(rollup.min <= max_value)
+    rows = conn.execute(select(rollup).where(*conditions).order_by(rollup.bucket))
+    return resolution, [
+        {
+            "timestamp": row.bucket,
+            "min": row.min,
+            "max": row.max,
+            "mean": row.sum / row.count,
+            "count": row.count,
+            "last": row.last,
+        }
+        for row in rows
+    ]
+
+
+def read_history(
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    max_points: int = 1000,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+) -> tuple[Resolution, list[dict]]:
+    with engine.connect() as conn:
+        return query_history(
+            conn, sensor_id, start, end, max_points, min_value, max_value
+        )
+
+
+def _backfill_days(conn: Connection, start: datetime, end: datetime) -> list[int]:
+    # Days with raw samples, chunks or rollups in [start, end), as epoch seconds
+    day = ROLLUPS[-1].seconds
+    history = History_Table.__table__.c
+    chunk = HistoryChunk_Table.__table__.c
+    rollup = ROLLUPS[-1].table.__table__.c
+    queries = [
+        select(epoch_bucket(conn, history.timestamp, day)).where(
+            history.timestamp >= start, history.timestamp < end
+        ),
+        select(epoch_bucket(conn, rollup.bucket, day)).where(
+            rollup.bucket >= start, rollup.bucket < end
+        ),
+    ]
+    # A chunk spans at most CHUNK_MAX_SPAN, its first and last day cover it
+    for column in (chunk.start, chunk.end):
+        queries.append(
+            select(epoch_bucket(conn, column, day)).where(
+                chunk.start >= start - CHUNK_MAX_SPAN,
+                chunk.start < end,
+                chunk.end >= start,
+            )
+        )
+    days = set()
+    for query in queries:
+        days.update(conn.execute(query.distinct()).scalars())
+    low, high = to_epoch(start), to_epoch(end)
+    return sorted(day for day in days if low <= day < high)
+
+
+def _rebuild_day(
+    conn: Connection, start: datetime, end: datetime, batch_size: int
+) -> int:
+    if conn.dialect.name == "postgresql":
+        # Waits for ingests that already upserted rollups, so their rows are
+        # visible below, and holds back the ones that have not until this
+        # day is committed: every row is counted exactly once. Compaction is
+        # held back as well so no row moves into a chunk mid-rebuild.
+        tables = [resolution.table.__tablename__ for resolution in ROLLUPS]
+        tables.append(HistoryChunk_Table.__tablename__)
+        conn.execute(text(f"LOCK TABLE {', '.join(tables)} IN EXCLUSIVE MODE"))
+
+    # On SQLite the delete comes first so the transaction holds the write lock
+    # before anything is read
+    for resolution in ROLLUPS:
+        rollup = resolution.table.__table__.c
+        conn.execute(
+            delete(resolution.table).where(rollup.bucket >= start, rollup.bucket < end)
+        )
+
+    history = History_Table.__table__.c
+    total = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(history.id, history.sensor_id, history.value, history.timestamp)
+            .where(
+                history.id > last_id,
+                history.timestamp >= start,
+                history.timestamp < end,
+            )
+            .order_by(history.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        sensor_ids = np.fromiter((row[1] for row in rows), np.int64, len(rows))
+        values = np.fromiter((row[2] for row in rows), np.float64, len(rows))
+        timestamps = np.fromiter(
+            (to_epoch(row[3]) for row in rows), np.float64, len(rows)
+        )
+        apply_rollups(conn, sensor_ids, values, timestamps)
+        total += len(rows)
+
+    for sensor_ids, values, timestamps in iter_chunks(conn, start, end):
+        apply_rollups(conn, sensor_ids, values, timestamps)
+        total += len(sensor_ids)
+    return total
+
+
+def backfill_rollups(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 100_000,
+) -> int:
+    # Rebuilt one day at a time: the delete and the rebuild of a day commit
+    # together, so readers never see a day half rebuilt and ingest keeps
+    # running in between
+    day = ROLLUPS[-1].seconds
+    start = from_epoch(to_epoch(start) // day * day) if start is not None else _EPOCH
+    end = (
+        from_epoch(-(-to_epoch(end) // day) * day) if end is not None else datetime.max
+    )
+
+    with engine.connect() as conn:
+        days = _backfill_days(conn, start, end)
+
+    total = 0
+    for first in days:
+        with engine.begin() as conn:
+            total += _rebuild_day(
+                conn, from_epoch(first), from_epoch(first + day), batch_size
+            )
+        log_info(f"Rollup backfill: {total} rows, {from_epoch(first):%Y-%m-%d}")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild rollups from raw history")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    args = parser.parse_args()
+    backfill_rollups(args.start, args.end)
@@ -0,0 +1,76 @@
+import threading
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from src.db.engine import get_engine
+from src.db.models import Rules_Table
+from src.hub import Severity
+from src.rules import CombinedRule, Rule, RuleDefinition, ThresholdRule, rule_engine
+
+engine = get_engine()
+
+# Rule edits read the current rule set and recompile it, serialize them
+_rules_lock = threading.Lock()
+
+
+def _to_rule(row) -> Rule:
+    severity = Severity[row.severity]
+    if row.children is not None:
+        return CombinedRule(
+            id=row.id,
+            rules=list(row.children),
+            mode=row.mode or "all",
+            severity=severity,
+            name=row.name,
+        )
+    return ThresholdRule(
+        id=row.id,
+        sensor_id=row.sensor_id,
+        above=row.above,
+        below=row.below,
+        duration=row.duration,
+        severity=severity,
+        name=row.name,
+    )
+
+
+def load_rules() -> list[Rule]:
+    with engine.connect() as conn:
+        rows = conn.execute(select(Rules_Table.__table__)).all()
+    return [_to_rule(row) for row in rows]
+
+
+def create_rule(definition: RuleDefinition) -> Rule:
+    # The rule is inserted and compiled in one transaction: a rule the engine
+    # cannot compile (e.g. referencing a missing rule) is never stored
+    try:
+        with _rules_lock, engine.begin() as conn:
+            rule_id = conn.execute(
+                insert(Rules_Table).returning(Rules_Table.id),
+                {
+                    "name": definition.name,
+                    "severity": definition.severity.upper(),
+                    "sensor_id": definition.sensor_id,
+                    "above": definition.above,
+                    "below": definition.below,
+                    "duration": definition.duration,
+                    "mode": definition.mode,
+                    "children": definition.rules,
+                },
+            ).scalar_one()
+            rule = definition.to_rule(rule_id)
+            rule_engine.set_rules([*rule_engine.rules, rule])
+    except IntegrityError:
+        raise ValueError(f"Unknown sensor {definition.sensor_id}")
+    return rule
+
+
+def delete_rule(rule_id: int) -> bool:
+    with _rules_lock, engine.begin() as conn:
+        rules = [rule for rule in rule_engine.rules if rule.id != rule_id]
+        deleted = conn.execute(
+            delete(Rules_Table).where(Rules_Table.id == rule_id)
+        ).rowcount
+        if deleted:
+            rule_engine.set_rules(rules)
+    return bool(deleted)
@@ -0,0 +1,311 @@
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Connection, func, select
+from src.db.chunks import CHUNK_MAX_SPAN, decode_chunk, to_micros
+from src.db.engine import get_engine
+from src.db.models import History_Table, HistoryChunk_Table
+from src.db.rollups import ROLLUPS, epoch_bucket, from_epoch, to_epoch
+
+engine = get_engine()
+
+# Range queries that stream: results are read from a server-side cursor
+# (psycopg2 named cursor, plain cursor on SQLite) and handed out in batches,
+# so memory does not grow with the size of the result.
+#
+# With a bucket, aggregation runs in SQL wherever the data allows:
+#
+#   bucket a multiple of a rollup   GROUP BY over the coarsest such rollup,
+#                                   chunked samples included
+#   otherwise, no chunks in range   GROUP BY over the history table
+#   otherwise                       folded from the merged raw stream
+#
+# Aggregated ranges are widened to whole buckets.
+
+AGGREGATES = ("min", "max", "avg", "sum", "count")
+BATCH_SIZE = 10_000
+
+
+@dataclass
+class HistoryBatch:
+    sensor_id: int
+    # Sample times or bucket starts, microseconds since the epoch
+    timestamps: np.ndarray
+    # "value" for raw samples, else one column per aggregate
+    columns: dict[str, np.ndarray]
+
+
+def _rows(conn: Connection, query, batch_size: int):
+    return conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+        query
+    )
+
+
+def _raw_pages(
+    conn: Connection, sensor_id: int, start: datetime, end: datetime, batch_size: int
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    history = History_Table.__table__.c
+    rows = _rows(
+        conn,
+        select(history.timestamp, history.value)
+        .where(
+            history.sensor_id == sensor_id,
+            history.timestamp >= start,
+            history.timestamp < end,
+        )
+        .order_by(history.timestamp),
+        batch_size,
+    )
+    for page in rows.partitions():
+        yield (
+            to_micros([timestamp for timestamp, _ in page]),
+            np.fromiter((value for _, value in page), np.float64, len(page)),
+        )
+
+
+def _chunks(conn: Connection, sensor_id: int, start: datetime, end: datetime):
+    chunk = HistoryChunk_Table.__table__.c
+    return _rows(
+        conn,
+        select(chunk.start, chunk.data)
+        .where(
+            chunk.sensor_id == sensor_id,
+            chunk.start >= start - CHUNK_MAX_SPAN,
+            chunk.start < end,
+            chunk.end >= start,
+        )
+        .order_by(chunk.start),
+        16,
+    )
+
+
+def _has_chunks(conn: Connection, sensor_id: int, start: datetime, end: datetime):
+    chunk = HistoryChunk_Table.__table__.c
+    return (
+        conn.execute(
+            select(chunk.id)
+            .where(
+                chunk.sensor_id == sensor_id,
+                chunk.start >= start - CHUNK_MAX_SPAN,
+                chunk.start < end,
+                chunk.end >= start,
+            )
+            .limit(1)
+        ).first()
+        is not None
+    )
+
+
+def _merge(
+    first: tuple[np.ndarray, np.ndarray], second: tuple[np.ndarray, np.ndarray]
+) -> tuple[np.ndarray, np.ndarray]:
+    timestamps = np.concatenate((first[0], second[0]))
+    order = np.argsort(timestamps, kind="stable")
+    return timestamps[order], np.concatenate((first[1], second[1]))[order]
+
+
+def _raw_stream(
+    conn: Connection, sensor_id: int, start: datetime, end: datetime, batch_size: int
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    # (microseconds, values) in time order, history rows merged with chunks.
+    # Chunks arrive by start time, so everything before the next chunk's
+    # start is final. Only decoded points past that (overlapping chunks) and
+    # one page of rows are held at a time.
+    low, high = to_micros([start, end])
+    pages = _raw_pages(conn, sensor_id, start, end, batch_size)
+    chunks = iter(_chunks(conn, sensor_id, start, end))
+    pending = (np.empty(0, np.int64), np.empty(0, np.float64))
+    page = None
+    chunk = next(chunks, None)
+    while True:
+        boundary = to_micros([chunk.start])[0] if chunk is not None else None
+        while True:
+            if page is None:
+                page = next(pages, None)
+                if page is None:
+                    break
+            taken = (
+                len(page[0])
+                if boundary is None
+                else int(np.searchsorted(page[0], boundary))
+            )
+            if not taken:
+                break
+            part = (page[0][:taken], page[1][:taken])
+            page = (page[0][taken:], page[1][taken:]) if taken < len(page[0]) else None
+            # Rows still to come are not earlier than this page's last one
+            ready = int(np.searchsorted(pending[0], part[0][-1], side="right"))
+            yield _merge((pending[0][:ready], pending[1][:ready]), part)
+            pending = (pending[0][ready:], pending[1][ready:])
+            if page is not None:
+                break
+        if chunk is None:
+            if len(pending[0]):
+                yield pending
+            return
+        ready = int(np.searchsorted(pending[0], boundary))
+        if ready:
+            yield pending[0][:ready], pending[1][:ready]
+            pending = (pending[0][ready:], pending[1][ready:])
+
+        timestamps, values = decode_chunk(chunk.data)
+        keep = (timestamps >= low) & (timestamps < high)
+        pending = _merge(pending, (timestamps[keep], values[keep]))
+        chunk = next(chunks, None)
+
+
+def _fold(
+    stream: Iterator[tuple[np.ndarray, np.ndarray]], bucket: int
+) -> Iterator[tuple[np.ndarray, dict[str, np.ndarray]]]:
+    # Aggregates of a time ordered stream. The last bucket of a batch may go
+    # on in the next one, so it is carried over until it is complete.
+    width = bucket * 1_000_000
+    carry = None
+    for timestamps, values in stream:
+        if not len(timestamps):
+            continue
+        keys = timestamps // width * width
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        partial = {
+            "bucket": keys[starts],
+            "min": np.minimum.reduceat(values, starts),
+            "max": np.maximum.reduceat(values, starts),
+            "sum": np.add.reduceat(values, starts),
+            "count": np.diff(np.append(starts, len(values))),
+        }
+        if carry is not None:
+            if carry["bucket"][0] == partial["bucket"][0]:
+                partial["min"][0] = min(partial["min"][0], carry["min"][0])
+                partial["max"][0] = max(partial["max"][0], carry["max"][0])
+                partial["sum"][0] += carry["sum"][0]
+                partial["count"][0] += carry["count"][0]
+            else:
+                partial = {
+                    name: np.concatenate((carry[name], column))
+                    for name, column in partial.items()
+                }
+        carry = {name: column[-1:] for name, column in partial.items()}
+        if len(partial["bucket"]) > 1:
+            yield (
+                partial["bucket"][:-1],
+                {name: column[:-1] for name, column in partial.items()},
+            )
+    if carry is not None:
+        yield carry["bucket"], carry
+
+
+def _aggregate_sql(
+    conn: Connection,
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    bucket: int,
+    batch_size: int,
+) -> Iterator[tuple[np.ndarray, dict[str, np.ndarray]]]:
+    rollup = next(
+        (r for r in reversed(ROLLUPS) if bucket % r.seconds == 0),
+        None,
+    )
+    if rollup is not None:
+        table = rollup.table.__table__.c
+        key = epoch_bucket(conn, table.bucket, bucket).label("bucket")
+        columns = [
+            func.min(table.min),
+            func.max(table.max),
+            func.sum(table.sum),
+            func.sum(table.count),
+        ]
+        conditions = [
+            table.sensor_id == sensor_id,
+            table.bucket >= start,
+            table.bucket < end,
+        ]
+    else:
+        table = History_Table.__table__.c
+        key = epoch_bucket(conn, table.timestamp, bucket).label("bucket")
+        columns = [
+            func.min(table.value),
+            func.max(table.value),
+            func.sum(table.value),
+            func.count(table.value),
+        ]
+        conditions = [
+            table.sensor_id == sensor_id,
+            table.timestamp >= start,
+            table.timestamp < end,
+        ]
+    rows = _rows(
+        conn,
+        select(key, *columns).where(*conditions).group_by(key).order_by(key),
+        batch_size,
+    )
+    for page in rows.partitions():
+        keys, mins, maxs, sums, counts = zip(*page)
+        yield (
+            np.array(keys, np.int64) * 1_000_000,
+            {
+                "min": np.array(mins, np.float64),
+                "max": np.array(maxs, np.float64),
+                "sum": np.array(sums, np.float64),
+                "count": np.array(counts, np.int64),
+            },
+        )
+
+
+def _stream(
+    sensor_ids: list[int],
+    start: datetime,
+    end: datetime,
+    bucket: Optional[int],
+    aggregates: tuple[str, ...],
+    batch_size: int,
+) -> Iterator[HistoryBatch]:
+    with engine.connect() as conn:
+        for sensor_id in sensor_ids:
+            if bucket is None:
+                for timestamps, values in _raw_stream(
+                    conn, sensor_id, start, end, batch_size
+                ):
+                    yield HistoryBatch(sensor_id, timestamps, {"value": values})
+                continue
+
+            if any(bucket % r.seconds == 0 for r in ROLLUPS) or not _has_chunks(
+                conn, sensor_id, start, end
+            ):
+                parts = _aggregate_sql(conn, sensor_id, start, end, bucket, batch_size)
+            else:
+                parts = _fold(
+                    _raw_stream(conn, sensor_id, start, end, batch_size), bucket
+                )
+            for keys, partial in parts:
+                partial["avg"] = partial["sum"] / partial["count"]
+                yield HistoryBatch(
+                    sensor_id, keys, {name: partial[name] for name in aggregates}
+                )
+
+
+def stream_history(
+    sensor_ids: list[int],
+    start: datetime,
+    end: datetime,
+    bucket: Optional[int] = None,
+    aggregates: tuple[str, ...] = ("avg",),
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[HistoryBatch]:
+    # Batches of one sensor at a time, sensors in the given order, each in
+    # time order. bucket in seconds. The arguments are checked right away,
+    # the database is only queried as the batches are consumed.
+    if bucket is not None:
+        unknown = set(aggregates) - set(AGGREGATES)
+        if unknown:
+            raise ValueError(f"Unknown aggregates: {', '.join(sorted(unknown))}")
+        if not aggregates:
+            raise ValueError("No aggregates given")
+        if bucket <= 0:
+            raise ValueError(f"Bucket must be positive, got {bucket}")
+        start = from_epoch(to_epoch(start) // bucket * bucket)
+        end = from_epoch(-(-to_epoch(end) // bucket) * bucket)
+    return _stream(sensor_ids, start, end, bucket, aggregates, batch_size)
@@ -1,10 +1,29 @@
+import time
+from collections.abc import AsyncIterator
+
+from sensors.metrics import Histogram
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-from src.db.engine import get_engine
-from src.db.models import Base
+from src.db.engine import get_async_engine, get_engine
+from src.db.partitions import init_history
 
 engine = get_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+SESSION_ACQUIRE_SECONDS = Histogram(
+    "core_db_session_acquire_seconds", "Wait for a pooled connection per request"
+)
+
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    init_history()
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    # FastAPI dependency: one session per request, its connection goes back to
+    # the async pool once the response is done
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        started = time.perf_counter()
+        await session.connection()
+        SESSION_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+        yield session
@@ -0,0 +1,84 @@
+import io
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+from src.db.stream import HistoryBatch
+
+# Encoders for streamed history. Each batch is encoded and handed on as soon
+# as it is read, nothing is collected.
+#
+#   ndjson  one JSON object per sample or bucket, timestamps in epoch seconds
+#   arrow   Arrow IPC stream, one record batch per batch; needs pyarrow
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _json_numbers(column: np.ndarray) -> list[str]:
+    texts = list(map(repr, column.tolist()))
+    if column.dtype.kind == "f":
+        # JSON has no NaN or infinity
+        for i in np.flatnonzero(~np.isfinite(column)).tolist():
+            texts[i] = "null"
+    return texts
+
+
+def ndjson_stream(batches: Iterable[HistoryBatch]) -> Iterator[bytes]:
+    for batch in batches:
+        line = (
+            f'{{"sensor_id":{batch.sensor_id},"timestamp":%s'
+            + "".join(f',"{name}":%s' for name in batch.columns)
+            + "}\n"
+        )
+        columns = [
+            _json_numbers(batch.timestamps / 1e6),
+            *map(_json_numbers, batch.columns.values()),
+        ]
+        yield "".join(line % row for row in zip(*columns)).encode()
+
+
+def arrow_stream(batches: Iterable[HistoryBatch], names: list[str]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            ("sensor_id", pa.int64()),
+            ("timestamp", pa.timestamp("us")),
+            *(
+                (name, pa.int64() if name == "count" else pa.float64())
+                for name in names
+            ),
+        ]
+    )
+    sink = io.BytesIO()
+
+    def written() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    writer = pa.ipc.new_stream(sink, schema)
+    yield written()
+    for batch in batches:
+        writer.write_batch(
+            pa.record_batch(
+                [
+                    np.full(len(batch.timestamps), batch.sensor_id, np.int64),
+                    batch.timestamps,
+                    *(batch.columns[name] for name in names),
+                ],
+                schema=schema,
+            )
+        )
+        yield written()
+    writer.close()
+    yield written()
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Optional
+
+import numpy as np
+from fastapi import WebSocket
+from src.logger import log_error, log_info, log_warning
+
+
+class Severity(IntEnum):
+    INFO = 0
+    WARNING = 1
+    CRITICAL = 2
+
+
+@dataclass
+class Subscription:
+    sensor_ids: Optional[set[int]] = None
+    mcu_ids: Optional[set[int]] = None
+    min_severity: Severity = Severity.INFO
+    values: bool = True
+    alarms: bool = True
+    # False: every sample, a batch per message, for consumers that must not
+    # skip any (models fitted on the stream)
+    coalesce: bool = True
+
+    @property
+    def is_wildcard(self) -> bool:
+        return self.sensor_ids is None and self.mcu_ids is None
+
+
+@dataclass(eq=False)
+class Subscriber:
+    websocket: WebSocket
+    subscription: Subscription
+    # Coalescing: at most one pending value per sensor, a newer value
+    # replaces the unsent one, so a slow consumer only ever sees the latest
+    # state
+    max_pending_values: int = 10_000
+    max_pending_alarms: int = 1_000
+    # Uncoalesced subscribers drop their oldest batches beyond this
+    max_pending_samples: int = 1_000_000
+
+    coalesced: int = 0
+    dropped: int = 0
+    sent: int = 0
+
+    # Messages are JSON-encoded once at publish time and shared by everyone
+    _values: dict[int, str] = field(default_factory=dict)
+    _alarms: deque = field(default_factory=deque)
+    _batches: deque = field(default_factory=deque)
+    _pending_samples: int = 0
+    _ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def offer_value(self, sensor_id: int, message: str):
+        if sensor_id in self._values:
+            self.coalesced += 1
+        elif len(self._values) >= self.max_pending_values:
+            self.dropped += 1
+            return
+        self._values[sensor_id] = message
+        self._ready.set()
+
+    def offer_batch(self, message: str, samples: int):
+        while (
+            self._batches and self._pending_samples + samples > self.max_pending_samples
+        ):
+            _, dropped = self._batches.popleft()
+            self._pending_samples -= dropped
+            self.dropped += dropped
+        self._batches.append((message, samples))
+        self._pending_samples += samples
+        self._ready.set()
+
+    def offer_alarm(self, message: str):
+        if len(self._alarms) >= self.max_pending_alarms:
+            self._alarms.popleft()
+            self.dropped += 1
+        self._alarms.append(message)
+        self._ready.set()
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            messages = list(self._alarms)
+            messages.extend(message for message, _ in self._batches)
+            messages.extend(self._values.values())
+            self._alarms.clear()
+            self._batches.clear()
+            self._pending_samples = 0
+            self._values = {}
+            # Everything pending goes out as one frame
+            await self.websocket.send_text(f"[{','.join(messages)}]")
+            self.sent += len(messages)
+
+
+def _json_list(column: np.ndarray) -> list:
+    # JSON has no NaN or infinity, browsers reject the whole frame for one
+    values = column.tolist()
+    if column.dtype.kind == "f":
+        for i in np.flatnonzero(~np.isfinite(column)).tolist():
+            values[i] = None
+    return values
+
+
+def _json_number(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+async def _close(websocket: WebSocket):
+    # The socket may already be gone, which is what failed the send
+    with suppress(Exception):
+        await websocket.close(code=1011)
+
+
+class Hub:
+    def __init__(self):
+        self.subscribers: set[Subscriber] = set()
+        self._by_sensor: dict[int, set[Subscriber]] = {}
+        self._by_mcu: dict[int, set[Subscriber]] = {}
+        self._wildcard: set[Subscriber] = set()
+        self._closing: set[asyncio.Task] = set()
+
+    def subscribe(self, subscriber: Subscriber):
+        subscription = subscriber.subscription
+        self.subscribers.add(subscriber)
+        if subscription.is_wildcard:
+            self._wildcard.add(subscriber)
+        for sensor_id in subscription.sensor_ids or ():
+            self._by_sensor.setdefault(sensor_id, set()).add(subscriber)
+        for mcu_id in subscription.mcu_ids or ():
+            self._by_mcu.setdefault(mcu_id, set()).add(subscriber)
+        log_info(f"Hub: {len(self.subscribers)} subscribers")
+
+    def start(self, subscriber: Subscriber) -> asyncio.Task:
+        self.subscribe(subscriber)
+        sender = asyncio.create_task(subscriber.run())
+        sender.add_done_callback(lambda task: self._sender_done(subscriber, task))
+        return sender
+
+    def _sender_done(self, subscriber: Subscriber, task: asyncio.Task):
+        self.unsubscribe(subscriber)
+        if task.cancelled():
+            return
+        log_error(f"Hub: sending to subscriber failed: {task.exception()!r}")
+        # Without a sender the connection would stay open but silent
+        closing = asyncio.create_task(_close(subscriber.websocket))
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber not in self.subscribers:
+            return
+        subscription = subscriber.subscription
+        self.subscribers.discard(subscriber)
+        self._wildcard.discard(subscriber)
+        for sensor_id in subscription.sensor_ids or ():
+            self._by_sensor.get(sensor_id, set()).discard(subscriber)
+        for mcu_id in subscription.mcu_ids or ():
+            self._by_mcu.get(mcu_id, set()).discard(subscriber)
+        if subscriber.dropped:
+            log_warning(f"Hub: slow subscriber dropped {subscriber.dropped} messages")
+
+    def _targets(
+        self, sensor_id: Optional[int], mcu_id: Optional[int]
+    ) -> set[Subscriber]:
+        targets = self._wildcard
+        by_sensor = self._by_sensor.get(sensor_id)
+        by_mcu = self._by_mcu.get(mcu_id)
+        if by_sensor or by_mcu:
+            targets = targets | (by_sensor or set()) | (by_mcu or set())
+        return targets
+
+    def publish_values(
+        self,
+        sensor_ids: np.ndarray,
+        mcu_ids: np.ndarray,
+        values: np.ndarray,
+        timestamps: np.ndarray,
+    ):
+        if not self.subscribers or len(sensor_ids) == 0:
+            return
+        published = time.time()
+        lossless = [
+            subscriber
+            for subscriber in self.subscribers
+            if subscriber.subscription.values and not subscriber.subscription.coalesce
+        ]
+        if lossless:
+            self._publish_batch(
+                lossless, sensor_ids, mcu_ids, values, timestamps, published
+            )
+
+        # Coalescing subscribers only keep the latest value per sensor, so only the
+        # newest sample of each sensor in the batch is fanned out
+        order = np.lexsort((timestamps, sensor_ids))
+        sorted_ids = sensor_ids[order]
+        last = order[np.append(sorted_ids[1:] != sorted_ids[:-1], True)]
+
+        for sensor_id, mcu_id, value, timestamp in zip(
+            sensor_ids[last].tolist(),
+            mcu_ids[last].tolist(),
+            values[last].tolist(),
+            timestamps[last].tolist(),
+        ):
+            targets = self._targets(sensor_id, mcu_id)
+            if not targets:
+                continue
+            message = json.dumps(
+                {
+                    "type": "value",
+                    "sensor_id": sensor_id,
+                    "mcu_id": mcu_id,
+                    "value": _json_number(value),
+                    "timestamp": _json_number(timestamp),
+                    "published": published,
+                },
+                allow_nan=False,
+            )
+            for subscriber in targets:
+                subscription = subscriber.subscription
+                if subscription.values and subscription.coalesce:
+                    subscriber.offer_value(sensor_id, message)
+
+    def _publish_batch(
+        self,
+        subscribers: list[Subscriber],
+        sensor_ids: np.ndarray,
+        mcu_ids: np.ndarray,
+        values: np.ndarray,
+        timestamps: np.ndarray,
+        published: float,
+    ):
+        # One columnar message per batch. Wildcard subscribers share one
+        # encoding, filtered ones get their own selection.
+        def encode(rows) -> str:
+            return json.dumps(
+                {
+                    "type": "values",
+                    "sensor_id": sensor_ids[rows].tolist(),
+                    "mcu_id": mcu_ids[rows].tolist(),
+                    "value": _json_list(values[rows]),
+                    "timestamp": _json_list(timestamps[rows]),
+                    "published": published,
+                },
+                allow_nan=False,
+            )
+
+        everything = None
+        for subscriber in subscribers:
+            subscription = subscriber.subscription
+            if subscription.is_wildcard:
+                if everything is None:
+                    everything = encode(slice(None))
+                subscriber.offer_batch(everything, len(sensor_ids))
+                continue
+            rows = np.isin(sensor_ids, list(subscription.sensor_ids or ()))
+            rows |= np.isin(mcu_ids, list(subscription.mcu_ids or ()))
+            count = int(rows.sum())
+            if count:
+                subscriber.offer_batch(encode(rows), count)
+
+    def publish_alarm(
+        self,
+        sensor_id: Optional[int],
+        mcu_id: Optional[int],
+        severity: Severity,
+        payload: dict,
+    ):
+        message = json.dumps(
+            {
+                "type": "alarm",
+                "sensor_id": sensor_id,
+                "mcu_id": mcu_id,
+                "severity": severity.name,
+                "published": time.time(),
+                **{key: _json_number(value) for key, value in payload.items()},
+            },
+            allow_nan=False,
+        )
+        for subscriber in self._targets(sensor_id, mcu_id):
+            subscription = subscriber.subscription
+            if subscription.alarms and severity >= subscription.min_severity:
+                subscriber.offer_alarm(message)
+
+
+hub = Hub()
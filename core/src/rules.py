@@ -0,0 +1,344 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Literal, Optional, Union
+
+import numpy as np
+from pydantic import BaseModel, model_validator
+from src.hub import Severity
+
+
+@dataclass
+class ThresholdRule:
+    # Fires when the value leaves [below, above] and stays out of the band
+    # for at least `duration` seconds
+    id: int
+    sensor_id: int
+    above: Optional[float] = None
+    below: Optional[float] = None
+    duration: float = 0.0
+    severity: Severity = Severity.WARNING
+    name: str = ""
+
+
+@dataclass
+class CombinedRule:
+    # Fires when all (or any) of the referenced threshold rules are firing
+    id: int
+    rules: list[int]
+    mode: Literal["all", "any"] = "all"
+    severity: Severity = Severity.WARNING
+    name: str = ""
+
+
+Rule = Union[ThresholdRule, CombinedRule]
+
+
+class RuleDefinition(BaseModel):
+    name: str
+    severity: str = "WARNING"
+    sensor_id: Optional[int] = None
+    above: Optional[float] = None
+    below: Optional[float] = None
+    duration: float = 0.0
+    mode: Optional[Literal["all", "any"]] = None
+    rules: Optional[list[int]] = None
+
+    @model_validator(mode="after")
+    def check_kind(self):
+        if self.severity.upper() not in Severity.__members__:
+            raise ValueError(f"Unknown severity {self.severity}")
+        if self.duration < 0:
+            raise ValueError("duration must not be negative")
+        if self.rules is not None:
+            if self.sensor_id is not None or not self.rules:
+                raise ValueError("A combined rule needs rules and no sensor_id")
+        elif self.sensor_id is None:
+            raise ValueError("A threshold rule needs a sensor_id")
+        elif self.above is None and self.below is None:
+            raise ValueError("A threshold rule needs above and/or below")
+        return self
+
+    def to_rule(self, rule_id: int) -> Rule:
+        severity = Severity[self.severity.upper()]
+        if self.rules is not None:
+            return CombinedRule(
+                id=rule_id,
+                rules=self.rules,
+                mode=self.mode or "all",
+                severity=severity,
+                name=self.name,
+            )
+        return ThresholdRule(
+            id=rule_id,
+            sensor_id=self.sensor_id,
+            above=self.above,
+            below=self.below,
+            duration=self.duration,
+            severity=severity,
+            name=self.name,
+        )
+
+
+@dataclass
+class Alarm:
+    rule: Rule
+    active: bool
+    timestamp: float
+    sensor_id: Optional[int] = None
+    mcu_id: Optional[int] = None
+    value: Optional[float] = None
+
+    def payload(self) -> dict:
+        return {
+            "rule_id": self.rule.id,
+            "rule": self.rule.name,
+            "active": self.active,
+            "value": self.value,
+            "timestamp": self.timestamp,
+        }
+
+
+@dataclass
+class _Compiled:
+    # Threshold rules sorted by sensor; rules of sensor keys[i] are
+    # offsets[i]:offsets[i + 1]. All state lives in arrays of the same order.
+    rules: list[ThresholdRule]
+    keys: np.ndarray
+    offsets: np.ndarray
+    above: np.ndarray
+    below: np.ndarray
+    duration: np.ndarray
+    # Combined rules: children of combined rule j are
+    # children[child_starts[j]:child_starts[j + 1]]
+    combined: list[CombinedRule]
+    children: np.ndarray
+    child_starts: np.ndarray
+    require_all: np.ndarray
+    # Incremental state, O(1) per rule
+    run_start: np.ndarray = field(init=False)
+    firing: np.ndarray = field(init=False)
+    last_timestamp: np.ndarray = field(init=False)
+    last_value: np.ndarray = field(init=False)
+    last_mcu: np.ndarray = field(init=False)
+    combined_firing: np.ndarray = field(init=False)
+    combined_timestamp: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        n = len(self.rules)
+        self.run_start = np.full(n, np.nan)
+        self.firing = np.zeros(n, dtype=bool)
+        self.last_timestamp = np.full(n, -np.inf)
+        self.last_value = np.full(n, np.nan)
+        self.last_mcu = np.full(n, -1, dtype=np.int64)
+        self.combined_firing = np.zeros(len(self.combined), dtype=bool)
+        self.combined_timestamp = np.zeros(len(self.combined))
+
+
+def _compile(rules: list[Rule]) -> _Compiled:
+    thresholds = sorted(
+        (r for r in rules if isinstance(r, ThresholdRule)), key=lambda r: r.sensor_id
+    )
+    combined = [r for r in rules if isinstance(r, CombinedRule)]
+
+    sensor_ids = np.array([r.sensor_id for r in thresholds], dtype=np.int64)
+    keys, starts = np.unique(sensor_ids, return_index=True)
+    position = {rule.id: i for i, rule in enumerate(thresholds)}
+
+    children = []
+    child_starts = [0]
+    for rule in combined:
+        if not rule.rules:
+            raise ValueError(f"Rule {rule.id} does not reference any rules")
+        for child in rule.rules:
+            if child not in position:
+                raise ValueError(
+                    f"Rule {rule.id} references {child}, which is not a threshold rule"
+                )
+            children.append(position[child])
+        child_starts.append(len(children))
+
+    return _Compiled(
+        rules=thresholds,
+        keys=keys,
+        offsets=np.append(starts, len(thresholds)).astype(np.int64),
+        above=np.array(
+            [np.inf if r.above is None else r.above for r in thresholds], dtype=float
+        ),
+        below=np.array(
+            [-np.inf if r.below is None else r.below for r in thresholds], dtype=float
+        ),
+        duration=np.array([r.duration for r in thresholds], dtype=float),
+        combined=combined,
+        children=np.array(children, dtype=np.int64),
+        child_starts=np.array(child_starts, dtype=np.int64),
+        require_all=np.array([r.mode == "all" for r in combined], dtype=bool),
+    )
+
+
+class RuleEngine:
+    def __init__(self):
+        self._compiled = _compile([])
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> list[Rule]:
+        compiled = self._compiled
+        return [*compiled.rules, *compiled.combined]
+
+    def set_rules(self, rules: list[Rule]):
+        compiled = _compile(rules)
+        with self._lock:
+            # Keep the state of rules that survive the recompilation, so
+            # editing one rule does not re-raise every active alarm
+            old = self._compiled
+            old_position = {rule.id: i for i, rule in enumerate(old.rules)}
+            for i, rule in enumerate(compiled.rules):
+                j = old_position.get(rule.id)
+                if j is not None and old.rules[j] == rule:
+                    compiled.run_start[i] = old.run_start[j]
+                    compiled.firing[i] = old.firing[j]
+                    compiled.last_timestamp[i] = old.last_timestamp[j]
+                    compiled.last_value[i] = old.last_value[j]
+                    compiled.last_mcu[i] = old.last_mcu[j]
+            old_combined = {rule.id: i for i, rule in enumerate(old.combined)}
+            for i, rule in enumerate(compiled.combined):
+                j = old_combined.get(rule.id)
+                if j is not None and old.combined[j] == rule:
+                    compiled.combined_firing[i] = old.combined_firing[j]
+                    compiled.combined_timestamp[i] = old.combined_timestamp[j]
+            self._compiled = compiled
+
+    def active(self) -> list[Alarm]:
+        compiled = self._compiled
+        alarms = [
+            Alarm(
+                rule=compiled.rules[i],
+                active=True,
+                timestamp=float(compiled.last_timestamp[i]),
+                sensor_id=compiled.rules[i].sensor_id,
+                mcu_id=int(compiled.last_mcu[i]),
+                value=float(compiled.last_value[i]),
+            )
+            for i in np.flatnonzero(compiled.firing)
+        ]
+        alarms.extend(
+            Alarm(
+                rule=compiled.combined[j],
+                active=True,
+                timestamp=float(compiled.combined_timestamp[j]),
+            )
+            for j in np.flatnonzero(compiled.combined_firing)
+        )
+        return alarms
+
+    def evaluate(
+        self,
+        sensor_ids: np.ndarray,
+        mcu_ids: np.ndarray,
+        values: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> list[Alarm]:
+        with self._lock:
+            return self._evaluate(
+                self._compiled, sensor_ids, mcu_ids, values, timestamps
+            )
+
+    @staticmethod
+    def _evaluate(
+        c: _Compiled,
+        sensor_ids: np.ndarray,
+        mcu_ids: np.ndarray,
+        values: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> list[Alarm]:
+        if len(c.rules) == 0 or len(sensor_ids) == 0:
+            return []
+
+        # Join samples with the rules of their sensor: every (sample, rule)
+        # pair becomes one element of flat arrays
+        pos = np.searchsorted(c.keys, sensor_ids)
+        pos_clipped = np.minimum(pos, len(c.keys) - 1)
+        matched = np.flatnonzero(c.keys[pos_clipped] == sensor_ids)
+        if len(matched) == 0:
+            return []
+        pos = pos_clipped[matched]
+        counts = c.offsets[pos + 1] - c.offsets[pos]
+        total = int(counts.sum())
+        sample = np.repeat(matched, counts)
+        group_start = np.repeat(np.cumsum(counts) - counts, counts)
+        rule = np.repeat(c.offsets[pos], counts) + np.arange(total) - group_start
+
+        t = timestamps[sample]
+        order = np.lexsort((t, rule))
+        rule, sample, t = rule[order], sample[order], t[order]
+        # Samples older than what a rule already saw (replays, retries) are
+        # ignored, the state only moves forward in time
+        fresh = t > c.last_timestamp[rule]
+        rule, sample, t = rule[fresh], sample[fresh], t[fresh]
+        if len(rule) == 0:
+            return []
+        v = values[sample]
+
+        n = len(rule)
+        first = np.empty(n, dtype=bool)
+        first[0] = True
+        first[1:] = rule[1:] != rule[:-1]
+        last = np.append(first[1:], True)
+
+        violated = (v > c.above[rule]) | (v < c.below[rule])
+        previous = np.empty(n, dtype=bool)
+        previous[1:] = violated[:-1]
+        previous[first] = ~np.isnan(c.run_start[rule[first]])
+        run_begin = violated & ~previous
+
+        # Start of the current violation run, carried over from the previous
+        # batch for runs that are still open, forward-filled within each rule
+        start = np.where(violated & ~run_begin, c.run_start[rule], t)
+        start[~violated] = np.nan
+        anchor = np.where(run_begin | ~violated | first, np.arange(n), 0)
+        np.maximum.accumulate(anchor, out=anchor)
+        start = start[anchor]
+
+        met = violated & (t - start >= c.duration[rule])
+        was_met = np.empty(n, dtype=bool)
+        was_met[1:] = met[:-1]
+        was_met[first] = c.firing[rule[first]]
+        changed = np.flatnonzero(met != was_met)
+
+        ends = rule[last]
+        c.run_start[ends] = start[last]
+        c.firing[ends] = met[last]
+        c.last_timestamp[ends] = t[last]
+        c.last_value[ends] = v[last]
+        c.last_mcu[ends] = mcu_ids[sample[last]]
+
+        alarms = [
+            Alarm(
+                rule=c.rules[rule[i]],
+                active=bool(met[i]),
+                timestamp=float(t[i]),
+                sensor_id=int(sensor_ids[sample[i]]),
+                mcu_id=int(mcu_ids[sample[i]]),
+                value=float(v[i]),
+            )
+            for i in changed
+        ]
+
+        if len(c.combined):
+            state = c.firing[c.children]
+            reduce = np.where(
+                c.require_all,
+                np.logical_and.reduceat(state, c.child_starts[:-1]),
+                np.logical_or.reduceat(state, c.child_starts[:-1]),
+            )
+            moment = float(t.max())
+            for j in np.flatnonzero(reduce != c.combined_firing):
+                alarms.append(
+                    Alarm(rule=c.combined[j], active=bool(reduce[j]), timestamp=moment)
+                )
+                c.combined_timestamp[j] = moment
+            c.combined_firing[:] = reduce
+        return alarms
+
+
+rule_engine = RuleEngine()
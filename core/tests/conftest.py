@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+import pytest
+
+# Tests run on a throwaway SQLite file and the in-process cache, whatever .env
+# points at. Empty values win over .env, load_dotenv does not override them.
+for name in (
+    "PGSQL_USER",
+    "PGSQL_PASSWORD",
+    "PGSQL_HOSTNAME",
+    "PGSQL_DATABASE",
+    "REDIS_URL",
+):
+    os.environ[name] = ""
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "core.db")
+
+
+@pytest.fixture(scope="session")
+def database():
+    from src.db.utils import init_db
+
+    init_db()
@@ -0,0 +1,77 @@
+import redis
+from src.cache import IdentityCache, LRUCache
+
+
+class FakeRedis:
+    # Just the hash commands IdentityCache uses
+    def __init__(self, fail: bool = False):
+        self.hashes: dict[str, dict[str, bytes]] = {}
+        self.fail = fail
+
+    def hmget(self, name: str, keys: list[str]) -> list:
+        if self.fail:
+            raise redis.ConnectionError("down")
+        stored = self.hashes.get(name, {})
+        return [stored.get(key) for key in keys]
+
+    def hset(self, name: str, mapping: dict):
+        if self.fail:
+            raise redis.ConnectionError("down")
+        stored = self.hashes.setdefault(name, {})
+        stored.update({key: str(value).encode() for key, value in mapping.items()})
+
+
+class Loader:
+    def __init__(self, ids: dict):
+        self.ids = ids
+        self.calls: list[set] = []
+
+    def __call__(self, keys: set) -> dict:
+        self.calls.append(set(keys))
+        return {key: self.ids[key] for key in keys}
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_size=2)
+    lru.put_many({"a": 1, "b": 2})
+    assert lru.get_many(["a"]) == {"a": 1}
+    lru.put_many({"c": 3})
+    assert lru.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert (lru.hits, lru.misses) == (3, 1)
+
+
+def test_resolve_goes_lru_redis_db():
+    fake = FakeRedis()
+    load = Loader({(1, "a"): 10, (1, "b"): 11, (2, "a"): 12})
+    cache = IdentityCache(max_size=100, redis_client=fake)
+
+    assert cache.resolve("mcus", {(1, "a"), (1, "b")}, load) == {
+        (1, "a"): 10,
+        (1, "b"): 11,
+    }
+    assert load.calls == [{(1, "a"), (1, "b")}]
+    # Loaded ids are written through to Redis
+    assert fake.hashes["identity:mcus"] == {"1:a": b"10", "1:b": b"11"}
+
+    # Served from the LRU, the database is not asked again
+    assert cache.resolve("mcus", {(1, "a")}, load) == {(1, "a"): 10}
+    assert len(load.calls) == 1
+
+    # Another process: empty LRU, shared Redis, only the unknown key is loaded
+    other = IdentityCache(max_size=100, redis_client=fake)
+    assert other.resolve("mcus", {(1, "b"), (2, "a")}, load) == {
+        (1, "b"): 11,
+        (2, "a"): 12,
+    }
+    assert load.calls[-1] == {(2, "a")}
+    assert other.stats()["mcus"] == {"size": 2, "hits": 0, "misses": 2}
+
+
+def test_resolve_falls_back_to_db_when_redis_fails():
+    load = Loader({"fp": 1})
+    cache = IdentityCache(max_size=100, redis_client=FakeRedis(fail=True))
+
+    assert cache.resolve("collectors", {"fp"}, load) == {"fp": 1}
+    assert load.calls == [{"fp"}]
+    assert cache.resolve("collectors", {"fp"}, load) == {"fp": 1}
+    assert len(load.calls) == 1
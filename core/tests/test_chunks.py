@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sensors.batch import SensorBatch
+from sqlalchemy import func, select
+from src.db.chunks import (
+    compact_history,
+    decode_chunk,
+    encode_chunk,
+    read_chunks,
+    to_micros,
+)
+from src.db.engine import get_engine
+from src.db.ingest import ingest_batch, to_datetime
+from src.db.models import History_Table
+from src.db.rollups import to_epoch
+
+
+def series(kind: str) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    start = 1_700_000_000_000_000
+    if kind == "single":
+        return np.array([start]), np.array([21.5])
+    if kind == "regular":
+        return start + np.arange(1000) * 1_000_000, np.full(1000, 3.0)
+    if kind == "irregular":
+        # Jitter, repeated timestamps and gaps of days
+        steps = rng.integers(0, 5_000_000, 1000)
+        steps[::97] = 86_400_000_000 * 3
+        return start + np.cumsum(steps), np.cumsum(rng.normal(0, 1, 1000))
+    values = rng.normal(0, 1e6, 200)
+    values[[3, 4, 50]] = np.nan
+    values[[10, 11]] = np.inf, -np.inf
+    values[[20, 21, 22]] = 0.0, -0.0, 5e-324
+    values[30] = float.fromhex("0x1.fffffffffffffp+1023")
+    return start + np.arange(200) * 10, values
+
+
+@pytest.mark.parametrize("kind", ["single", "regular", "irregular", "special"])
+def test_encode_decode_round_trip(kind):
+    timestamps, values = series(kind)
+    decoded_timestamps, decoded_values = decode_chunk(encode_chunk(timestamps, values))
+    np.testing.assert_array_equal(decoded_timestamps, timestamps)
+    # Bit for bit: NaN payloads and the sign of zero survive
+    np.testing.assert_array_equal(
+        decoded_values.view(np.uint64), values.astype(np.float64).view(np.uint64)
+    )
+
+
+def test_regular_series_is_small():
+    timestamps, values = series("regular")
+    assert len(encode_chunk(timestamps, values)) < 2.5 * len(values)
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_chunk(b"XXXX" + bytes(20))
+
+
+def test_compaction_keeps_samples(database):
+    rng = np.random.default_rng(1)
+    count = 2500
+    timestamps = to_epoch(datetime(2024, 4, 1)) + np.cumsum(rng.uniform(0.5, 2, count))
+    values = np.round(rng.normal(20, 1, count), 2)
+    ingested = ingest_batch(
+        SensorBatch(
+            [("chunks", "board", "t")], np.zeros(count, np.uint32), values, timestamps
+        )
+    )
+    sensor_id = int(ingested.sensor_ids[0])
+
+    stats = compact_history(max_age=0)
+
+    assert stats.rows >= count
+    history = History_Table.__table__.c
+    with get_engine().connect() as conn:
+        left = conn.execute(
+            select(func.count()).where(history.sensor_id == sensor_id)
+        ).scalar()
+        micros, stored = read_chunks(
+            conn, sensor_id, datetime(2024, 4, 1), datetime(2024, 4, 2)
+        )
+    assert left == 0
+    order = np.argsort(micros, kind="stable")
+    expected = to_micros([to_datetime(t) for t in timestamps.tolist()])
+    np.testing.assert_array_equal(micros[order], expected)
+    np.testing.assert_array_equal(stored[order], values)
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+from sensors.batch import SensorBatch
+from sqlalchemy import func, select
+from src.db.engine import get_engine
+from src.db.ingest import (
+    _insert_ignore,
+    ingest_batch,
+    resolve_collectors,
+    resolve_mcus,
+)
+from src.db.models import History_Table, MCUs_Table
+
+
+def test_resolve_creates_missing_once(database):
+    with get_engine().begin() as conn:
+        collectors = resolve_collectors(conn, {"ingest-a", "ingest-b"})
+        a, b = collectors["ingest-a"], collectors["ingest-b"]
+        mcus = resolve_mcus(conn, {(a, "board"), (b, "board")})
+        # The same MCU name under two collectors is two MCUs
+        assert mcus[(a, "board")] != mcus[(b, "board")]
+        # Known keys resolve to the same ids
+        assert resolve_mcus(conn, {(a, "board")}) == {(a, "board"): mcus[(a, "board")]}
+        assert resolve_collectors(conn, {"ingest-a"}) == {"ingest-a": a}
+
+
+def test_insert_ignore_skips_existing_rows(database):
+    # Another process created the MCU between our lookup and our insert
+    with get_engine().begin() as conn:
+        collector_id = resolve_collectors(conn, {"ingest-race"})["ingest-race"]
+        existing = resolve_mcus(conn, {(collector_id, "board")})
+        _insert_ignore(
+            conn,
+            MCUs_Table.__table__,
+            [
+                {"collector_id": collector_id, "name": "board"},
+                {"collector_id": collector_id, "name": "other"},
+            ],
+        )
+        resolved = resolve_mcus(
+            conn, {(collector_id, "board"), (collector_id, "other")}
+        )
+        assert resolved[(collector_id, "board")] == existing[(collector_id, "board")]
+        rows = conn.execute(
+            select(func.count())
+            .select_from(MCUs_Table)
+            .where(MCUs_Table.collector_id == collector_id)
+        ).scalar()
+        assert rows == 2
+
+
+def test_ingest_batch_keys_mcus_on_collector(database):
+    now = time.time()
+    batch = SensorBatch(
+        [("ingest-c", "board", "t"), ("ingest-d", "board", "t")],
+        np.array([0, 1, 0, 1], np.uint32),
+        np.array([1.0, 2.0, 3.0, 4.0]),
+        np.array([now, now, now + 1, now + 1]),
+    )
+
+    ingested = ingest_batch(batch)
+
+    assert ingested.rows == 4
+    mcu_ids = ingested.mcu_ids.tolist()
+    assert mcu_ids[0] == mcu_ids[2] and mcu_ids[1] == mcu_ids[3]
+    assert mcu_ids[0] != mcu_ids[1]
+    assert len(set(ingested.sensor_ids.tolist())) == 2
+    with get_engine().connect() as conn:
+        stored = conn.execute(
+            select(func.count())
+            .select_from(History_Table)
+            .where(History_Table.sensor_id.in_(ingested.sensor_ids.tolist()))
+        ).scalar()
+    assert stored == 4
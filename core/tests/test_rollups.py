@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sensors.batch import SensorBatch
+from sqlalchemy import select, update
+from src.db.engine import get_engine
+from src.db.ingest import ingest_batch
+from src.db.rollups import (
+    ROLLUPS,
+    apply_rollups,
+    backfill_rollups,
+    from_epoch,
+    to_epoch,
+)
+
+
+def samples(day: datetime, count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    timestamps = to_epoch(day) + np.sort(rng.uniform(0, 3 * 3600, count))
+    return rng.normal(20.0, 5.0, count), timestamps
+
+
+def expected(values: np.ndarray, timestamps: np.ndarray, seconds: int) -> dict:
+    buckets = {}
+    for bucket in np.unique(timestamps // seconds * seconds):
+        inside = timestamps // seconds * seconds == bucket
+        last = np.argmax(np.where(inside, timestamps, -np.inf))
+        buckets[from_epoch(bucket)] = (
+            values[inside].min(),
+            values[inside].max(),
+            values[inside].sum(),
+            int(inside.sum()),
+            values[last],
+        )
+    return buckets
+
+
+def stored(sensor_id: int, table) -> dict:
+    c = table.__table__.c
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            select(c.bucket, c.min, c.max, c.sum, c.count, c.last).where(
+                c.sensor_id == sensor_id
+            )
+        )
+        return {bucket: tuple(rest) for bucket, *rest in rows}
+
+
+def assert_rollups(sensor_id: int, values: np.ndarray, timestamps: np.ndarray):
+    for resolution in ROLLUPS:
+        want = expected(values, timestamps, resolution.seconds)
+        got = stored(sensor_id, resolution.table)
+        assert got.keys() == want.keys(), resolution.name
+        for bucket, row in want.items():
+            assert got[bucket] == pytest.approx(row), (resolution.name, bucket)
+
+
+def test_upsert_merges_batches(database):
+    # Late samples land in buckets that already have rows
+    sensor_id = 80_001
+    values, timestamps = samples(datetime(2024, 3, 1), 500, seed=1)
+    order = np.random.default_rng(2).permutation(len(values))
+    ids = np.full(len(values), sensor_id, np.int64)
+    engine = get_engine()
+    for part in np.array_split(order, 4):
+        with engine.begin() as conn:
+            apply_rollups(conn, ids[part], values[part], timestamps[part])
+
+    assert_rollups(sensor_id, values, timestamps)
+
+
+def test_backfill_rebuilds_from_history(database):
+    values, timestamps = samples(datetime(2024, 3, 2), 300, seed=3)
+    ingested = ingest_batch(
+        SensorBatch(
+            [("rollups", "board", "t")],
+            np.zeros(len(values), np.uint32),
+            values,
+            timestamps,
+        )
+    )
+    sensor_id = int(ingested.sensor_ids[0])
+    assert_rollups(sensor_id, values, timestamps)
+
+    # Rollups gone wrong, e.g. written by an older version
+    hour = ROLLUPS[1].table
+    with get_engine().begin() as conn:
+        conn.execute(
+            update(hour).where(hour.sensor_id == sensor_id).values(count=1, sum=0.0)
+        )
+
+    rebuilt = backfill_rollups(datetime(2024, 3, 2), datetime(2024, 3, 3))
+
+    assert rebuilt == len(values)
+    assert_rollups(sensor_id, values, timestamps)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from src.rules import CombinedRule, RuleEngine, ThresholdRule
+
+RULES = [
+    ThresholdRule(id=1, sensor_id=10, above=1.0),
+    ThresholdRule(id=2, sensor_id=10, below=-1.0, duration=3.0),
+    ThresholdRule(id=3, sensor_id=11, above=0.5, below=-0.5, duration=1.0),
+    ThresholdRule(id=4, sensor_id=12, above=0.0, duration=5.0),
+    CombinedRule(id=5, rules=[1, 3], mode="any"),
+    CombinedRule(id=6, rules=[2, 4], mode="all"),
+]
+
+
+def readings(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # Sensor 13 has no rules
+    sensor_ids = rng.choice([10, 11, 12, 13], count)
+    mcu_ids = sensor_ids + 100
+    values = np.cumsum(rng.normal(0, 0.6, count))
+    timestamps = np.cumsum(rng.uniform(0.1, 1.0, count))
+    return sensor_ids, mcu_ids, values, timestamps
+
+
+def engine() -> RuleEngine:
+    rule_engine = RuleEngine()
+    rule_engine.set_rules(RULES)
+    return rule_engine
+
+
+def transitions(alarms) -> list[tuple]:
+    return sorted(
+        (a.rule.id, a.active, a.timestamp, a.sensor_id, a.mcu_id, a.value)
+        for a in alarms
+        if isinstance(a.rule, ThresholdRule)
+    )
+
+
+def reference(sensor_ids, values, timestamps) -> list[tuple]:
+    # Straightforward per-rule loop over samples in time order
+    alarms = []
+    for rule in RULES:
+        if not isinstance(rule, ThresholdRule):
+            continue
+        above = np.inf if rule.above is None else rule.above
+        below = -np.inf if rule.below is None else rule.below
+        run_start, firing = None, False
+        for i in np.argsort(timestamps, kind="stable"):
+            if sensor_ids[i] != rule.sensor_id:
+                continue
+            t, v = float(timestamps[i]), float(values[i])
+            if v > above or v < below:
+                run_start = t if run_start is None else run_start
+                met = t - run_start >= rule.duration
+            else:
+                run_start, met = None, False
+            if met != firing:
+                alarms.append(
+                    (rule.id, met, t, rule.sensor_id, rule.sensor_id + 100, v)
+                )
+                firing = met
+    return sorted(alarms)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("batch_size", [1, 7, 1000])
+def test_batches_match_per_row_evaluation(seed, batch_size):
+    sensor_ids, mcu_ids, values, timestamps = readings(1000, seed)
+    rule_engine = engine()
+    alarms = []
+    for start in range(0, len(values), batch_size):
+        part = slice(start, start + batch_size)
+        # Rows within a batch may arrive out of order
+        order = np.random.default_rng(start).permutation(len(values[part]))
+        alarms += rule_engine.evaluate(
+            sensor_ids[part][order],
+            mcu_ids[part][order],
+            values[part][order],
+            timestamps[part][order],
+        )
+
+    assert transitions(alarms) == reference(sensor_ids, values, timestamps)
+    assert any(isinstance(a.rule, CombinedRule) for a in alarms)
+
+    # Combined rules end in the state of their children
+    firing = {a.rule.id for a in rule_engine.active()}
+    assert (5 in firing) == (1 in firing or 3 in firing)
+    assert (6 in firing) == (2 in firing and 4 in firing)
+
+
+def test_old_samples_are_ignored():
+    rule_engine = engine()
+    ids, mcus = np.array([10]), np.array([110])
+    alarms = rule_engine.evaluate(ids, mcus, np.array([2.0]), np.array([10.0]))
+    assert [(a.rule.id, a.active) for a in alarms] == [(1, True), (5, True)]
+    # A replayed older sample does not clear the alarm
+    assert rule_engine.evaluate(ids, mcus, np.array([0.0]), np.array([5.0])) == []
+    assert {a.rule.id for a in rule_engine.active()} == {1, 5}
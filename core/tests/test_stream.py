@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sensors.batch import SensorBatch
+from sqlalchemy import insert
+from src.db.chunks import encode_chunk, from_micros, to_micros
+from src.db.engine import get_engine
+from src.db.ingest import ingest_batch
+from src.db.models import HistoryChunk_Table
+from src.db.stream import _raw_stream
+
+DAY = datetime(2024, 5, 1)
+START, END = datetime(2024, 5, 1, 2), datetime(2024, 5, 1, 20)
+
+
+@pytest.fixture(scope="module")
+def stored(database):
+    # Distinct whole-second samples of one sensor, split between history rows
+    # and chunks. Chunks overlap each other and the rows, one starts before
+    # the queried range and one ends after it.
+    rng = np.random.default_rng(5)
+    seconds = np.sort(rng.choice(86_400, 3000, replace=False))
+    micros = to_micros([DAY])[0] + seconds * 1_000_000
+    values = rng.normal(0, 1, len(micros))
+    owner = rng.integers(0, 5, len(micros))
+    in_chunks = owner > 0
+
+    rows = ~in_chunks
+    ingested = ingest_batch(
+        SensorBatch(
+            [("stream", "board", "t")],
+            np.zeros(int(rows.sum()), np.uint32),
+            values[rows],
+            micros[rows] / 1e6,
+        )
+    )
+    sensor_id = int(ingested.sensor_ids[0])
+
+    chunks = []
+    for chunk in range(1, 5):
+        mine = np.flatnonzero(owner == chunk)
+        t, v = micros[mine], values[mine]
+        start, end = from_micros(t[[0, -1]])
+        chunks.append(
+            {
+                "sensor_id": sensor_id,
+                "start": start,
+                "end": end,
+                "count": len(t),
+                "min": float(v.min()),
+                "max": float(v.max()),
+                "data": encode_chunk(t, v),
+            }
+        )
+    with get_engine().begin() as conn:
+        conn.execute(insert(HistoryChunk_Table), chunks)
+
+    low, high = to_micros([START, END])
+    inside = (micros >= low) & (micros < high)
+    return sensor_id, micros[inside], values[inside]
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 500, 10_000])
+def test_raw_stream_merges_rows_and_chunks_in_order(stored, batch_size):
+    sensor_id, micros, values = stored
+    with get_engine().connect() as conn:
+        batches = list(_raw_stream(conn, sensor_id, START, END, batch_size))
+
+    timestamps = np.concatenate([t for t, _ in batches])
+    np.testing.assert_array_equal(timestamps, micros)
+    np.testing.assert_array_equal(np.concatenate([v for _, v in batches]), values)
+    assert all(len(t) == len(v) for t, v in batches)
+
+
+def test_raw_stream_of_empty_range(stored):
+    sensor_id, _, _ = stored
+    with get_engine().connect() as conn:
+        batches = list(
+            _raw_stream(conn, sensor_id, datetime(2024, 6, 1), datetime(2024, 6, 2), 10)
+        )
+    assert sum(len(t) for t, _ in batches) == 0
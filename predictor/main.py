@@ -1,5 +1,84 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+import websockets
+from src.logger import log_info, log_warning
+from src.store import ModelStore
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+WS_URL = API_URL.replace("http", "ws", 1) + "/ws?alarms=false&coalesce=false"
+AR_ORDER = int(os.getenv("PREDICTOR_AR_ORDER", 4))
+MODEL_DIR = os.getenv("PREDICTOR_MODEL_DIR", "models")
+MAX_RESIDENT_MODELS = int(os.getenv("PREDICTOR_MAX_RESIDENT_MODELS", 100_000))
+MAX_PENDING_MODELS = int(os.getenv("PREDICTOR_MAX_PENDING_MODELS", 10_000))
+CHECKPOINT_INTERVAL = float(os.getenv("PREDICTOR_CHECKPOINT_INTERVAL", 60))
+REPORT_INTERVAL = 30
+
+store = ModelStore(
+    MODEL_DIR,
+    max_resident=MAX_RESIDENT_MODELS,
+    order=AR_ORDER,
+    max_pending=MAX_PENDING_MODELS,
+)
+
+
+async def apply_frame(frame: str) -> int:
+    # The uncoalesced feed: every committed sample, one message per batch
+    messages = [m for m in json.loads(frame) if m.get("type") == "values"]
+    if not messages:
+        return 0
+    await store.update(
+        np.concatenate([np.array(m["sensor_id"], np.int64) for m in messages]),
+        np.concatenate([np.array(m["value"], np.float64) for m in messages]),
+        np.concatenate([np.array(m["timestamp"], np.float64) for m in messages]),
+    )
+    return sum(len(m["sensor_id"]) for m in messages)
+
+
+async def consume():
+    delay = 1.0
+    while True:
+        try:
+            async with websockets.connect(WS_URL, max_size=None) as websocket:
+                log_info(f"Subscribed to {WS_URL}")
+                delay = 1.0
+                samples = 0
+                last_report = time.monotonic()
+                async for frame in websocket:
+                    samples += await apply_frame(frame)
+                    now = time.monotonic()
+                    if now - last_report >= REPORT_INTERVAL:
+                        metrics = store.metrics()
+                        log_info(
+                            f"Predictor: {samples / (now - last_report):.0f} "
+                            f"samples/s, {metrics['resident']} resident models, "
+                            f"hit rate {metrics['hit_rate']:.3f}, "
+                            f"load p99 {metrics['load_ms_p99']:.2f} ms, "
+                            f"{metrics['memory_bytes'] / 2**20:.1f} MiB"
+                        )
+                        samples = 0
+                        last_report = now
+        except (OSError, websockets.WebSocketException) as e:
+            log_warning(f"Connection to core lost: {e}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, 60.0)
+
+
+async def run():
+    checkpoints = asyncio.create_task(store.run_checkpoints(CHECKPOINT_INTERVAL))
+    try:
+        await consume()
+    finally:
+        checkpoints.cancel()
+        await store.checkpoint()
+
+
 def main():
-    print("Hello from predictor!")
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
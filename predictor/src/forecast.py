@@ -0,0 +1,234 @@
+from typing import Optional
+
+import numpy as np
+
+
+class ARModels:
+    # One recursive least squares AR(order) model with intercept per sensor.
+    # All models live in stacked arrays indexed by slot, so a batch updates
+    # every sensor it touches with a handful of NumPy operations.
+    def __init__(
+        self,
+        order: int = 4,
+        forgetting: float = 0.995,
+        initial_covariance: float = 1000.0,
+        error_alpha: float = 0.05,
+        capacity: int = 1024,
+    ):
+        self.order = order
+        self.forgetting = forgetting
+        self.initial_covariance = initial_covariance
+        self.error_alpha = error_alpha
+        self.slots: dict[int, int] = {}
+
+        dim = order + 1
+        self.theta = np.zeros((capacity, dim))
+        self.covariance = np.zeros((capacity, dim, dim))
+        # Most recent value first
+        self.lags = np.zeros((capacity, order))
+        self.seen = np.zeros(capacity, dtype=np.int64)
+        self.error = np.zeros(capacity)
+        self.last_timestamp = np.full(capacity, -np.inf)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.theta)
+
+    def _grow(self, capacity: int):
+        def extend(array: np.ndarray, fill) -> np.ndarray:
+            grown = np.full((capacity, *array.shape[1:]), fill, dtype=array.dtype)
+            grown[: len(array)] = array
+            return grown
+
+        self.theta = extend(self.theta, 0.0)
+        self.covariance = extend(self.covariance, 0.0)
+        self.lags = extend(self.lags, 0.0)
+        self.seen = extend(self.seen, 0)
+        self.error = extend(self.error, 0.0)
+        self.last_timestamp = extend(self.last_timestamp, -np.inf)
+
+    def reset_slots(self, slots: np.ndarray):
+        self.theta[slots] = 0.0
+        self.covariance[slots] = np.eye(self.order + 1) * self.initial_covariance
+        self.lags[slots] = 0.0
+        self.seen[slots] = 0
+        self.error[slots] = 0.0
+        self.last_timestamp[slots] = -np.inf
+
+    def slots_for(self, sensor_ids: np.ndarray) -> np.ndarray:
+        unique = np.unique(sensor_ids).tolist()
+        new = [sensor_id for sensor_id in unique if sensor_id not in self.slots]
+        if new:
+            first = len(self.slots)
+            if first + len(new) > self.capacity:
+                self._grow(max(self.capacity * 2, first + len(new)))
+            for offset, sensor_id in enumerate(new):
+                self.slots[sensor_id] = first + offset
+            self.reset_slots(np.arange(first, first + len(new)))
+        lookup = np.array([self.slots[sensor_id] for sensor_id in unique])
+        return lookup[np.searchsorted(unique, sensor_ids)]
+
+    def update(
+        self, sensor_ids: np.ndarray, values: np.ndarray, timestamps: np.ndarray
+    ):
+        if len(sensor_ids) == 0:
+            return
+        self.update_slots(self.slots_for(sensor_ids), values, timestamps)
+
+    def update_slots(
+        self, slots: np.ndarray, values: np.ndarray, timestamps: np.ndarray
+    ):
+        order = np.lexsort((timestamps, slots))
+        slots, values, timestamps = slots[order], values[order], timestamps[order]
+        fresh = timestamps > self.last_timestamp[slots]
+        slots, values, timestamps = slots[fresh], values[fresh], timestamps[fresh]
+        if len(slots) == 0:
+            return
+
+        starts = np.flatnonzero(np.append(True, slots[1:] != slots[:-1]))
+        counts = np.diff(np.append(starts, len(slots)))
+        rank = np.arange(len(slots)) - np.repeat(starts, counts)
+        ends = starts + counts - 1
+
+        x = np.ones((len(slots), self.order + 1))
+        x[:, :-1] = self._lagged(slots, values, np.arange(len(slots)), rank)
+        # A sample updates the model once the sensor has order values before it
+        warm = self.seen[slots] + rank >= self.order
+        if warm.any():
+            # Samples left after this one in the batch
+            age = np.repeat(ends, counts) - np.arange(len(slots))
+            self._fit(slots[warm], x[warm], values[warm], age[warm])
+
+        last = slots[ends]
+        self.lags[last] = self._lagged(last, values, ends + 1, counts)
+        self.seen[last] += counts
+        self.last_timestamp[last] = timestamps[ends]
+
+    def _lagged(
+        self,
+        slots: np.ndarray,
+        values: np.ndarray,
+        positions: np.ndarray,
+        rank: np.ndarray,
+    ) -> np.ndarray:
+        # The order values before each position, most recent first: from the
+        # batch where the sensor has that many samples before it, from the
+        # lags of earlier batches otherwise
+        back = np.arange(1, self.order + 1)
+        in_batch = values[np.maximum(positions[:, None] - back, 0)]
+        stored = self.lags[
+            slots[:, None], np.clip(back - rank[:, None] - 1, 0, self.order - 1)
+        ]
+        return np.where(rank[:, None] >= back, in_batch, stored)
+
+    def _fit(self, slots: np.ndarray, x: np.ndarray, y: np.ndarray, age: np.ndarray):
+        # All samples of a sensor at once, in information form: m samples with
+        # forgetting give P'^-1 = l^m P^-1 + sum l^age x x' and
+        # P'^-1 theta' = l^m P^-1 theta + sum l^age x y, exactly what m
+        # sequential RLS steps produce
+        starts = np.flatnonzero(np.append(True, slots[1:] != slots[:-1]))
+        counts = np.diff(np.append(starts, len(slots)))
+        s = slots[starts]
+        theta = self.theta[s]
+        information = np.linalg.inv(self.covariance[s])
+        decay = self.forgetting**counts
+        weights = self.forgetting**age
+
+        A = decay[:, None, None] * information + np.add.reduceat(
+            weights[:, None, None] * x[:, :, None] * x[:, None, :], starts
+        )
+        b = decay[:, None] * np.einsum("nij,nj->ni", information, theta)
+        b += np.add.reduceat(weights[:, None] * x * y[:, None], starts)
+        P = np.linalg.inv(A)
+        # Keep the covariance symmetric against rounding drift
+        self.covariance[s] = (P + P.transpose(0, 2, 1)) / 2
+        self.theta[s] = np.einsum("nij,nj->ni", self.covariance[s], b)
+
+        # Residuals are taken against the model as it was before the batch,
+        # the same as one step per sample when a batch holds one sample of a
+        # sensor. A model that was not fitted yet would only measure the
+        # signal, its first batch is checked against the new fit instead.
+        fitted = self.seen[s] > self.order
+        reference = np.where(fitted[:, None], theta, self.theta[s])
+        residual = y - np.einsum("ni,ni->n", np.repeat(reference, counts, axis=0), x)
+        kept = (1 - self.error_alpha) ** age
+        self.error[s] = (1 - self.error_alpha) ** counts * self.error[
+            s
+        ] + np.add.reduceat(self.error_alpha * kept * np.abs(residual), starts)
+
+    def forecast(self, sensor_ids: np.ndarray, horizon: int = 1) -> np.ndarray:
+        # Recursive multi-step forecast, one column per step ahead. Sensors
+        # without a warmed up model get NaN.
+        result = np.full((len(sensor_ids), horizon), np.nan)
+        known = np.array([sensor_id in self.slots for sensor_id in sensor_ids.tolist()])
+        if known.any():
+            slots = np.array([self.slots[i] for i in sensor_ids[known].tolist()])
+            result[known] = self.forecast_slots(slots, horizon)
+        return result
+
+    def forecast_slots(self, slots: np.ndarray, horizon: int = 1) -> np.ndarray:
+        result = np.full((len(slots), horizon), np.nan)
+        warm = np.flatnonzero(self.seen[slots] > self.order)
+        slots = slots[warm]
+        lags = self.lags[slots].copy()
+        theta = self.theta[slots]
+        for step in range(horizon):
+            predicted = np.einsum("ni,ni->n", theta[:, :-1], lags) + theta[:, -1]
+            result[warm, step] = predicted
+            lags[:, 1:] = lags[:, :-1]
+            lags[:, 0] = predicted
+        return result
+
+    @property
+    def record_size(self) -> int:
+        dim = self.order + 1
+        return 3 + dim + dim * dim + self.order
+
+    def export_slots(self, slots: np.ndarray) -> np.ndarray:
+        # Flat float64 record per slot: seen, last timestamp, error, theta,
+        # covariance and lags
+        n = len(slots)
+        return np.concatenate(
+            (
+                self.seen[slots, None].astype(np.float64),
+                self.last_timestamp[slots, None],
+                self.error[slots, None],
+                self.theta[slots],
+                self.covariance[slots].reshape(n, -1),
+                self.lags[slots],
+            ),
+            axis=1,
+        )
+
+    def import_slots(self, slots: np.ndarray, records: np.ndarray):
+        dim = self.order + 1
+        self.seen[slots] = records[:, 0].astype(np.int64)
+        self.last_timestamp[slots] = records[:, 1]
+        self.error[slots] = records[:, 2]
+        offset = 3
+        self.theta[slots] = records[:, offset : offset + dim]
+        offset += dim
+        self.covariance[slots] = records[:, offset : offset + dim * dim].reshape(
+            -1, dim, dim
+        )
+        self.lags[slots] = records[:, offset + dim * dim :]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.theta,
+                self.covariance,
+                self.lags,
+                self.seen,
+                self.error,
+                self.last_timestamp,
+            )
+        )
+
+    def mean_error(self, sensor_id: int) -> Optional[float]:
+        slot = self.slots.get(sensor_id)
+        if slot is None or self.seen[slot] <= self.order:
+            return None
+        return float(self.error[slot])
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import struct
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from src.forecast import ARModels
+from src.logger import log_info, log_warning
+
+_MAGIC = b"ARM1"
+_HEADER = struct.Struct("<4sH")  # magic, AR order
+
+
+@dataclass
+class StoreStats:
+    hits: int = 0
+    misses: int = 0
+    disk_loads: int = 0
+    evictions: int = 0
+    checkpoints: int = 0
+    written: int = 0
+    last_checkpoint: float = 0.0
+    load_seconds: deque = field(default_factory=lambda: deque(maxlen=10_000))
+
+
+class ModelStore:
+    # Bounded working set of per-sensor models. Resident models occupy slots
+    # of one ARModels instance; the rest live as small binary snapshots on
+    # disk and are loaded on first access.
+    def __init__(
+        self,
+        directory: str = "models",
+        max_resident: int = 100_000,
+        order: int = 4,
+        max_pending: int = 10_000,
+        **model_options,
+    ):
+        self.directory = Path(directory)
+        self.max_resident = max_resident
+        self.max_pending = max_pending
+        self.models = ARModels(order=order, capacity=max_resident, **model_options)
+        self.stats = StoreStats()
+
+        # sensor -> slot in recency order, shared with the models for lookups
+        self._lru: OrderedDict[int, int] = OrderedDict()
+        self.models.slots = self._lru
+        self._sensor_of = np.full(max_resident, -1, dtype=np.int64)
+        self._free = list(range(max_resident - 1, -1, -1))
+        self._dirty = np.zeros(max_resident, dtype=bool)
+        # Snapshots that are newer than the file on disk: evicted models and
+        # the checkpoint being written. Written out early beyond max_pending.
+        self._pending: dict[int, np.ndarray] = {}
+        self._checkpoint_lock = asyncio.Lock()
+
+    def _path(self, sensor_id: int) -> Path:
+        return self.directory / f"{sensor_id % 256:02x}" / f"{sensor_id}.bin"
+
+    def _read(self, sensor_id: int) -> Optional[np.ndarray]:
+        try:
+            data = self._path(sensor_id).read_bytes()
+        except FileNotFoundError:
+            return None
+        magic, order = _HEADER.unpack_from(data)
+        record = np.frombuffer(data, dtype=np.float64, offset=_HEADER.size)
+        if (
+            magic != _MAGIC
+            or order != self.models.order
+            or len(record) != self.models.record_size
+        ):
+            log_warning(f"Ignoring incompatible model snapshot for sensor {sensor_id}")
+            return None
+        return record
+
+    def _read_all(
+        self, sensor_ids: list[int]
+    ) -> tuple[dict[int, np.ndarray], list[float]]:
+        # Snapshots found on disk and the seconds each load took
+        records, seconds = {}, []
+        for sensor_id in sensor_ids:
+            started = time.perf_counter()
+            record = self._read(sensor_id)
+            if record is not None:
+                seconds.append(time.perf_counter() - started)
+                records[sensor_id] = record
+        return records, seconds
+
+    def _write(self, sensor_id: int, record: np.ndarray):
+        path = self._path(sensor_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self.models.order))
+            f.write(record.tobytes())
+        os.replace(temporary, path)
+
+    def _evict(self, count: int):
+        evicted = [self._lru.popitem(last=False) for _ in range(count)]
+        slots = np.array([slot for _, slot in evicted], dtype=np.int64)
+        dirty = slots[self._dirty[slots]]
+        if len(dirty):
+            records = self.models.export_slots(dirty)
+            for sensor_id, record in zip(self._sensor_of[dirty].tolist(), records):
+                self._pending[sensor_id] = record
+        self._dirty[slots] = False
+        self._sensor_of[slots] = -1
+        self._free.extend(slots.tolist())
+        self.stats.evictions += count
+
+    async def _acquire(self, unique: list[int]) -> np.ndarray:
+        # Snapshots are read from a thread before anything changes, the loop
+        # keeps running meanwhile
+        wanted = [
+            sensor_id
+            for sensor_id in unique
+            if sensor_id not in self._lru and sensor_id not in self._pending
+        ]
+        loaded = {}
+        if wanted:
+            loaded, seconds = await asyncio.to_thread(self._read_all, wanted)
+            self.stats.load_seconds.extend(seconds)
+            self.stats.disk_loads += len(loaded)
+
+        # Resident models are moved to the recent end first, so evicting from
+        # the old end never evicts a model of this batch
+        missing = []
+        for sensor_id in unique:
+            if sensor_id in self._lru:
+                self._lru.move_to_end(sensor_id)
+            else:
+                missing.append(sensor_id)
+        self.stats.hits += len(unique) - len(missing)
+        self.stats.misses += len(missing)
+
+        if missing:
+            if len(missing) > len(self._free):
+                self._evict(len(missing) - len(self._free))
+            slots = np.array([self._free.pop() for _ in missing], dtype=np.int64)
+            self.models.reset_slots(slots)
+            loaded_slots, records = [], []
+            for sensor_id, slot in zip(missing, slots.tolist()):
+                # A model evicted while the files were read is newer than its
+                # file
+                record = self._pending.get(sensor_id)
+                if record is None:
+                    record = loaded.get(sensor_id)
+                if record is not None:
+                    loaded_slots.append(slot)
+                    records.append(record)
+                self._lru[sensor_id] = slot
+            if records:
+                self.models.import_slots(np.array(loaded_slots), np.stack(records))
+            self._sensor_of[slots] = missing
+
+        return np.array([self._lru[sensor_id] for sensor_id in unique], dtype=np.int64)
+
+    def _chunks(self, sensor_ids: np.ndarray):
+        # A batch touching more sensors than fit in memory is processed in
+        # groups of at most max_resident sensors
+        unique = np.unique(sensor_ids)
+        if len(unique) <= self.max_resident:
+            yield unique, None
+            return
+        for start in range(0, len(unique), self.max_resident):
+            chunk = unique[start : start + self.max_resident]
+            yield chunk, np.isin(sensor_ids, chunk)
+
+    async def update(
+        self, sensor_ids: np.ndarray, values: np.ndarray, timestamps: np.ndarray
+    ):
+        if len(sensor_ids) == 0:
+            return
+        for unique, mask in self._chunks(sensor_ids):
+            if mask is None:
+                ids, chunk_values, chunk_timestamps = sensor_ids, values, timestamps
+            else:
+                ids = sensor_ids[mask]
+                chunk_values, chunk_timestamps = values[mask], timestamps[mask]
+            lookup = await self._acquire(unique.tolist())
+            slots = lookup[np.searchsorted(unique, ids)]
+            self.models.update_slots(slots, chunk_values, chunk_timestamps)
+            self._dirty[slots] = True
+        if len(self._pending) > self.max_pending:
+            await self.flush()
+
+    async def forecast(self, sensor_ids: np.ndarray, horizon: int = 1) -> np.ndarray:
+        result = np.full((len(sensor_ids), horizon), np.nan)
+        for unique, mask in self._chunks(sensor_ids):
+            rows = np.arange(len(sensor_ids)) if mask is None else np.flatnonzero(mask)
+            lookup = await self._acquire(unique.tolist())
+            slots = lookup[np.searchsorted(unique, sensor_ids[rows])]
+            result[rows] = self.models.forecast_slots(slots, horizon)
+        return result
+
+    def _write_all(self, records: dict[int, np.ndarray]):
+        for sensor_id, record in records.items():
+            self._write(sensor_id, record)
+
+    async def checkpoint(self):
+        async with self._checkpoint_lock:
+            started = time.perf_counter()
+            # Copy the dirty models while the loop is ours, then write the
+            # copies from a thread: inference keeps running meanwhile
+            slots = np.flatnonzero(self._dirty)
+            if len(slots):
+                records = self.models.export_slots(slots)
+                for sensor_id, record in zip(self._sensor_of[slots].tolist(), records):
+                    self._pending[sensor_id] = record
+                self._dirty[slots] = False
+
+            snapshot = await self._write_pending()
+            if not snapshot:
+                return
+
+            self.stats.checkpoints += 1
+            self.stats.last_checkpoint = time.perf_counter() - started
+            log_info(
+                f"Checkpointed {len(snapshot)} models "
+                f"in {self.stats.last_checkpoint * 1000:.0f} ms"
+            )
+
+    async def flush(self):
+        # Writes the evicted models that wait for a checkpoint, so they do
+        # not pile up in memory between checkpoints
+        async with self._checkpoint_lock:
+            snapshot = await self._write_pending()
+            if snapshot:
+                log_info(f"Flushed {len(snapshot)} evicted models")
+
+    async def _write_pending(self) -> dict[int, np.ndarray]:
+        snapshot = dict(self._pending)
+        if snapshot:
+            await asyncio.to_thread(self._write_all, snapshot)
+            for sensor_id, record in snapshot.items():
+                # Keep entries that were replaced by a newer eviction meanwhile
+                if self._pending.get(sensor_id) is record:
+                    del self._pending[sensor_id]
+            self.stats.written += len(snapshot)
+        return snapshot
+
+    async def run_checkpoints(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.checkpoint()
+
+    def metrics(self) -> dict:
+        stats = self.stats
+        lookups = stats.hits + stats.misses
+        loads = np.array(stats.load_seconds) * 1000
+        pending_bytes = sum(record.nbytes for record in self._pending.values())
+        return {
+            "resident": len(self._lru),
+            "max_resident": self.max_resident,
+            "hit_rate": stats.hits / lookups if lookups else 0.0,
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "disk_loads": stats.disk_loads,
+            "load_ms_p50": float(np.percentile(loads, 50)) if len(loads) else 0.0,
+            "load_ms_p99": float(np.percentile(loads, 99)) if len(loads) else 0.0,
+            "evictions": stats.evictions,
+            "pending": len(self._pending),
+            "memory_bytes": self.models.nbytes + self._dirty.nbytes + pending_bytes,
+            "checkpoints": stats.checkpoints,
+            "written": stats.written,
+            "last_checkpoint_ms": stats.last_checkpoint * 1000,
+        }
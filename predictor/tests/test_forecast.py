@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from src.forecast import ARModels
+
+
+def signals(count: int, seed: int):
+    # Interleaved AR(2) processes of three sensors
+    rng = np.random.default_rng(seed)
+    sensor_ids = rng.choice([3, 5, 8], count)
+    values = np.empty(count)
+    history = {3: [0.0, 0.0], 5: [1.0, 1.0], 8: [-1.0, -1.0]}
+    for i, sensor_id in enumerate(sensor_ids.tolist()):
+        previous = history[sensor_id]
+        value = 0.6 * previous[-1] - 0.2 * previous[-2] + rng.normal(0, 0.1)
+        previous.append(value)
+        values[i] = value
+    return sensor_ids, values, np.arange(count, dtype=np.float64)
+
+
+def assert_same_models(batched: ARModels, sequential: ARModels):
+    # Slots are handed out in a different order, models are compared by sensor
+    assert batched.slots.keys() == sequential.slots.keys()
+    ids = np.array(sorted(batched.slots))
+    a = np.array([batched.slots[i] for i in ids.tolist()])
+    b = np.array([sequential.slots[i] for i in ids.tolist()])
+    np.testing.assert_array_equal(batched.seen[a], sequential.seen[b])
+    np.testing.assert_array_equal(batched.lags[a], sequential.lags[b])
+    np.testing.assert_allclose(
+        batched.theta[a], sequential.theta[b], rtol=1e-6, atol=1e-9
+    )
+    np.testing.assert_allclose(
+        batched.covariance[a], sequential.covariance[b], rtol=1e-6, atol=1e-9
+    )
+    np.testing.assert_allclose(
+        batched.forecast(ids, horizon=3), sequential.forecast(ids, horizon=3)
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("batch_size", [2, 25, 400])
+def test_batch_fit_matches_sequential_updates(seed, batch_size):
+    sensor_ids, values, timestamps = signals(400, seed)
+    batched, sequential = ARModels(order=3), ARModels(order=3)
+    for i in range(len(values)):
+        sequential.update(
+            sensor_ids[i : i + 1], values[i : i + 1], timestamps[i : i + 1]
+        )
+    for start in range(0, len(values), batch_size):
+        part = slice(start, start + batch_size)
+        # Order within a batch does not matter, timestamps do
+        order = np.random.default_rng(start).permutation(len(values[part]))
+        batched.update(
+            sensor_ids[part][order], values[part][order], timestamps[part][order]
+        )
+
+    assert_same_models(batched, sequential)
+
+
+def test_old_samples_are_ignored():
+    models = ARModels(order=2)
+    ids = np.array([1, 1, 1, 1])
+    models.update(ids, np.array([1.0, 2.0, 3.0, 4.0]), np.arange(4.0))
+    before = models.theta.copy(), models.lags.copy()
+    models.update(ids[:2], np.array([9.0, 9.0]), np.array([1.0, 3.0]))
+    np.testing.assert_array_equal(models.theta, before[0])
+    np.testing.assert_array_equal(models.lags, before[1])
+
+
+def test_slots_grow_past_capacity():
+    models = ARModels(order=2, capacity=2)
+    sensor_ids = np.arange(10, 15)
+    models.update(sensor_ids, np.ones(5), np.zeros(5))
+    assert models.capacity >= 5
+    assert sorted(models.slots) == sensor_ids.tolist()
+    assert models.forecast(np.array([10, 99])).shape == (2, 1)
@@ -0,0 +1,74 @@
+import asyncio
+
+import numpy as np
+from src.forecast import ARModels
+from src.store import _HEADER, _MAGIC, ModelStore
+
+
+def samples(sensor_ids: list[int], count: int, start: float, seed: int):
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(sensor_ids, count)
+    values = rng.normal(0, 1, len(ids))
+    timestamps = np.tile(start + np.arange(count, dtype=np.float64), len(sensor_ids))
+    return ids, values, timestamps
+
+
+def test_evicted_models_come_back_unchanged(tmp_path):
+    asyncio.run(_evicted_models_come_back_unchanged(tmp_path))
+
+
+async def _evicted_models_come_back_unchanged(tmp_path):
+    store = ModelStore(directory=str(tmp_path), max_resident=2, order=2)
+    reference = ARModels(order=2)
+    ids = np.array([1, 2, 3])
+    # Three sensors through two slots, twice: every round evicts
+    for round_ in range(2):
+        for sensor_id in ids.tolist():
+            batch = samples([sensor_id], 20, 20.0 * round_, seed=sensor_id + round_)
+            await store.update(*batch)
+            reference.update(*batch)
+
+    assert len(store._lru) == 2
+    assert store.stats.evictions >= 4
+    np.testing.assert_allclose(
+        await store.forecast(ids, horizon=2), reference.forecast(ids, horizon=2)
+    )
+
+    # A batch with more sensors than slots is processed in groups
+    batch = samples([1, 2, 3], 5, 100.0, seed=9)
+    await store.update(*batch)
+    reference.update(*batch)
+    np.testing.assert_allclose(await store.forecast(ids), reference.forecast(ids))
+
+
+def test_checkpoint_round_trip(tmp_path):
+    asyncio.run(_checkpoint_round_trip(tmp_path))
+
+
+async def _checkpoint_round_trip(tmp_path):
+    store = ModelStore(directory=str(tmp_path), max_resident=4, order=2)
+    ids = np.array([7, 300])
+    await store.update(*samples(ids.tolist(), 30, 0.0, seed=1))
+    expected = await store.forecast(ids, horizon=3)
+    await store.checkpoint()
+    assert store.stats.written == 2
+    assert (tmp_path / "07" / "7.bin").exists()
+    assert (tmp_path / "2c" / "300.bin").exists()
+
+    restored = ModelStore(directory=str(tmp_path), max_resident=4, order=2)
+    np.testing.assert_array_equal(await restored.forecast(ids, horizon=3), expected)
+    assert restored.stats.disk_loads == 2
+    assert restored.models.mean_error(7) == store.models.mean_error(7)
+
+    # Snapshots of another AR order are not loaded
+    other = ModelStore(directory=str(tmp_path), max_resident=4, order=3)
+    assert np.isnan(await other.forecast(ids)).all()
+    assert other.stats.disk_loads == 0
+
+
+def test_incompatible_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "05" / "5.bin"
+    path.parent.mkdir()
+    path.write_bytes(_HEADER.pack(_MAGIC, 2) + np.zeros(3).tobytes())
+    store = ModelStore(directory=str(tmp_path), max_resident=4, order=2)
+    assert store._read(5) is None
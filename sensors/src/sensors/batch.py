@@ -0,0 +1,216 @@
+import struct
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from sensors.data import SensorData
+
+# Columnar counterpart of a list of SensorData: one array per field, the
+# (fingerprint, mcu_name, sensor_name) triples interned into a small series
+# table that samples refer to by index.
+#
+# Wire format, little endian. Every array starts on an 8 byte boundary, so a
+# received buffer is read in place with np.frombuffer, without a copy:
+#   header      magic "SBT1", u32 series, u64 samples, u64 names size
+#   names       "fingerprint\0mcu_name\0sensor_name\0" per series, utf-8
+#   ids         u32[samples], index into the series table
+#   values      f64[samples]
+#   timestamps  f64[samples], epoch seconds
+
+CONTENT_TYPE = "application/x-sensor-batch"
+
+Series = tuple[str, str, str]
+
+_MAGIC = b"SBT1"
+_HEADER = struct.Struct("<4sIQQ")
+_ID = np.dtype("<u4")
+_FLOAT = np.dtype("<f8")
+
+
+def _padded(size: int) -> int:
+    return size + (-size % 8)
+
+
+@dataclass
+class SensorBatch:
+    series: list[Series]
+    ids: np.ndarray
+    values: np.ndarray
+    timestamps: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def empty(cls) -> "SensorBatch":
+        return cls([], np.empty(0, _ID), np.empty(0, _FLOAT), np.empty(0, _FLOAT))
+
+    @classmethod
+    def from_records(cls, records: Sequence[dict]) -> "SensorBatch":
+        # Records shaped like SensorData, as the collector queues them
+        index: dict[Series, int] = {}
+        ids = np.fromiter(
+            (
+                index.setdefault(
+                    (r["fingerprint"], r["mcu_name"], r["sensor_name"]), len(index)
+                )
+                for r in records
+            ),
+            _ID,
+            len(records),
+        )
+        values = np.fromiter((r["value"] for r in records), _FLOAT, len(records))
+        timestamps = np.fromiter(
+            (r["timestamp"] for r in records), _FLOAT, len(records)
+        )
+        return cls(list(index), ids, values, timestamps)
+
+    @classmethod
+    def from_data(cls, records: Sequence[SensorData]) -> "SensorBatch":
+        index: dict[Series, int] = {}
+        ids = np.fromiter(
+            (
+                index.setdefault((r.fingerprint, r.mcu_name, r.sensor_name), len(index))
+                for r in records
+            ),
+            _ID,
+            len(records),
+        )
+        values = np.fromiter((r.value for r in records), _FLOAT, len(records))
+        timestamps = np.fromiter((r.timestamp for r in records), _FLOAT, len(records))
+        return cls(list(index), ids, values, timestamps)
+
+    @classmethod
+    def concat(cls, batches: Iterable["SensorBatch"]) -> "SensorBatch":
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        index: dict[Series, int] = {}
+        ids = []
+        for batch in batches:
+            remap = np.fromiter(
+                (index.setdefault(s, len(index)) for s in batch.series),
+                _ID,
+                len(batch.series),
+            )
+            ids.append(remap[batch.ids])
+        return cls(
+            list(index),
+            np.concatenate(ids),
+            np.concatenate([batch.values for batch in batches]),
+            np.concatenate([batch.timestamps for batch in batches]),
+        )
+
+    def to_records(self) -> list[dict]:
+        series = self.series
+        return [
+            {
+                "fingerprint": series[i][0],
+                "mcu_name": series[i][1],
+                "sensor_name": series[i][2],
+                "value": value,
+                "timestamp": timestamp,
+            }
+            for i, value, timestamp in zip(
+                self.ids.tolist(), self.values.tolist(), self.timestamps.tolist()
+            )
+        ]
+
+    def to_bytes(self) -> bytes:
+        names = "".join(f"{f}\0{m}\0{s}\0" for f, m, s in self.series).encode()
+        count = len(self)
+        names_end = _HEADER.size + _padded(len(names))
+        ids_end = names_end + _padded(count * _ID.itemsize)
+        values_end = ids_end + count * _FLOAT.itemsize
+        buffer = bytearray(values_end + count * _FLOAT.itemsize)
+        _HEADER.pack_into(buffer, 0, _MAGIC, len(self.series), count, len(names))
+        buffer[_HEADER.size : _HEADER.size + len(names)] = names
+        np.frombuffer(buffer, _ID, count, names_end)[:] = self.ids
+        np.frombuffer(buffer, _FLOAT, count, ids_end)[:] = self.values
+        np.frombuffer(buffer, _FLOAT, count, values_end)[:] = self.timestamps
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes) -> "SensorBatch":
+        # The arrays are read-only views into buffer
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Truncated sensor batch")
+        magic, series_count, count, names_size = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("Not a sensor batch")
+        names_end = _HEADER.size + _padded(names_size)
+        ids_end = names_end + _padded(count * _ID.itemsize)
+        values_end = ids_end + count * _FLOAT.itemsize
+        if len(buffer) != values_end + count * _FLOAT.itemsize:
+            raise ValueError("Sensor batch size does not match its header")
+
+        names = bytes(buffer[_HEADER.size : _HEADER.size + names_size])
+        parts = names.decode().split("\0")
+        if len(parts) != 3 * series_count + 1 or parts[-1]:
+            raise ValueError("Malformed sensor batch names")
+        series = list(zip(parts[0:-1:3], parts[1:-1:3], parts[2:-1:3]))
+
+        ids = np.frombuffer(buffer, _ID, count, names_end)
+        if count and int(ids.max()) >= series_count:
+            raise ValueError("Sensor batch refers to an unknown series")
+        return cls(
+            series,
+            ids,
+            np.frombuffer(buffer, _FLOAT, count, ids_end),
+            np.frombuffer(buffer, _FLOAT, count, values_end),
+        )
+
+
+class SensorBatchBuilder:
+    # Appends samples into preallocated columns, names are interned as they
+    # arrive. build() hands the columns over and starts a new batch.
+    def __init__(self, capacity: int = 1024):
+        self._capacity = capacity
+        self._reset()
+
+    def _reset(self):
+        self._index: dict[Series, int] = {}
+        self._ids = np.empty(self._capacity, _ID)
+        self._values = np.empty(self._capacity, _FLOAT)
+        self._timestamps = np.empty(self._capacity, _FLOAT)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _grow(self, needed: int):
+        capacity = max(needed, 2 * len(self._ids))
+        for name in ("_ids", "_values", "_timestamps"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, column.dtype)
+            grown[: self._size] = column[: self._size]
+            setattr(self, name, grown)
+
+    def append(
+        self,
+        fingerprint: str,
+        mcu_name: str,
+        sensor_name: str,
+        value: float,
+        timestamp: float,
+    ):
+        i = self._size
+        if i == len(self._ids):
+            self._grow(i + 1)
+        key = (fingerprint, mcu_name, sensor_name)
+        self._ids[i] = self._index.setdefault(key, len(self._index))
+        self._values[i] = value
+        self._timestamps[i] = timestamp
+        self._size = i + 1
+
+    def build(self) -> SensorBatch:
+        size = self._size
+        batch = SensorBatch(
+            list(self._index),
+            self._ids[:size],
+            self._values[:size],
+            self._timestamps[:size],
+        )
+        self._reset()
+        return batch
@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable, Sequence
+from typing import Optional
+
+# Minimal Prometheus text-format metrics, shared by core and the collector.
+# Updates are plain attribute writes on preallocated objects: no locks, no
+# allocation on the hot path. Labelled children should be looked up once and
+# kept by the caller.
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1_000, 5_000, 10_000, 50_000, 100_000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Sequence[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            metric.render(lines)
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def render(self, name: str, pairs, lines: list[str]):
+        lines.append(f"{name}{_labels(pairs)} {_number(self.value)}")
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ("function",)
+
+    def __init__(self):
+        super().__init__()
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        self.function = function
+
+    def render(self, name: str, pairs, lines: list[str]):
+        value = self.function() if self.function is not None else self.value
+        lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, pairs, lines: list[str]):
+        total = 0
+        for bound, count in zip((*self.bounds, float("inf")), self.counts):
+            total += count
+            le = (*pairs, ("le", _number(bound)))
+            lines.append(f"{name}_bucket{_labels(le)} {total}")
+        lines.append(f"{name}_sum{_labels(pairs)} {_number(self.sum)}")
+        lines.append(f"{name}_count{_labels(pairs)} {total}")
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._child()
+        registry.register(self)
+
+    @abstractmethod
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(values, self._child())
+        return child
+
+    def remove(self, *values: str):
+        # Drops a child, e.g. of a client that is gone, so it stops being
+        # exported. Callers holding it keep a detached object.
+        self._children.pop(values, None)
+
+    def render(self, lines: list[str]):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self._children.items()):
+            child.render(self.name, tuple(zip(self.labelnames, values)), lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self._default.value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        self._default.function = function
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: tuple = LATENCY_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def state(self) -> dict[tuple, tuple[list[int], float]]:
+        # Bucket counts and sum by label values, e.g. to send to the process
+        # that exports them
+        return {
+            values: (list(child.counts), child.sum)
+            for values, child in self._children.items()
+        }
+
+    def load(self, states: dict[tuple, tuple[list[int], float]]):
+        # Replaces the children with states gathered from other processes.
+        # Children that are kept are updated in place.
+        if self.labelnames:
+            for values in self._children.keys() - states.keys():
+                del self._children[values]
+        for values, (counts, total) in states.items():
+            child = self.labels(*values)
+            child.counts[:] = counts
+            child.sum = total
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sensors.batch import SensorBatch, SensorBatchBuilder
+from sensors.data import SensorData
+
+
+def make_batch(count: int) -> SensorBatch:
+    rng = np.random.default_rng(count)
+    builder = SensorBatchBuilder(capacity=4)
+    for i in range(count):
+        # Names of odd lengths move the arrays behind them to padded offsets
+        builder.append(
+            f"fp-{i % 3}", "mcü" * (i % 2 + 1), f"s{i % 5}", rng.normal(), 1e9 + i
+        )
+    return builder.build()
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 1000])
+def test_bytes_round_trip(count):
+    batch = make_batch(count)
+    decoded = SensorBatch.from_bytes(batch.to_bytes())
+
+    assert decoded.series == batch.series
+    np.testing.assert_array_equal(decoded.ids, batch.ids)
+    np.testing.assert_array_equal(decoded.values, batch.values)
+    np.testing.assert_array_equal(decoded.timestamps, batch.timestamps)
+    assert decoded.to_records() == batch.to_records()
+
+
+def test_from_bytes_reads_in_place():
+    data = bytearray(make_batch(10).to_bytes())
+    decoded = SensorBatch.from_bytes(data)
+    assert not decoded.values.flags.owndata
+    assert decoded.values.ctypes.data % 8 == 0
+
+
+def test_records_round_trip():
+    records = [
+        SensorData(
+            fingerprint="fp", mcu_name="m", sensor_name=name, value=i, timestamp=i
+        )
+        for i, name in enumerate(["a", "b", "a"])
+    ]
+    batch = SensorBatch.from_data(records)
+    assert batch.series == [("fp", "m", "a"), ("fp", "m", "b")]
+    assert batch.ids.tolist() == [0, 1, 0]
+    assert SensorBatch.from_records(batch.to_records()).to_records() == (
+        batch.to_records()
+    )
+
+
+def test_concat_remaps_series():
+    first, second = make_batch(3), make_batch(5)
+    merged = SensorBatch.concat([first, SensorBatch.empty(), second])
+    assert merged.to_records() == first.to_records() + second.to_records()
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda data: data[:10],
+        lambda data: b"XXXX" + data[4:],
+        lambda data: data + b"\0" * 8,
+        lambda data: data[:24] + data[24:].replace(b"fp-0\0", b"fp-0x"),
+    ],
+)
+def test_from_bytes_rejects_malformed(damage):
+    with pytest.raises(ValueError):
+        SensorBatch.from_bytes(damage(make_batch(4).to_bytes()))